@@ -0,0 +1,11 @@
+# coding: utf-8
+"""
+Benchmarks
+==========
+
+Run from the repository root, e.g.::
+
+    $ python -m benchmarks.startup
+    $ python -m benchmarks.storage
+    $ python -m benchmarks.reporting
+"""
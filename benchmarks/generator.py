@@ -0,0 +1,204 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Generator
+=========
+
+Writes a synthetic but realistic diary: every day has a night of sleep and
+a sequence of activities with gaps between them, some tagged, some with
+descriptions.  The same arguments always produce the same files::
+
+    $ python -m benchmarks.generator /tmp/diary --years 3 --facts-per-day 15
+
+or::
+
+    generate(data_dir, days=365, facts_per_day=12, tag_density=0.5)
+"""
+import argparse
+import datetime
+import os
+import random
+
+import yaml
+
+from timetra.diary.emitter import emit_facts
+
+
+__all__ = ['generate', 'ACTIVITIES']
+
+
+ACTIVITIES = (
+    # (category, activity, relative frequency)
+    ('body', 'eat', 5),
+    ('body', 'shower', 2),
+    ('body', 'walk', 2),
+    ('body', 'nap', 1),
+    ('work', 'code', 8),
+    ('work', 'meeting', 3),
+    ('work', 'review', 3),
+    ('work', 'mail', 3),
+    ('home', 'cook', 2),
+    ('home', 'clean', 1),
+    ('home', 'shop', 1),
+    ('self', 'read', 3),
+    ('self', 'study', 2),
+    ('self', 'music', 1),
+    ('social', 'call', 2),
+    ('social', 'party', 1),
+    ('fun', 'movie', 1),
+    ('fun', 'game', 1),
+    ('transport', 'commute', 3),
+)
+
+TAGS = ('project-a', 'project-b', 'project-c', 'project-d', 'project-e',
+        'urgent', 'idea', 'outdoors', 'tired', 'focus', 'planned',
+        'unplanned', 'remote', 'office', 'phone')
+PEOPLE = ('with:anna', 'with:boris', 'with:chen', 'with:dora', 'with:emil')
+
+WORDS = ('the of and to in is was for on that with as it by at from this '
+         'about plan list done fix bug idea notes book chapter review call '
+         'mail draft report test build release meeting lunch dinner walk '
+         'park city home office train bus rain sun coffee tea friend').split()
+
+DAY_START = 7 * 60      # minutes since midnight
+DAY_END = 23 * 60
+
+
+def _make_description(rnd, length):
+    words = []
+    size = -1
+    while size < length:
+        word = rnd.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    text = ' '.join(words).capitalize()
+    # long notes are written as multi-line blocks
+    if 200 < length:
+        lines = [text[i:i + 70] for i in range(0, len(text), 70)]
+        text = '\n'.join(x.strip() for x in lines) + '\n'
+    return text
+
+
+def _make_fact(rnd, since, until, category, activity, tag_density,
+               description_length):
+    fact = {'category': category, 'activity': activity,
+            'since': since, 'until': until, 'description': None}
+    tags = []
+    while rnd.random() < tag_density and len(tags) < 4:
+        tag = rnd.choice(PEOPLE if activity in ('call', 'party', 'eat')
+                         and not tags else TAGS)
+        if tag not in tags:
+            tags.append(tag)
+    if tags:
+        fact['tags'] = tags
+    if description_length and rnd.random() < 0.6:
+        length = max(1, int(rnd.expovariate(1. / description_length)))
+        fact['description'] = _make_description(rnd, length)
+    return fact
+
+
+def generate_day(rnd, date, facts_per_day=12, tag_density=0.5,
+                 description_length=60):
+    "Returns a list of facts (dictionaries) started on given date."
+    population = [(x[0], x[1]) for x in ACTIVITIES]
+    weights = [x[2] for x in ACTIVITIES]
+    midnight = datetime.datetime.combine(date, datetime.time(0))
+    count = max(0, facts_per_day - 1)
+    facts = []
+    if count:
+        slot = (DAY_END - DAY_START) / count
+        for i in range(count):
+            start = DAY_START + i * slot + rnd.uniform(0, slot * 0.3)
+            end = start + rnd.uniform(slot * 0.4, slot * 0.7)
+            category, activity = rnd.choices(population, weights)[0]
+            facts.append(_make_fact(
+                rnd, midnight + datetime.timedelta(minutes=int(start)),
+                midnight + datetime.timedelta(minutes=int(end)),
+                category, activity, tag_density, description_length))
+    if facts_per_day:
+        # the night: from about 23:00 to about 7:00 next morning
+        start = DAY_END + rnd.randint(-45, 55)
+        end = 24 * 60 + DAY_START + rnd.randint(-60, 60)
+        facts.append(_make_fact(
+            rnd, midnight + datetime.timedelta(minutes=start),
+            midnight + datetime.timedelta(minutes=end),
+            'body', 'sleep', tag_density / 4, 0))
+    return facts
+
+
+def generate(data_dir, days=365, facts_per_day=12, tag_density=0.5,
+             description_length=60, end=datetime.date(2014, 12, 31),
+             seed=0):
+    """
+    Writes day files for `days` days ending with `end` into `data_dir`
+    (the layout of :class:`~timetra.diary.storage.YamlBackend`).  Returns
+    the number of facts.
+
+    :param facts_per_day: including the night's sleep.
+    :param tag_density: the probability of a fact having a tag, and of
+        each next tag.
+    :param description_length: the mean length of descriptions (in
+        characters); `0` for none.
+    """
+    rnd = random.Random(seed)
+    total = 0
+    for offset in range(days - 1, -1, -1):
+        date = end - datetime.timedelta(days=offset)
+        facts = generate_day(rnd, date, facts_per_day, tag_density,
+                             description_length)
+        month_dir = os.path.join(data_dir, str(date.year),
+                                 '{:0>2}'.format(date.month))
+        if not os.path.exists(month_dir):
+            os.makedirs(month_dir)
+        text = emit_facts(facts)
+        if text is None:
+            text = yaml.dump(facts, allow_unicode=True,
+                             default_flow_style=False)
+        path = os.path.join(month_dir, '{:0>2}.yaml'.format(date.day))
+        with open(path, 'w') as f:
+            f.write(text)
+        total += len(facts)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Writes a synthetic diary.')
+    parser.add_argument('data_dir')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--years', type=float,
+                        help='same as --days 365*YEARS')
+    parser.add_argument('--facts-per-day', type=int, default=12)
+    parser.add_argument('--tag-density', type=float, default=0.5)
+    parser.add_argument('--description-length', type=int, default=60)
+    parser.add_argument('--end', type=datetime.date.fromisoformat,
+                        default=datetime.date(2014, 12, 31))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    days = int(args.years * 365) if args.years else args.days
+    count = generate(args.data_dir, days, args.facts_per_day,
+                     args.tag_density, args.description_length, args.end,
+                     args.seed)
+    print('{0} facts in {1} days written to {2}'.format(
+        count, days, args.data_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Reporting benchmarks
+====================
+
+Times the drift, weekly and predict reports on generated diaries (see
+:mod:`benchmarks.generator`) ending today, one per span; each report covers
+the whole diary::
+
+    $ python -m benchmarks.reporting
+    $ python -m benchmarks.reporting --spans 7,90 -k drift
+
+Data collection and table rendering are separate cases:
+
+* ``<report>/collect/<days>/disk``: a new backend with the day files already
+  in the cache directory (e.g. the next invocation of the CLI);
+* ``<report>/collect/<days>/warm``: the same backend again (e.g. the daemon);
+* ``<report>/render/<days>``: the table for data collected beforehand.
+
+Loading of the day files is measured by :mod:`benchmarks.storage`.
+"""
+from contextlib import contextmanager
+import datetime
+import math
+import shutil
+import tempfile
+
+from timetra.diary.reporting import drift, prediction
+from timetra.diary.storage import Storage, YamlBackend
+
+from . import generator, runner
+
+
+__all__ = ['REPORTS', 'make_cases', 'main']
+
+
+ACTIVITY = 'sleep'
+
+SPANS = (7, 90, 365, 3650)
+
+REPORTS = (
+    # (name, collect(storage, days), render(data))
+    ('drift',
+     lambda storage, days: drift.collect_drift_data(storage, ACTIVITY, days),
+     drift.render_drift),
+    ('weekly',
+     lambda storage, days: drift.collect_weekly_averages(
+         storage, ACTIVITY, int(math.ceil(days / 7.))),
+     drift.render_weekly_averages),
+    ('predict',
+     lambda storage, days: prediction.predict_next_occurence(storage,
+                                                             ACTIVITY),
+     prediction.render_prediction),
+)
+
+
+def _parse_spans(value):
+    return [int(x) for x in value.split(',')]
+
+
+def add_arguments(parser):
+    parser.add_argument('--spans', type=_parse_spans, default=list(SPANS),
+                        help='comma-separated numbers of days '
+                             '(default: {0})'.format(
+                                 ','.join(str(x) for x in SPANS)))
+    parser.add_argument('--facts-per-day', type=int, default=12)
+    parser.add_argument('--tag-density', type=float, default=0.5)
+    parser.add_argument('--description-length', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+class Diary(object):
+    "A generated diary ending today with a pre-populated disk cache."
+
+    def __init__(self, root, days, args):
+        self.root = root
+        self.days = days
+        self.data_dir = root + '/data'
+        self.facts = generator.generate(
+            self.data_dir, days=days, facts_per_day=args.facts_per_day,
+            tag_density=args.tag_density,
+            description_length=args.description_length,
+            end=datetime.date.today(), seed=args.seed)
+        # the cache directory of `disk` cases
+        self.disk_cache_dir = tempfile.mkdtemp(dir=root)
+        storage = self.open(self.disk_cache_dir)
+        self._load(storage)
+        # a cache is only stored by one backend at a time
+        storage.backend.cache.close()
+        self.warm = self.open(tempfile.mkdtemp(dir=root))
+        self._load(self.warm)
+
+    def _load(self, storage):
+        list(storage.find())
+        storage.get_rollups('day', activity=ACTIVITY)
+
+    def open(self, cache_dir):
+        return Storage(YamlBackend(self.data_dir, cache_dir=cache_dir))
+
+    def disk(self):
+        return self.open(self.disk_cache_dir)
+
+    def close(self):
+        self.warm.backend.cache.close()
+
+
+def make_report_cases(diaries):
+    cases = []
+    for name, collect, render in REPORTS:
+        for diary in diaries:
+            prefix = '{0}/{{0}}/{1}'.format(name, diary.days)
+            data = collect(diary.warm, diary.days)
+            run = lambda s, collect=collect, days=diary.days: collect(s, days)
+            cases.extend([
+                runner.Case(prefix.format('collect') + '/disk', run,
+                            setup=diary.disk,
+                            teardown=lambda s: s.backend.cache.close()),
+                runner.Case(prefix.format('collect') + '/warm', run,
+                            setup=lambda diary=diary: diary.warm),
+                runner.Case(prefix.format('render'), render,
+                            setup=lambda data=data: data),
+            ])
+    return cases
+
+
+@contextmanager
+def make_cases(args):
+    root = tempfile.mkdtemp()
+    diaries = []
+    try:
+        for days in args.spans:
+            diary = Diary(tempfile.mkdtemp(dir=root), days, args)
+            diaries.append(diary)
+            print('{0} facts in {1} days'.format(diary.facts, days))
+        print()
+        yield make_report_cases(diaries)
+    finally:
+        for diary in diaries:
+            diary.close()
+        shutil.rmtree(root)
+
+
+def main(argv=None):
+    return runner.main('reporting', make_cases, add_arguments, argv,
+                       description='Reporting benchmarks.')
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,210 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Runner
+======
+
+Times benchmark cases, writes the results as JSON and compares them with a
+baseline (results of an earlier run).  Used by the benchmark suites::
+
+    $ python -m benchmarks.storage --save-baseline
+    ... change the code ...
+    $ python -m benchmarks.storage
+
+A baseline is only meaningful on the machine where it was recorded, so
+baselines are kept in ``benchmarks/baselines/`` and not committed.  A case
+is reported as a regression if its median time grows by more than the
+tolerance; the exit code is then 1.
+"""
+import argparse
+from collections import OrderedDict
+import datetime
+import json
+import os
+import platform
+import statistics
+import time
+
+
+__all__ = ['Case', 'run_cases', 'compare', 'main']
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+TOLERANCE = 0.25
+""" Relative growth of the median time which counts as a regression.
+"""
+
+MIN_DIFFERENCE = 0.0005
+""" Differences below this (in seconds) are noise, not regressions.
+"""
+
+
+class Case(object):
+    """
+    A benchmark case: `func(state)` is timed; `setup()` returns the state
+    and `teardown(state)` cleans up (neither is timed).
+    """
+
+    def __init__(self, name, func, setup=None, teardown=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.teardown = teardown
+
+    def run(self, repeat):
+        "Returns the list of timings (in seconds)."
+        timings = []
+        for _ in range(repeat):
+            state = self.setup() if self.setup else None
+            try:
+                started = time.perf_counter()
+                self.func(state)
+                timings.append(time.perf_counter() - started)
+            finally:
+                if self.teardown:
+                    self.teardown(state)
+        return timings
+
+
+def summarize(timings):
+    return OrderedDict([
+        ('median', statistics.median(timings)),
+        ('min', min(timings)),
+        ('max', max(timings)),
+        ('runs', len(timings)),
+    ])
+
+
+def run_cases(cases, repeat=5, select=None, report=None):
+    """
+    Runs the cases whose names contain `select` (all by default).  Returns
+    an ordered `{name: summary}` dictionary.  `report(name, summary)` is
+    called after each case.
+    """
+    results = OrderedDict()
+    for case in cases:
+        if select and select not in case.name:
+            continue
+        results[case.name] = summarize(case.run(repeat))
+        if report:
+            report(case.name, results[case.name])
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Returns a list of `(name, ratio, regressed)` for cases present in both
+    results and the baseline (`results` dictionaries as in the JSON files).
+    """
+    rows = []
+    for name, summary in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        ratio = summary['median'] / previous['median'] if previous[
+            'median'] else float('inf')
+        regressed = (1 + tolerance < ratio and
+                     MIN_DIFFERENCE < summary['median'] - previous['median'])
+        rows.append((name, ratio, regressed))
+    return rows
+
+
+def _format_seconds(seconds):
+    if seconds < 0.001:
+        return '{0:.1f} µs'.format(seconds * 1e6)
+    if seconds < 1:
+        return '{0:.2f} ms'.format(seconds * 1e3)
+    return '{0:.2f} s'.format(seconds)
+
+
+def _print_summary(name, summary):
+    print('{0:<40} {1:>12}  (min {2}, {3} runs)'.format(
+        name, _format_seconds(summary['median']),
+        _format_seconds(summary['min']), summary['runs']))
+
+
+def main(suite, make_cases, add_arguments=None, argv=None, description=None):
+    """
+    Command-line interface of a suite.  `make_cases(args)` is a context
+    manager yielding the cases (it prepares and removes the data);
+    `add_arguments(parser)` adds suite parameters, which are recorded in
+    the results and must match those of the baseline.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-k', '--select',
+                        help='only run cases whose names contain this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', help='write results to this file')
+    parser.add_argument('--baseline', help='compare with these results '
+                        '(default: benchmarks/baselines/{0}.json)'.format(
+                            suite))
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the default baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    common = set(x.dest for x in parser._actions)
+    if add_arguments:
+        add_arguments(parser)
+    args = parser.parse_args(argv)
+    params = OrderedDict((k, v) for k, v in sorted(vars(args).items())
+                         if k not in common)
+    params = json.loads(json.dumps(params, default=str))
+
+    with make_cases(args) as cases:
+        results = run_cases(cases, args.repeat, args.select, _print_summary)
+
+    document = OrderedDict([
+        ('suite', suite),
+        ('created', datetime.datetime.now().isoformat()),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('params', params),
+        ('results', results),
+    ])
+    default_baseline = os.path.join(BASELINE_DIR, suite + '.json')
+    paths = [args.output] if args.output else []
+    if args.save_baseline:
+        if not os.path.exists(BASELINE_DIR):
+            os.makedirs(BASELINE_DIR)
+        paths.append(default_baseline)
+    for path in paths:
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    baseline_path = args.baseline
+    if not baseline_path and not args.save_baseline and os.path.exists(
+            default_baseline):
+        baseline_path = default_baseline
+    if not baseline_path:
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get('params') != params:
+        print('\nthe baseline was recorded with other parameters: {0}'.format(
+            baseline.get('params')))
+        return 0
+    rows = compare(results, baseline['results'], args.tolerance)
+    print('\ncompared with {0} ({1}):'.format(baseline_path,
+                                              baseline.get('created')))
+    for name, ratio, regressed in rows:
+        print('{0:<40} {1:>7.2f}x  {2}'.format(
+            name, ratio, 'REGRESSION' if regressed else ''))
+    return 1 if any(x[2] for x in rows) else 0
@@ -0,0 +1,163 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Startup
+=======
+
+Measures what the command-line entry point imports before a command runs,
+using ``python -X importtime`` in fresh processes, and fails (exit code 1)
+if a scenario exceeds its time budget or imports a module it must not::
+
+    $ python -m benchmarks.startup
+    $ python -m benchmarks.startup --runs 20 --scale 2
+
+Times are the median total of imports made by the scenario (modules
+imported by the interpreter itself, e.g. `site`, are not counted).
+"""
+import argparse
+from collections import OrderedDict
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+__all__ = ['SCENARIOS', 'measure', 'parse_importtime']
+
+
+LOAD_COMMANDS = '''
+import sys
+from timetra.diary import app, storage
+s = storage.Storage(storage.YamlBackend(sys.argv[1]))
+app._get_command_loaders(s, lambda: s)[{namespace!r}]()
+'''
+
+HEAVY = ('urwid', 'terminaltables', 'colorclass', 'dateutil', 'numpy',
+         'multiprocessing', 'ctypes')
+
+SCENARIOS = OrderedDict([
+    # every invocation
+    ('client', {
+        'code': 'import timetra.diary.client',
+        'budget': 15,
+        'forbidden': ('yaml', 'argh', 'monk', 'timetra.diary.storage'),
+    }),
+    # e.g. `timetra-diary today`
+    ('diary', {
+        'code': LOAD_COMMANDS.format(namespace=None),
+        'budget': 100,
+        'forbidden': HEAVY + ('timetra.diary.reporting',
+                              'timetra.diary.timer', 'timetra.diary.curses'),
+    }),
+    # e.g. `timetra-diary report drift`
+    ('report', {
+        'code': LOAD_COMMANDS.format(namespace='report'),
+        'budget': 130,
+        'forbidden': ('urwid', 'multiprocessing', 'timetra.diary.diary',
+                      'timetra.diary.timer', 'timetra.diary.curses'),
+    }),
+])
+""" `{name: {'code': ..., 'budget': milliseconds, 'forbidden': modules}}`.
+Budgets leave room for slower machines; the forbidden modules catch the
+usual regression (a heavy import creeping into a common path) exactly.
+"""
+
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(output):
+    """
+    Returns a list of `(name, self_us, cumulative_us, level)` tuples from
+    the output of ``python -X importtime``.  Level 0 is an import made by
+    the code itself; deeper levels are imports made by imported modules.
+    """
+    entries = []
+    for line in output.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            entries.append((name, int(own), int(cumulative),
+                            (len(indent) - 1) // 2))
+    return entries
+
+
+def _run(code, *args):
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code]
+                             + list(args), stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    if process.returncode:
+        raise RuntimeError('scenario failed:\n' + process.stderr)
+    return parse_importtime(process.stderr)
+
+
+def measure(code, runs=5, data_dir=None):
+    """
+    Runs `code` in `runs` fresh processes.  Returns `(milliseconds, modules)`:
+    the median time spent in imports made by the code, and the set of names
+    of modules it imported.
+    """
+    args = [data_dir] if data_dir else []
+    # imported by the interpreter before the code runs
+    startup = set(x[0] for x in _run('pass'))
+    totals = []
+    modules = set()
+    for _ in range(runs):
+        entries = [x for x in _run(code, *args) if x[0] not in startup]
+        totals.append(sum(x[2] for x in entries if x[3] == 0) / 1000.)
+        modules.update(x[0] for x in entries)
+    return statistics.median(totals), modules
+
+
+def _imported(modules, name):
+    return any(x == name or x.startswith(name + '.') for x in modules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS),
+                        help='any of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1,
+                        help='multiply the budgets (e.g. for slow machines)')
+    args = parser.parse_args(argv)
+
+    failed = False
+    data_dir = tempfile.mkdtemp()
+    for name in args.scenarios:
+        scenario = SCENARIOS[name]
+        budget = scenario['budget'] * args.scale
+        took, modules = measure(scenario['code'], args.runs, data_dir)
+        forbidden = [x for x in scenario['forbidden']
+                     if _imported(modules, x)]
+        ok = took <= budget and not forbidden
+        failed = failed or not ok
+        print('{0:<8} {1:7.1f} ms  (budget {2:.0f} ms)  {3}'.format(
+            name, took, budget, 'ok' if ok else 'FAIL'))
+        for module in forbidden:
+            print('         must not import {0}'.format(module))
+    os.rmdir(data_dir)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
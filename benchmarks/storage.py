@@ -0,0 +1,187 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Storage benchmarks
+==================
+
+Times the main :class:`~timetra.diary.storage.Storage` operations on a
+generated diary (see :mod:`benchmarks.generator`)::
+
+    $ python -m benchmarks.storage --years 5 --facts-per-day 12
+    $ python -m benchmarks.storage -k find --repeat 10 -o results.json
+
+Case names end with the state of the caches:
+
+* ``cold``: a new backend with an empty cache directory;
+* ``disk``: a new backend with the day files already in the cache
+  directory (e.g. the next invocation of the CLI);
+* ``warm``: the same backend again (e.g. the daemon).
+
+The files themselves are in the OS page cache in all cases.
+"""
+from contextlib import contextmanager
+import datetime
+import os
+import shutil
+import tempfile
+
+from timetra.diary.storage import Storage, YamlBackend
+
+from . import generator, runner
+
+
+__all__ = ['make_cases', 'main']
+
+
+def add_arguments(parser):
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--facts-per-day', type=int, default=12)
+    parser.add_argument('--tag-density', type=float, default=0.5)
+    parser.add_argument('--description-length', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+class Diary(object):
+    "A generated diary and the storages used by the cases."
+
+    END = datetime.date(2014, 12, 31)
+
+    def __init__(self, root, args):
+        self.root = root
+        self.data_dir = root + '/data'
+        self.days = max(1, int(args.years * 365))
+        self.facts = generator.generate(
+            self.data_dir, days=self.days,
+            facts_per_day=args.facts_per_day, tag_density=args.tag_density,
+            description_length=args.description_length, end=self.END,
+            seed=args.seed)
+        # the cache directory of `disk` cases
+        self.disk_cache_dir = tempfile.mkdtemp(dir=root)
+        storage = self.open(self.disk_cache_dir)
+        list(storage.find())
+        # a cache is only stored by one backend at a time
+        storage.backend.cache.close()
+        self.warm = self.open(tempfile.mkdtemp(dir=root))
+        list(self.warm.find())
+
+    def open(self, cache_dir):
+        return Storage(YamlBackend(self.data_dir, cache_dir=cache_dir))
+
+    def cold(self):
+        return self.open(tempfile.mkdtemp(dir=self.root))
+
+    def disk(self):
+        return self.open(self.disk_cache_dir)
+
+    def forget(self, storage):
+        "Removes the cache directory of a `cold` storage."
+        storage.backend.cache.close()
+        shutil.rmtree(os.path.dirname(storage.backend.cache.path))
+
+    def close(self):
+        self.warm.backend.cache.close()
+
+
+def make_storage_cases(diary):
+    last_day = datetime.datetime.combine(diary.END, datetime.time(0))
+    mid_day = last_day - datetime.timedelta(days=diary.days // 2)
+    window = last_day.replace(hour=12), last_day.replace(hour=13)
+    operations = [
+        ('find/all', lambda s: list(s.find())),
+        ('find/filtered', lambda s: list(s.find(activity='code,review',
+                                                 tag='urgent'))),
+        ('find/description', lambda s: list(s.find(description='bug'))),
+        ('find/last-30-days', lambda s: list(s.find(
+            since=diary.END - datetime.timedelta(days=29)))),
+        ('find/latest-10', lambda s: list(s.find(reverse=True, limit=10))),
+        ('get_latest', lambda s: s.get_latest()),
+        ('find_overlapping_facts', lambda s: list(
+            s.find_overlapping_facts(*window))),
+        ('resolve_activity', lambda s: s.resolve_activity('cod')),
+    ]
+    cases = []
+    for name, func in operations:
+        cases.extend([
+            runner.Case(name + '/cold', func, setup=diary.cold,
+                        teardown=diary.forget),
+            runner.Case(name + '/disk', func, setup=diary.disk,
+                        teardown=lambda s: s.backend.cache.close()),
+            runner.Case(name + '/warm', func, setup=lambda: diary.warm),
+        ])
+
+    # writes go to the warm storage and are undone after timing
+    counter = iter(range(10 ** 6))
+
+    def make_fact(days=0):
+        since = last_day.replace(hour=15) + datetime.timedelta(
+            days=days, seconds=next(counter))
+        return {'activity': 'bench', 'since': since,
+                'until': since + datetime.timedelta(minutes=1),
+                'description': None, 'tags': []}
+
+    def remove(fact):
+        diary.warm.delete(diary.warm.get(fact['since']))
+
+    def pick_fact():
+        fact = next(diary.warm.find(since=mid_day, until=mid_day))
+        return fact, fact.description
+
+    def update(state):
+        fact, description = state
+        diary.warm.update(fact, {'description': 'updated'})
+
+    def restore(state):
+        fact, description = state
+        updated = diary.warm.get(fact.since)
+        diary.warm.update(updated, {'description': description})
+
+    cases.extend([
+        runner.Case('add/warm', diary.warm.add, setup=make_fact,
+                    teardown=remove),
+        runner.Case('add/new-day/warm', diary.warm.add,
+                    setup=lambda: make_fact(days=1), teardown=remove),
+        runner.Case('update/warm', update, setup=pick_fact,
+                    teardown=restore),
+    ])
+    return cases
+
+
+@contextmanager
+def make_cases(args):
+    root = tempfile.mkdtemp()
+    try:
+        diary = Diary(root, args)
+        print('{0} facts in {1} days\n'.format(diary.facts, diary.days))
+        try:
+            yield make_storage_cases(diary)
+        finally:
+            diary.close()
+    finally:
+        shutil.rmtree(root)
+
+
+def main(argv=None):
+    return runner.main('storage', make_cases, add_arguments, argv,
+                       description='Storage benchmarks.')
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -50,7 +50,8 @@ setup(
 
     # technical info
     version  = __version__,
-    packages = find_packages(),
+    # `benchmarks` is a top-level package for development only
+    packages = find_packages(exclude=['benchmarks']),
     #provides = ['diary'],
     install_requires = [
         'argh>=0.22',
@@ -71,7 +72,7 @@ setup(
     zip_safe = False,
     entry_points = {
         'console_scripts': [
-            'timetra-diary=timetra.diary.app:main'
+            'timetra-diary=timetra.diary.client:main'
         ],
     },
 
@@ -0,0 +1,22 @@
+# coding: utf-8
+"""
+Helpers shared by the tests.
+"""
+# python
+from datetime import datetime
+
+# this app
+from timetra.diary.models import Fact
+
+
+def make_fact(day=1, hour=0, **kwargs):
+    """
+    Returns a fact which lasts half an hour from given hour of given day of
+    January 2014.  Other fields (and the bounds) can be given as keyword
+    arguments.
+    """
+    defaults = dict(activity='sleep', description=None, tags=[],
+                    since=datetime(2014, 1, day, hour, 0),
+                    until=datetime(2014, 1, day, hour, 30))
+    defaults.update(kwargs)
+    return Fact(**defaults)
@@ -0,0 +1,102 @@
+# coding: utf-8
+
+# python
+import asyncio
+from datetime import datetime
+import threading
+import time
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.aio import AsyncStorage
+from timetra.diary.storage import FactNotFound, Storage, YamlBackend
+from helpers import make_fact
+
+
+@pytest.fixture
+def backend(tmpdir):
+    return YamlBackend(str(tmpdir.mkdir('data')),
+                       cache_dir=str(tmpdir.mkdir('cache')))
+
+
+def test_find_and_write(backend):
+    storage = AsyncStorage(Storage(backend), batch_size=2)
+
+    async def run():
+        with pytest.raises(FactNotFound):
+            await storage.get_latest()
+        await asyncio.gather(*[
+            storage.add(make_fact(activity='sleep',
+                                  since=datetime(2014, 1, 1, x, 0),
+                                  until=datetime(2014, 1, 1, x, 30)))
+            for x in range(5)])
+        facts = [f async for f in storage.find(activity='sleep')]
+        assert [f.since.hour for f in facts] == [0, 1, 2, 3, 4]
+        facts = [f async for f in storage.find(reverse=True, limit=3)]
+        assert [f.since.hour for f in facts] == [4, 3, 2]
+
+        latest = await storage.get_latest()
+        await storage.update(latest, {'activity': 'nap'})
+        assert (await storage.get_latest()).activity == 'nap'
+        await storage.delete(await storage.get_latest())
+        assert await storage.count() == 4
+
+    asyncio.run(run())
+
+
+def test_loads_are_coalesced(backend):
+    backend.add(make_fact(since=datetime(2014, 1, 1, 8, 0),
+                          until=datetime(2014, 1, 1, 9, 0)))
+    path = backend.get_file_path_for_day(datetime(2014, 1, 1))
+    backend.cache.db.clear()
+    backend.cache._memory.clear()
+
+    loads = []
+    load_object_list = backend.cache._load_object_list
+
+    def slow_load(path, model):
+        loads.append(path)
+        time.sleep(0.2)
+        return load_object_list(path, model)
+
+    backend.cache._load_object_list = slow_load
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(backend.get_cached_day_file(path)))
+        for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == [path]
+    assert len(results) == 3
+    assert results[0] == results[1] == results[2]
+
+
+def test_find_closes_the_scan(backend):
+    for x in range(5):
+        backend.add(make_fact(since=datetime(2014, 1, 1, x, 0),
+                              until=datetime(2014, 1, 1, x, 30)))
+    scans = []
+    execute = backend.execute
+
+    def spy(*args, **kwargs):
+        scans.append(execute(*args, **kwargs))
+        return scans[-1]
+
+    backend.execute = spy
+    storage = AsyncStorage(Storage(backend), batch_size=2)
+
+    async def run():
+        facts = storage.find(limit=3, offset=1)
+        assert (await facts.__anext__()).since.hour == 1
+        await facts.aclose()
+
+    asyncio.run(run())
+    # closed explicitly, not when garbage-collected
+    [scan] = scans
+    assert scan.gi_frame is None
@@ -0,0 +1,284 @@
+# coding: utf-8
+
+# python
+import asyncio
+from datetime import datetime, timedelta
+import json
+import time
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary import api
+from timetra.diary.storage import Storage, YamlBackend
+from helpers import make_fact
+
+try:
+    from timetra.diary import reporting
+except ImportError:
+    reporting = None
+
+
+@pytest.fixture
+def storage(tmpdir):
+    storage = Storage(YamlBackend(str(tmpdir.mkdir('data')),
+                                  cache_dir=str(tmpdir.mkdir('cache'))))
+    storage.add(make_fact(1, 0))
+    storage.add(make_fact(1, 5, activity='work', tags=['x']))
+    storage.add(make_fact(2, 1))
+    return storage
+
+
+async def request(server, method, target, body=None):
+    """
+    Returns `(status, content_type, lines)`; `lines` are decoded JSON
+    objects.
+    """
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    data = b'' if body is None else json.dumps(body).encode('utf-8')
+    writer.write('{0} {1} HTTP/1.1\r\nHost: localhost\r\n'
+                 'Content-Length: {2}\r\n\r\n'.format(
+                     method, target, len(data)).encode('ascii') + data)
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(x.lower().split(': ', 1) for x in lines[1:] if x)
+    if 'content-length' in headers:
+        payload = await reader.readexactly(int(headers['content-length']))
+    else:
+        payload = b''
+        while True:
+            size = int(await reader.readline(), 16)
+            if not size:
+                break
+            payload += await reader.readexactly(size)
+            await reader.readline()
+    writer.close()
+    return (status, headers['content-type'].split(';')[0],
+            [json.loads(x) for x in payload.splitlines()])
+
+
+def run(storage, coro_func):
+    async def main():
+        server = await api.Server(storage, port=0).start()
+        try:
+            return await coro_func(server)
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+
+def test_find(storage):
+    async def check(server):
+        status, content_type, facts = await request(server, 'GET', '/facts')
+        assert (status, content_type) == (200, 'application/x-ndjson')
+        assert [x['since'] for x in facts] == [
+            '2014-01-01T00:00:00', '2014-01-01T05:00:00',
+            '2014-01-02T01:00:00']
+        assert facts[0]['duration'] == 1800
+
+        status, _, facts = await request(
+            server, 'GET', '/facts?activity=sleep&reverse=1&limit=1')
+        assert [x['since'] for x in facts] == ['2014-01-02T01:00:00']
+
+        status, _, facts = await request(server, 'GET',
+                                         '/facts?since=2014-01-02')
+        assert len(facts) == 1
+
+        assert (await request(server, 'GET', '/facts?limit=x'))[0] == 400
+        assert (await request(server, 'GET', '/facts?bogus=1'))[0] == 400
+        assert (await request(server, 'GET', '/nothing'))[0] == 404
+        assert (await request(server, 'DELETE', '/facts'))[0] == 405
+
+    run(storage, check)
+
+
+def test_get(storage):
+    async def check(server):
+        status, content_type, [fact] = await request(server, 'GET',
+                                                     '/facts/latest')
+        assert (status, content_type) == (200, 'application/json')
+        assert fact['since'] == '2014-01-02T01:00:00'
+
+        status, _, [fact] = await request(server, 'GET',
+                                          '/facts/2014-01-01T05:00:00')
+        assert fact['activity'] == 'work'
+
+        status, _, [error] = await request(server, 'GET',
+                                           '/facts/2014-01-01T06:00:00')
+        assert status == 404
+        assert 'error' in error
+
+    run(storage, check)
+
+
+def test_write(storage):
+    async def check(server):
+        status, _, [fact] = await request(server, 'POST', '/facts', {
+            'activity': 'nap', 'since': '2014-01-03T14:00:00',
+            'until': '2014-01-03T14:20:00'})
+        assert status == 201
+        assert fact['duration'] == 1200
+
+        status, _, [fact] = await request(
+            server, 'PATCH', '/facts/2014-01-03T14:00:00',
+            {'description': 'short'})
+        assert status == 200
+        assert fact['description'] == 'short'
+
+        assert (await request(server, 'POST', '/facts', {
+            'activity': 'nap', 'since': 'yesterday'}))[0] == 400
+        assert (await request(server, 'POST', '/facts', {
+            'since': '2014-01-03T15:00:00'}))[0] == 400
+
+    run(storage, check)
+    fact = storage.get(datetime(2014, 1, 3, 14, 0))
+    assert (fact.activity, fact.description) == ('nap', 'short')
+
+
+def test_aggregates(storage):
+    async def check(server):
+        _, _, [result] = await request(server, 'GET', '/aggregates/count')
+        assert result == {'count': 3}
+        _, _, [result] = await request(
+            server, 'GET', '/aggregates/count?group_by=activity')
+        assert result == {'counts': {'sleep': 2, 'work': 1}}
+        _, _, [result] = await request(
+            server, 'GET', '/aggregates/duration?activity=sleep')
+        assert result == {'duration': 3600}
+
+        _, _, rows = await request(
+            server, 'GET', '/aggregates/rollups?period=day&activity=sleep'
+                           '&since=2014-01-01&until=2014-01-02')
+        assert [(x['period'], x['duration']) for x in rows] == [
+            ('2014-01-01T00:00:00', 1800), ('2014-01-02T00:00:00', 1800)]
+        assert (await request(server, 'GET', '/aggregates/rollups'))[0] == 400
+
+    run(storage, check)
+
+
+@pytest.mark.skipif(reporting is None,
+                    reason='reporting dependencies are not installed')
+def test_reports(storage):
+    now = datetime.now().replace(microsecond=0)
+    storage.add(make_fact(1, 0, since=now - timedelta(hours=3),
+                          until=now - timedelta(hours=1)))
+
+    async def check(server):
+        _, _, rows = await request(server, 'GET', '/reports/drift?days=2')
+        assert sum(x['duration'] for x in rows) == 7200
+        assert len(rows[-1]['hours']) == 24
+        _, _, rows = await request(server, 'GET', '/reports/weekly?weeks=1')
+        assert [x['total'] for x in rows] == [7200]
+        _, _, [guess] = await request(server, 'GET', '/reports/predict')
+        assert guess is None
+
+    run(storage, check)
+
+
+def test_identical_queries_are_coalesced(storage, monkeypatch):
+    calls = []
+    find = storage.find
+
+    def counting_find(**kwargs):
+        calls.append(kwargs)
+        time.sleep(0.1)     # let the other requests arrive
+        return find(**kwargs)
+
+    monkeypatch.setattr(storage, 'find', counting_find)
+
+    async def check(server):
+        results = await asyncio.gather(*[
+            request(server, 'GET', '/facts?activity=sleep')
+            for x in range(5)])
+        assert all(x == results[0] for x in results)
+        assert len(results[0][2]) == 2
+        assert len(calls) == 1
+        assert server._inflight == {}
+
+        # later requests query again
+        await request(server, 'GET', '/facts?activity=sleep')
+        assert len(calls) == 2
+
+    run(storage, check)
+
+
+def test_broadcast_buffers_little():
+    produced = []
+
+    async def source():
+        for i in range(100):
+            produced.append(i)
+            yield i
+            await asyncio.sleep(0)
+
+    async def check():
+        broadcast = api._Broadcast(source())
+        fast = broadcast.join()
+        slow = broadcast.join()
+
+        fast_chunks = []
+        async for chunk in fast:
+            fast_chunks.append(chunk)
+            if len(fast_chunks) == api._Broadcast.MAX_PENDING:
+                break
+        for i in range(10):
+            await asyncio.sleep(0)
+        # the producer waits for the slow reader
+        assert len(produced) == api._Broadcast.MAX_PENDING + 1
+        assert len(broadcast.chunks) == api._Broadcast.MAX_PENDING
+        assert not broadcast.joinable
+        await fast.aclose()
+
+        # chunks are dropped once the remaining reader got them
+        slow_chunks = []
+        async for chunk in slow:
+            slow_chunks.append(chunk)
+            assert len(broadcast.chunks) <= api._Broadcast.MAX_PENDING
+            if chunk == 49:
+                break
+        await slow.aclose()
+
+        # nobody is listening: the source is closed
+        await broadcast.task
+        assert broadcast.done
+        assert broadcast.chunks == []
+        assert slow_chunks == list(range(50))
+        assert len(produced) < 50 + api._Broadcast.MAX_PENDING + 2
+
+    asyncio.run(check())
+
+
+def test_writes_mark_requests_stale(storage, monkeypatch):
+    find = storage.find
+    started = []
+
+    def slow_find(**kwargs):
+        started.append(kwargs)
+        time.sleep(0.1)
+        return find(**kwargs)
+
+    monkeypatch.setattr(storage, 'find', slow_find)
+
+    async def check(server):
+        pending = asyncio.ensure_future(
+            request(server, 'GET', '/facts?activity=sleep'))
+        while not started:
+            await asyncio.sleep(0.01)
+        [broadcast] = server._inflight.values()
+        await request(server, 'POST', '/facts', {
+            'activity': 'sleep', 'since': '2014-01-03T00:00:00',
+            'until': '2014-01-03T07:00:00'})
+        assert broadcast.stale
+        assert not broadcast.joinable
+
+        # the reader still gets its response; a new request queries again
+        _, _, facts = await request(server, 'GET', '/facts?activity=sleep')
+        assert len(facts) == 3
+        assert len(started) == 2
+        _, _, facts = await pending
+        assert len(facts) in (2, 3)
+        assert server._inflight == {}
+
+    run(storage, check)
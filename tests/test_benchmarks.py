@@ -0,0 +1,50 @@
+# coding: utf-8
+
+# python
+import datetime
+import os
+
+# app
+from benchmarks import generator, runner
+from timetra.diary.storage import Storage, YamlBackend
+
+
+def _read_all(root):
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            with open(path) as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def test_generator_is_deterministic(tmpdir):
+    first, second = str(tmpdir.join('a')), str(tmpdir.join('b'))
+    assert generator.generate(first, days=3, seed=1) == 36
+    assert generator.generate(second, days=3, seed=1) == 36
+    assert _read_all(first) == _read_all(second)
+    assert sorted(_read_all(first)) == ['2014/12/29.yaml', '2014/12/30.yaml',
+                                        '2014/12/31.yaml']
+
+
+def test_generated_facts_are_valid(tmpdir):
+    data_dir, cache_dir = str(tmpdir.join('data')), str(tmpdir.join('cache'))
+    os.makedirs(cache_dir)
+    generator.generate(data_dir, days=2, facts_per_day=5,
+                       end=datetime.date(2014, 6, 2))
+    storage = Storage(YamlBackend(data_dir, cache_dir=cache_dir))
+    facts = list(storage.find())
+    assert len(facts) == 10
+    assert facts[-1].activity == 'sleep'
+    assert facts[-1].until.date() == datetime.date(2014, 6, 3)
+
+
+def test_compare():
+    baseline = {'slow': {'median': 0.010}, 'tiny': {'median': 0.0001},
+                'same': {'median': 0.010}}
+    results = {'slow': {'median': 0.015}, 'tiny': {'median': 0.0003},
+               'same': {'median': 0.011}, 'new': {'median': 1}}
+    rows = runner.compare(results, baseline)
+    assert [(name, regressed) for name, ratio, regressed in rows] == [
+        ('slow', True), ('tiny', False), ('same', False)]
@@ -0,0 +1,39 @@
+# coding: utf-8
+
+# python
+import os
+
+# this app
+from timetra.diary.caching import Cache
+from timetra.diary.models import FactRecord
+
+
+DAY_FILE = '''- activity: sleep
+  since: 2014-01-01 00:00:00
+  until: 2014-01-01 07:00:00
+  description: null
+'''
+
+
+def test_used_by_one_process_at_a_time(tmpdir):
+    day_path = str(tmpdir.join('01.yaml'))
+    with open(day_path, 'w') as f:
+        f.write(DAY_FILE)
+
+    first = Cache(str(tmpdir))
+    assert first.persistent
+    assert len(first.get_cached_yaml_file(day_path, FactRecord)) == 1
+
+    # e.g. a command run while the daemon is running
+    second = Cache(str(tmpdir))
+    assert not second.persistent
+    assert len(second.get_cached_yaml_file(day_path, FactRecord)) == 1
+    second.reset()
+    assert os.path.exists(first.path + '.lock')
+    assert first.db
+
+    first.close()
+    third = Cache(str(tmpdir))
+    assert third.persistent
+    assert third.db
+    third.close()
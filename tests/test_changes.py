@@ -0,0 +1,87 @@
+# coding: utf-8
+
+# python
+from datetime import datetime
+import os
+import threading
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.changes import ChangeFeed
+from timetra.diary.storage import Storage, YamlBackend
+from helpers import make_fact
+
+
+@pytest.fixture
+def storage(tmpdir):
+    return Storage(YamlBackend(str(tmpdir.mkdir('data')),
+                               cache_dir=str(tmpdir.mkdir('cache'))))
+
+
+def test_feed():
+    feed = ChangeFeed(size=3)
+    seen = []
+    unsubscribe = feed.subscribe(seen.append)
+    feed.subscribe(lambda change: 1 / 0)    # must not break publishing
+    for kind in 'abcd':
+        feed.publish(kind)
+    unsubscribe()
+    feed.publish('e')
+
+    assert [x.seq for x in seen] == [1, 2, 3, 4]
+    assert feed.last_seq == 5
+    assert [x.kind for x in feed.read()] == ['c', 'd', 'e']
+    assert [x.seq for x in feed.read(after=4)] == [5]
+    assert list(feed) == feed.read()
+
+
+def test_wait():
+    feed = ChangeFeed()
+    assert feed.wait(after=0, timeout=0.01) == []
+    timer = threading.Timer(0.05, feed.publish, ['add'])
+    timer.start()
+    changes = feed.wait(after=0, timeout=5)
+    timer.join()
+    assert [x.kind for x in changes] == ['add']
+
+
+def test_api_writes(storage):
+    seen = []
+    storage.subscribe(seen.append)
+
+    path = storage.add(make_fact())
+    fact = storage.get(datetime(2014, 1, 1, 0, 0))
+    storage.update(fact, {'activity': 'nap'})
+    storage.delete(storage.get(datetime(2014, 1, 1, 0, 0)))
+
+    assert [(x.seq, x.kind) for x in seen] == [
+        (1, 'add'), (2, 'update'), (3, 'delete')]
+    assert all(x.path == path for x in seen)
+    assert seen[1].previous.activity == 'sleep'
+    assert seen[1].fact['activity'] == 'nap'
+    assert seen[2].fact.activity == 'nap'
+
+
+def test_external_edits(storage):
+    storage.add(make_fact(day=1))
+    storage.add(make_fact(day=2))
+    assert storage.check_for_changes() == []
+
+    # own writes are not reported as external
+    storage.add(make_fact(day=1, hour=5))
+    assert storage.check_for_changes() == []
+
+    seen = []
+    storage.subscribe(seen.append)
+    path = storage.backend.get_file_path_for_day(datetime(2014, 1, 2))
+    os.utime(path, (0, 0))
+    os.remove(storage.backend.get_file_path_for_day(datetime(2014, 1, 1)))
+
+    changes = storage.check_for_changes()
+    assert changes == seen
+    assert sorted(x.path for x in changes) == sorted([
+        path, storage.backend.get_file_path_for_day(datetime(2014, 1, 1))])
+    assert set(x.kind for x in changes) == {'modify'}
+    assert storage.check_for_changes() == []
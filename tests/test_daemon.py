@@ -0,0 +1,160 @@
+# coding: utf-8
+
+# python
+import io
+import os
+import socket
+import stat
+import threading
+
+# 3rd-party
+import argh
+import pytest
+
+# this app
+from timetra.diary import client, daemon
+
+
+def find(days=0):
+    yield 'found {0}'.format(days)
+    print('printed')
+
+
+def today():
+    raise argh.CommandError('nothing today')
+
+
+def add():
+    return 'added'
+
+
+@pytest.fixture
+def server(tmpdir):
+    parser = argh.ArghParser()
+    parser.add_commands([find, today, add])
+    server = daemon.Server(str(tmpdir.join('sock')), parser, '/conf.yaml')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def request(server, argv, config='/conf.yaml'):
+    out = io.StringIO()
+    err = io.StringIO()
+    response = client.send({'argv': argv, 'config': config}, server.path,
+                           stdout=out, stderr=err)
+    return response, out.getvalue(), err.getvalue()
+
+
+def test_run(server):
+    assert stat.S_IMODE(os.stat(server.path).st_mode) == 0o600
+
+    response, out, err = request(server, ['find', '--days', '3'])
+    assert response == {'exit': 0}
+    assert out == 'found 3\nprinted\n'
+    assert err == ''
+
+    response, out, err = request(server, ['today'])
+    assert response == {'exit': 1}
+    assert 'nothing today' in err
+
+    response, out, err = request(server, ['find', '--bogus'])
+    assert response == {'exit': 2}
+    assert 'unrecognized arguments' in err
+
+
+def test_fallback(server):
+    # commands which write or need the terminal
+    assert request(server, ['add']) == ({'fallback': True}, '', '')
+    assert request(server, ['find', '--help'])[0] == {'fallback': True}
+    # another configuration
+    assert request(server, ['find'], config='/other.yaml')[0] == {
+        'fallback': True}
+    assert server.request_count == 0
+
+
+def test_sync_before_command(server):
+    synced = []
+    server.sync = lambda: synced.append(True)
+    request(server, ['find'])
+    assert synced == [True]
+    # no reads on fallback
+    request(server, ['add'])
+    assert synced == [True]
+
+
+def test_control(server):
+    assert client.send({'command': 'status'}, server.path)['requests'] == 0
+    with pytest.raises(OSError):
+        daemon.Server(server.path, server.parser, '/conf.yaml')
+
+    # the loop in the fixture is stopped; shutdown() there returns at once
+    assert client.send({'command': 'stop'}, server.path) == {
+        'stopping': True}
+
+
+def test_not_running(tmpdir):
+    path = str(tmpdir.join('sock'))
+    assert client.send({'command': 'status'}, path) is None
+
+    # a socket left by a killed daemon
+    server = daemon.Server(path, argh.ArghParser(), '/conf.yaml')
+    server.socket.close()
+    assert client.send({'command': 'status'}, path) is None
+    server = daemon.Server(path, argh.ArghParser(), '/conf.yaml')
+    server.server_close()
+    assert not os.path.exists(path)
+
+
+def serve_once(path, data):
+    "Accepts one connection, reads the request, writes `data` and closes."
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+
+    def respond():
+        conn, _ = listener.accept()
+        with conn:
+            conn.makefile('rb').readline()
+            conn.sendall(data)
+        listener.close()
+
+    thread = threading.Thread(target=respond)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+@pytest.mark.parametrize('data', [
+    b'{"out": "found 3\\n"}\n',
+    b'{"out": "found 3\\n"}\n{"out": "fou',
+])
+def test_connection_lost(tmpdir, data):
+    path = str(tmpdir.join('sock'))
+    thread = serve_once(path, data)
+    out = io.StringIO()
+    with pytest.raises(client.ConnectionLost):
+        client.send({'argv': ['find']}, path, stdout=out)
+    thread.join()
+    assert out.getvalue() == 'found 3\n'
+
+
+def test_connection_lost_before_response(tmpdir):
+    # nothing received yet: the command can be run locally
+    path = str(tmpdir.join('sock'))
+    thread = serve_once(path, b'')
+    assert client.send({'argv': ['find']}, path) is None
+    thread.join()
+
+
+def test_is_remote():
+    assert client.is_remote(['find', '--days', '2'])
+    assert client.is_remote(['report', 'drift'])
+    assert not client.is_remote(['report', 'drift', '-h'])
+    assert not client.is_remote(['add', 'sleep'])
+    assert not client.is_remote(['tui', 'run'])
+    assert not client.is_remote([])
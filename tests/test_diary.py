@@ -0,0 +1,71 @@
+# coding: utf-8
+
+# python
+from datetime import datetime, timedelta
+import io
+
+# 3rd-party
+import argh
+import pytest
+
+# this app
+from timetra.diary.storage import Storage, YamlBackend
+
+try:
+    from timetra.diary.diary import Diary
+except ImportError:
+    Diary = None
+
+
+@pytest.fixture
+def storage(tmpdir):
+    cache_dir = tmpdir.join('cache')
+    cache_dir.ensure(dir=True)
+    storage = Storage(YamlBackend(str(tmpdir.join('data')),
+                                  cache_dir=str(cache_dir)))
+    since = datetime(2014, 1, 1, 9, 0)
+    for i in range(4):
+        storage.add({'activity': 'code', 'since': since + timedelta(hours=i),
+                     'until': since + timedelta(hours=i, minutes=30),
+                     'description': 'task {0}'.format(i), 'tags': []})
+    return storage
+
+
+@pytest.fixture
+def parser(storage):
+    parser = argh.ArghParser()
+    parser.add_commands(Diary({'storage': storage}).commands)
+    return parser
+
+
+@pytest.mark.skipif(Diary is None, reason='diary dependencies are not installed')
+def test_find_limit(parser):
+    output = io.StringIO()
+    parser.dispatch(['find', '--since', '2014-01-01', '--limit', '2',
+                     '--reverse'], output_file=output)
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 2
+    assert 'task 3' in lines[0]
+    assert 'task 2' in lines[1]
+
+
+@pytest.mark.skipif(Diary is None, reason='diary dependencies are not installed')
+def test_find_count(parser, storage):
+    # an unfinished fact (not accepted by `add()`)
+    day_path = storage.backend.get_file_path_for_day(datetime(2014, 1, 1))
+    with open(day_path, 'a') as f:
+        f.write('- activity: code\n'
+                '  since: 2014-01-01 18:00:00\n'
+                '  until: null\n'
+                '  description: open\n')
+    output = io.StringIO()
+    # the default format needs `until`
+    parser.dispatch(['find', '--since', '2014-01-01', '--count',
+                     '--fmt', '{description} {duration}'], output_file=output)
+    lines = output.getvalue().splitlines()
+    # facts are listed; the unfinished one is not counted
+    assert len(lines) == 7
+    assert 'task 0' in lines[0]
+    assert '30m' in lines[0]
+    assert 'open' in lines[4]
+    assert lines[5:] == ['', 'TOTAL 2.0h']
@@ -4,7 +4,8 @@
 from datetime import datetime, timedelta
 
 # this app
-from timetra.diary.reporting.drift import DriftData
+from timetra.diary.frame import FactFrame
+from timetra.diary.reporting.drift import DriftData, render_weekly_averages
 
 
 class TestDurationSplitting:
@@ -64,3 +65,38 @@ class TestDurationSplitting:
         assert d[dt.date()][0].duration == timedelta(minutes=60)
         assert d[dt.date()][1].duration == timedelta(minutes=15)
 
+
+
+class TestFrame:
+    def test_same_as_facts(self):
+        dt = datetime(2012,4,18, 20,00)
+        facts = [
+            (dt.replace(day=16, hour=11, minute=45), dt.replace(day=16, hour=12)),
+            (dt.replace(day=16, hour=13, minute=20), dt.replace(day=16, hour=14, minute=20)),
+            (dt.replace(day=17, hour=22, minute=50), dt.replace(hour=1, minute=15)),
+            (dt.replace(hour=12, minute=20), dt.replace(hour=12, minute=23)),
+        ]
+        frame = FactFrame.from_records({'since': a, 'until': b} for a, b in facts)
+        by_facts = DriftData(span_days=3, end_time=dt)
+        for since, until in facts:
+            by_facts.add_fact(since, until)
+        by_frame = DriftData(span_days=3, end_time=dt)
+        by_frame.add_frame(frame)
+
+        assert sorted(by_frame) == sorted(by_facts)
+        for date in by_facts:
+            assert ([x.duration for x in by_frame[date]] ==
+                    [x.duration for x in by_facts[date]])
+            for attr in 'fact_cnt', 'min_start', 'max_end':
+                assert (getattr(by_frame[date], attr) ==
+                        getattr(by_facts[date], attr))
+
+
+def test_render_weekly_averages():
+    since = datetime(2012,4,1).date()
+    groups = [(since, since + timedelta(days=6), timedelta(hours=7, minutes=5),
+               timedelta(hours=49, minutes=35), 7)]
+    table = render_weekly_averages(groups)
+    assert '2012-04-07' in table
+    assert '7h 05m' in table
+    assert '2d 1h 35m' in table
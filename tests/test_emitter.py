@@ -0,0 +1,87 @@
+# coding: utf-8
+
+# python
+from datetime import datetime
+import random
+
+# 3rd-party
+import pytest
+import yaml
+
+# this app
+from timetra.diary.emitter import emit_facts
+from timetra.diary.storage import _prepare_fact_for_yaml
+from helpers import make_fact
+
+
+def dump(facts):
+    return yaml.dump([_prepare_fact_for_yaml(x) for x in facts],
+                     allow_unicode=True, default_flow_style=False)
+
+
+LONG = ('walked the dog around the lake and then went to the park, '
+        'where we met some friends and talked about the weather for a while')
+
+CORPUS = [
+    make_fact(),
+    make_fact(until=None, tags=['a', None, 'with-dog']),
+    make_fact(category='body', hamster_fact_id=123,
+              since=datetime(2014, 1, 1, 0, 0, 0, 500000)),
+    make_fact(description=LONG),
+    make_fact(description=LONG.replace(' ', '  ')),
+    make_fact(description="it's " + LONG),
+    make_fact(description='a long\nstory'),
+    make_fact(description='a long\n\nstory\n'),
+    make_fact(description='one line\n' + LONG + '\nthe end'),
+    make_fact(description='Привет, мир — ünïcode'),
+    make_fact(activity='yes', description='123', tags=['1.5', 'null', '']),
+    make_fact(activity='sleep: deep', description='#not a comment'),
+    make_fact(description='- dash', tags=[LONG, 'x' * 100]),
+    make_fact(description='x' * 120),
+    make_fact(description='2014-01-01 10:00'),
+]
+
+# values `yaml.dump` writes in double quotes or with block hints
+UNSUPPORTED = [
+    make_fact(description='\ttab'),
+    make_fact(description='  indented\nblock'),
+    make_fact(description='kept\n\n'),
+]
+
+
+@pytest.mark.parametrize('fact', CORPUS)
+def test_same_as_yaml_dump(fact):
+    text = emit_facts([fact])
+    assert text is not None
+    assert text == dump([fact])
+    assert yaml.load(text, Loader=yaml.Loader) == [dict(fact)]
+
+
+def test_corpus_as_one_file():
+    assert emit_facts(CORPUS) == dump(CORPUS)
+    assert emit_facts([]) == dump([])
+
+
+def test_multi_line_category():
+    # `yaml.dump` writes it single-quoted: only values wrapped by
+    # `_prepare_value_for_yaml` become literal blocks
+    fact = make_fact(category='two\nlines', description='two\nlines')
+    assert emit_facts([fact]) in (None, dump([fact]))
+
+
+@pytest.mark.parametrize('fact', UNSUPPORTED)
+def test_unsupported(fact):
+    assert emit_facts([fact]) is None
+
+
+def test_random_descriptions():
+    rnd = random.Random(1)
+    alphabet = 'ab  \'":#-,.!?\nя'
+    for i in range(500):
+        description = ''.join(rnd.choice(alphabet)
+                              for _ in range(rnd.randint(0, 120)))
+        facts = [make_fact(description=description,
+                           tags=[description.replace('\n', ' ')])]
+        text = emit_facts(facts)
+        if text is not None:
+            assert text == dump(facts), repr(description)
@@ -0,0 +1,84 @@
+# coding: utf-8
+
+# python
+from datetime import datetime, timedelta
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.frame import FactFrame, to_seconds
+from timetra.diary.storage import Storage, YamlBackend
+
+
+def make_frame():
+    return FactFrame.from_records([
+        {'since': datetime(2014, 1, 1, 0, 0), 'until': datetime(2014, 1, 1, 7, 0),
+         'activity': 'sleep', 'category': 'body'},
+        {'since': datetime(2014, 1, 1, 8, 30), 'until': datetime(2014, 1, 1, 9, 0),
+         'activity': 'walk', 'category': None},
+        {'since': datetime(2014, 1, 1, 23, 0), 'until': datetime(2014, 1, 2, 6, 0),
+         'activity': 'sleep', 'category': 'body'},
+        {'since': datetime(2014, 1, 2, 8, 0), 'until': None,
+         'activity': 'work', 'category': None},
+    ], now=datetime(2014, 1, 2, 10, 0))
+
+
+def test_columns():
+    frame = make_frame()
+    assert len(frame) == 4
+    assert frame.activities == ['sleep', 'walk', 'work']
+    assert list(frame.activity) == [0, 1, 0, 2]
+    assert list(frame.category) == [0, -1, 0, -1]
+    # unfinished facts last until now
+    assert list(frame.duration) == [7 * 3600, 1800, 7 * 3600, 2 * 3600]
+
+
+def test_sum_by():
+    frame = make_frame()
+    assert frame.sum_by('activity') == {'sleep': 14 * 3600, 'walk': 1800,
+                                        'work': 2 * 3600}
+    assert frame.sum_by('category') == {'body': 14 * 3600,
+                                        None: 2 * 3600 + 1800}
+
+
+def test_group_by():
+    frame = make_frame()
+    days = frame.day_numbers('since')
+    first = to_seconds(datetime(2014, 1, 1)) // 86400
+    assert frame.group_by(days, func='count') == {first: 3, first + 1: 1}
+    assert frame.group_by(days, frame.since, func='max') == {
+        first: to_seconds(datetime(2014, 1, 1, 23, 0)),
+        first + 1: to_seconds(datetime(2014, 1, 2, 8, 0))}
+    with pytest.raises(ValueError):
+        frame.group_by(days, func='median')
+
+
+def test_clip():
+    frame = make_frame()
+    since, until = frame.clip(low=to_seconds(datetime(2014, 1, 1, 6, 0)),
+                              high=frame.day_ends('since'))
+    assert [b - a for a, b in zip(since, until)] == [3600, 1800, 3599, 2 * 3600]
+
+
+def test_histogram():
+    frame = make_frame()
+    start = to_seconds(datetime(2014, 1, 1))
+    assert frame.histogram(start, 86400, 2) == [
+        7 * 3600 + 1800 + 3600, 6 * 3600 + 2 * 3600]
+    hourly = frame.histogram(start + 6 * 3600, 3600, 4)
+    assert hourly == [3600, 0, 1800, 0]
+
+
+def test_storage(tmpdir):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')))
+    for day in range(1, 4):
+        backend.add({'activity': 'sleep', 'description': None, 'tags': [],
+                     'since': datetime(2014, 1, day, 0, 0),
+                     'until': datetime(2014, 1, day, 7, 0)})
+    frame = Storage(backend).to_frame(since=datetime(2014, 1, 2))
+    assert len(frame) == 2
+    assert frame.sum_by('activity') == {'sleep': 14 * 3600}
+    assert frame.histogram(to_seconds(datetime(2014, 1, 2)), 86400, 2) == [
+        7 * 3600, 7 * 3600]
@@ -0,0 +1,126 @@
+# coding: utf-8
+
+# python
+from datetime import datetime, time, timedelta
+
+# 3rd-party
+import pytest
+import yaml
+
+# this app
+from timetra.diary.frame import FactFrame, to_seconds
+from timetra.diary.loader import DayFileLoader, EpochDayFileLoader
+from timetra.diary.models import Fact, FactRecord
+from timetra.diary.storage import YamlBackend
+
+
+DOCUMENT = '''
+- activity: sleep
+  since: 2014-01-04 23:00:00
+  until: 2014-01-05 07:30:00
+  tags:
+  - 2014-01-05 07:30:00
+  description: null
+- activity: nap
+  since: 2014-01-05 13:00:00.250000
+  until: null
+  description: '2014-01-05 14:00:00'
+- activity: legacy
+  since: 2014-01-05T15:00:00
+  until: 2014-1-5 16:00:00+02:00
+  description: 2014-01-05
+- activity: odd
+  since: 2014-01-05 17:00:00.25
+  until: 2014-02-30 17:00:00
+  description: 20140105 170000
+'''
+
+
+@pytest.mark.parametrize('document', [
+    DOCUMENT.split('- activity: odd')[0],
+    '[]',
+    '- {since: 2014-01-05 13:00:00, activity: x}',
+])
+def test_same_as_generic_loader(document):
+    assert (yaml.load(document, Loader=DayFileLoader) ==
+            yaml.load(document, Loader=yaml.Loader))
+
+
+def test_invalid_date():
+    with pytest.raises(ValueError):
+        yaml.load(DOCUMENT, Loader=DayFileLoader)
+    with pytest.raises(ValueError):
+        yaml.load(DOCUMENT, Loader=EpochDayFileLoader)
+
+
+def test_epoch_timestamps():
+    document = DOCUMENT.split('- activity: odd')[0]
+    generic = yaml.load(document, Loader=yaml.Loader)
+    items = yaml.load(document, Loader=EpochDayFileLoader)
+    sleep, nap, legacy = items
+    assert sleep['since'] == to_seconds(generic[0]['since'])
+    assert sleep['until'] == to_seconds(generic[0]['until'])
+    # not representable
+    assert nap['since'] == generic[1]['since']
+    assert legacy == generic[2]
+
+    # values are restored when accessed
+    for data, expected in zip(items, generic):
+        assert dict(FactRecord(data)) == dict(FactRecord(expected))
+
+
+def test_epoch_record():
+    record = FactRecord(activity='sleep', since=1388876400, until=None)
+    assert record.seconds('since') == 1388876400
+    assert record.seconds('until') is None
+    assert record._since == 1388876400
+    assert record.since == datetime(2014, 1, 4, 23, 0)
+    assert record.seconds('since') == 1388876400
+    assert isinstance(record.to_fact()['since'], datetime)
+
+
+def test_backend(tmpdir):
+    data_dir = str(tmpdir.mkdir('data'))
+    writer = YamlBackend(data_dir, cache_dir=str(tmpdir.mkdir('cache')))
+    writer.add(Fact(activity='sleep', since=datetime(2014, 1, 4, 23, 0),
+                    until=datetime(2014, 1, 5, 7, 30)))
+    writer.add(Fact(activity='nap', since=datetime(2014, 1, 5, 13, 0),
+                    until=datetime(2014, 1, 5, 14, 0, 0, 500000)))
+
+    reader = YamlBackend(data_dir, cache_dir=str(tmpdir.mkdir('cache2')),
+                         epoch_timestamps=True)
+    frame = FactFrame.from_records(reader.find())
+    assert list(frame.duration) == [8.5 * 3600, 3600]
+
+    assert [dict(x) for x in reader.find()] == [dict(x) for x in writer.find()]
+    assert reader.count(since=datetime(2014, 1, 5)) == 1
+
+
+def test_index_keeps_seconds(tmpdir):
+    data_dir = str(tmpdir.mkdir('data'))
+    writer = YamlBackend(data_dir, cache_dir=str(tmpdir.mkdir('cache')))
+    writer.add(Fact(activity='sleep', since=datetime(2014, 1, 4, 23, 0),
+                    until=datetime(2014, 1, 5, 7, 30)))
+    writer.add(Fact(activity='nap', since=datetime(2014, 1, 5, 13, 0),
+                    until=datetime(2014, 1, 5, 14, 0)))
+
+    reader = YamlBackend(data_dir, cache_dir=str(tmpdir.mkdir('cache2')),
+                         epoch_timestamps=True)
+    assert (reader.get_rollups('day', since=datetime(2014, 1, 4)) ==
+            writer.get_rollups('day', since=datetime(2014, 1, 4)))
+    # building the index and rollups did not convert the cached records
+    for day_path in reader._collect_day_paths():
+        for record in reader.get_cached_day_file(day_path):
+            assert type(record._since) is int
+            assert type(record._until) is int
+
+    for backend in writer, reader:
+        found = backend.find(weekdays=[5], starts_after=time(12, 0))
+        assert [x.since.day for x in found] == [4]
+        found = backend.find(fields=('since', 'until'),
+                             min_duration=timedelta(hours=1))
+        assert [dict(x) for x in found] == [
+            {'since': datetime(2014, 1, 4, 23, 0),
+             'until': datetime(2014, 1, 5, 7, 30)},
+            {'since': datetime(2014, 1, 5, 13, 0),
+             'until': datetime(2014, 1, 5, 14, 0)}]
@@ -0,0 +1,115 @@
+# coding: utf-8
+
+# python
+from datetime import datetime
+import os
+import pickle
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.models import Fact, FactRecord
+from timetra.diary.storage import YamlBackend
+
+
+SINCE = datetime(2014, 1, 1, 0, 0)
+UNTIL = datetime(2014, 1, 1, 7, 0)
+
+
+def make_record(**kwargs):
+    data = dict(activity='sleep', since=SINCE, until=UNTIL)
+    data.update(kwargs)
+    return FactRecord(data)
+
+
+def test_access():
+    record = make_record(tags=['a'])
+    assert record.activity == record['activity'] == 'sleep'
+    assert record.get('tags') == ('a',)
+    assert record.duration == UNTIL - SINCE
+
+    # defaults are the same as in `Fact`
+    assert record.to_fact() == Fact(activity='sleep', since=SINCE,
+                                    until=UNTIL, tags=['a'])
+    assert record.description is None
+
+    # missing optional fields
+    assert 'category' not in record
+    assert record.get('category') is None
+    with pytest.raises(KeyError):
+        record['category']
+    with pytest.raises(AttributeError):
+        record.category
+
+
+def test_read_only():
+    record = make_record()
+    with pytest.raises(AttributeError):
+        record.activity = 'work'
+    with pytest.raises(TypeError):
+        record['activity'] = 'work'
+    with pytest.raises(AttributeError):
+        record.foo = 1
+
+    fact = record.to_fact()
+    assert isinstance(fact, Fact)
+    fact.activity = 'work'
+    assert record.activity == 'sleep'
+
+
+def test_tags_read_only():
+    record = make_record(tags=['a'])
+    with pytest.raises(AttributeError):
+        record['tags'].append('b')
+
+    fact = record.to_fact()
+    assert fact.tags == ['a']
+    fact.tags.append('b')
+    assert record.tags == ('a',)
+    fact.validate()
+
+
+def test_interning():
+    activity = ''.join(['sl', 'eep'])
+    tag = ''.join(['with-', 'dog'])
+    record = make_record(activity=activity, tags=[tag, None])
+    other = make_record(tags=['with-dog'])
+    assert record.activity is other.activity
+    assert record.tags[0] is other.tags[0]
+    assert record.tags[1] is None
+
+
+def test_pickle():
+    record = make_record(category='body', hamster_fact_id=1, legacy='x')
+    restored = pickle.loads(pickle.dumps(record, -1))
+    assert restored == record
+    assert restored['legacy'] == 'x'
+
+
+def test_storage_returns_records(tmpdir):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')))
+    backend.add(Fact(activity='sleep', since=SINCE, until=UNTIL))
+    fact, = backend.find()
+    assert isinstance(fact, FactRecord)
+    assert backend.get(SINCE) == fact
+
+    backend.update(fact, {'activity': 'nap'})
+    assert [x.activity for x in backend.find()] == ['nap']
+
+
+def test_cached_records_are_shared(tmpdir):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')))
+    backend.add(Fact(activity='sleep', since=SINCE, until=UNTIL))
+    first, = backend.find()
+    second, = backend.find()
+    assert first is second
+
+    # the cached objects are replaced when the file changes
+    backend.add(Fact(activity='work', since=datetime(2014, 1, 1, 9),
+                     until=datetime(2014, 1, 1, 13)))
+    path = backend.get_file_path_for_day(SINCE)
+    os.utime(path, (0, 0))
+    assert [x.activity for x in backend.find()] == ['sleep', 'work']
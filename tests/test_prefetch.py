@@ -0,0 +1,47 @@
+# coding: utf-8
+
+# python
+import threading
+import time
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.prefetch import prefetch
+
+
+def test_order():
+    assert list(prefetch(lambda x: x * 2, range(10), depth=3)) == [
+        x * 2 for x in range(10)]
+
+
+def test_errors_are_reraised():
+    def load(x):
+        if x == 3:
+            raise ValueError(x)
+        return x
+
+    results = prefetch(load, range(5))
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(ValueError):
+        next(results)
+
+
+def test_backpressure_and_close():
+    loaded = []
+
+    def load(x):
+        loaded.append(x)
+        return x
+
+    results = prefetch(load, range(100), depth=2)
+    assert next(results) == 0
+    time.sleep(0.3)
+    # one item consumed, two queued and one waiting for a free slot
+    assert len(loaded) <= 4
+
+    threads = threading.active_count()
+    results.close()
+    assert threading.active_count() == threads - 1
+    assert len(loaded) <= 5
@@ -0,0 +1,338 @@
+# coding: utf-8
+
+# python
+from datetime import datetime, time, timedelta
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.indexing import SortedIndex
+from timetra.diary.query import parse_pattern, Query, StartTime, Weekday, Duration
+from timetra.diary.storage import Storage, YamlBackend
+from helpers import make_fact
+
+
+class TestPatterns:
+
+    def test_substring(self):
+        match = parse_pattern('activity', 'Sle').compile()
+        assert match(make_fact(activity='sleep'))
+        assert not match(make_fact(activity='walk'))
+
+    def test_or(self):
+        match = parse_pattern('activity', 'sleep,walk').compile()
+        assert match(make_fact(activity='sleep'))
+        assert match(make_fact(activity='walk'))
+        assert not match(make_fact(activity='work'))
+
+    def test_and(self):
+        match = parse_pattern('description', 'dog park').compile()
+        assert match(make_fact(description='walked the dog in the park'))
+        assert not match(make_fact(description='walked the dog'))
+
+    def test_not(self):
+        match = parse_pattern('tags', 'in-ekb -with-dog').compile()
+        assert match(make_fact(tags=['in-ekb']))
+        assert not match(make_fact(tags=['in-ekb', 'with-dog']))
+
+    def test_empty_values(self):
+        match = parse_pattern('description', 'dog').compile()
+        assert not match(make_fact(description=None))
+
+    def test_query_joins_fields_with_and(self):
+        query = Query(filters={'activity': 'walk', 'tags': 'dog'})
+        assert query.match(make_fact(activity='walk', tags=['with-dog']))
+        assert not query.match(make_fact(activity='walk', tags=[]))
+
+
+@pytest.fixture
+def backend(tmpdir):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')))
+    for day in range(1, 11):
+        backend.add(make_fact(activity='sleep',
+                              since=datetime(2014, 1, day, 0, 0),
+                              until=datetime(2014, 1, day, 7, 0)))
+    backend.add(make_fact(activity='walk', tags=['with-dog'],
+                          since=datetime(2014, 1, 5, 8, 0),
+                          until=datetime(2014, 1, 5, 9, 0)))
+    return backend
+
+
+class TestPlanning:
+
+    def test_date_range_scan(self, backend):
+        plan = backend.plan(Query(since=datetime(2014, 1, 3),
+                                  until=datetime(2014, 1, 4)))
+        assert plan.access_path == 'date-range scan'
+        assert len(plan.day_paths) == 2
+
+    def test_activity_index(self, backend):
+        plan = backend.plan(Query(filters={'activity': 'walk'}))
+        assert plan.access_path == 'activity index'
+        assert plan.day_paths == [backend.get_file_path_for_day(datetime(2014, 1, 5))]
+        assert [f.activity for f in backend.find(activity='walk')] == ['walk']
+
+    def test_tag_index(self, backend):
+        plan = backend.plan(Query(filters={'activity': 'sleep,walk',
+                                           'tags': 'dog'}))
+        assert plan.access_path == 'tag index'
+        assert len(plan.day_paths) == 1
+
+    def test_negation_is_not_indexed(self, backend):
+        plan = backend.plan(Query(filters={'activity': '-sleep'}))
+        assert plan.access_path == 'date-range scan'
+        assert [f.activity for f in backend.find(activity='-sleep')] == ['walk']
+
+    def test_index_follows_changes(self, backend):
+        assert not list(backend.find(activity='nap'))
+        backend.add(make_fact(activity='nap',
+                              since=datetime(2014, 1, 7, 14, 0),
+                              until=datetime(2014, 1, 7, 14, 30)))
+        assert [f.activity for f in backend.find(activity='nap')] == ['nap']
+
+    def test_explain(self, backend):
+        text = backend.explain(activity='walk')
+        assert 'access path: activity index' in text
+        assert 'date-range scan: 10 day files' in text
+        assert 'activity index: 1 day files' in text
+
+
+class TestStreaming:
+
+    def test_reverse_limit_stops_early(self, backend):
+        loaded = []
+        get_cached_day_file = backend.get_cached_day_file
+
+        def spy(path):
+            loaded.append(path)
+            return get_cached_day_file(path)
+
+        backend.get_cached_day_file = spy
+
+        facts = list(backend.find(activity='sleep', reverse=True, limit=2))
+        assert [f.since.day for f in facts] == [10, 9]
+        assert len(loaded) == 2
+
+    def test_reverse_limit_stops_early_on_cold_index(self, backend, tmpdir):
+        backend = YamlBackend(backend.data_dir,
+                              cache_dir=str(tmpdir.mkdir('cold')))
+        indexed = []
+        get_cached_index = backend.cache.get_cached_index
+
+        def spy(path, *args):
+            indexed.append(path)
+            return get_cached_index(path, *args)
+
+        backend.cache.get_cached_index = spy
+
+        facts = list(backend.find(activity='sleep', reverse=True, limit=2))
+        assert [f.since.day for f in facts] == [10, 9]
+        assert len(indexed) == 2
+
+    def test_prefetch(self, backend):
+        facts = list(backend.find(activity='sleep', reverse=True))
+        backend.prefetch = 3
+        assert list(backend.find(activity='sleep', reverse=True)) == facts
+        assert list(backend.find(activity='sleep', limit=2)) == facts[-1:-3:-1]
+
+    def test_offset(self, backend):
+        facts = list(backend.find(activity='sleep', offset=8))
+        assert [f.since.day for f in facts] == [9, 10]
+
+        facts = list(backend.find(reverse=True, offset=5, limit=2))
+        assert [(f.activity, f.since.day) for f in facts] == [
+            ('walk', 5), ('sleep', 5)]
+
+
+class TestProjection:
+
+    def test_served_from_index(self, backend):
+        backend.add(make_fact(activity='read', description='a long\nstory',
+                              since=datetime(2014, 1, 6, 20, 0),
+                              until=datetime(2014, 1, 6, 21, 0)))
+        # warm up the index
+        list(backend.find(activity='read'))
+
+        loaded = []
+        get_cached_day_file = backend.get_cached_day_file
+
+        def spy(path):
+            loaded.append(path)
+            return get_cached_day_file(path)
+
+        backend.get_cached_day_file = spy
+
+        records = list(backend.find(activity='read',
+                                    fields=('since', 'activity',
+                                            'description')))
+        assert len(records) == 1
+        record = records[0]
+        assert record.activity == 'read'
+        assert record['since'] == datetime(2014, 1, 6, 20, 0)
+        assert 'until' not in record
+        assert not loaded
+
+        # heavy fields are loaded on first access
+        assert record.description == 'a long\nstory'
+        assert len(loaded) == 1
+
+    def test_unindexed_predicate(self, backend):
+        backend.add(make_fact(activity='read', description='a long\nstory',
+                              since=datetime(2014, 1, 6, 20, 0),
+                              until=datetime(2014, 1, 6, 21, 0)))
+        records = list(backend.find(description='story', fields=('until',)))
+        assert [dict(x) for x in records] == [
+            {'until': datetime(2014, 1, 6, 21, 0)}]
+        assert records[0].get('activity') is None
+
+
+class TestSecondaryIndexes:
+
+    @pytest.fixture
+    def backend(self, backend):
+        # Jan 4 and 5, 2014 are Saturday and Sunday
+        backend.add(make_fact(activity='party',
+                              since=datetime(2014, 1, 4, 23, 0),
+                              until=datetime(2014, 1, 5, 3, 30)))
+        backend.add(make_fact(activity='work',
+                              since=datetime(2014, 1, 8, 9, 0),
+                              until=datetime(2014, 1, 8, 13, 0)))
+        return backend
+
+    def test_time_of_day_window_wraps(self, backend):
+        facts = list(backend.find(starts_after=time(22, 0),
+                                  starts_before=time(2, 0)))
+        assert [f.activity for f in facts] == ['sleep'] * 4 + ['party'] + ['sleep'] * 6
+        facts = list(backend.find(starts_after=time(22, 0)))
+        assert [f.activity for f in facts] == ['party']
+        plan = backend.plan(Query(filters={
+            'starts': StartTime(time(22, 0), None)}))
+        assert plan.access_path == 'time-of-day index'
+        assert len(plan.day_paths) == 1
+
+    def test_weekdays(self, backend):
+        facts = list(backend.find(weekdays=[5, 6], activity='-sleep'))
+        assert [f.activity for f in facts] == ['party', 'walk']
+        plan = backend.plan(Query(filters={'weekday': Weekday([5, 6])}))
+        assert plan.access_path == 'weekday index'
+        assert len(plan.day_paths) == 2
+
+    def test_duration(self, backend):
+        facts = list(backend.find(min_duration=timedelta(hours=3),
+                                  max_duration=timedelta(hours=5)))
+        assert [f.activity for f in facts] == ['party', 'work']
+        plan = backend.plan(Query(filters={
+            'duration': Duration(max_duration=timedelta(hours=2))}))
+        assert plan.access_path == 'duration index'
+        assert len(plan.day_paths) == 1
+
+    def test_index_follows_changes(self, backend):
+        assert not list(backend.find(starts_after=time(12, 0),
+                                     starts_before=time(13, 0)))
+        backend.add(make_fact(activity='lunch',
+                              since=datetime(2014, 1, 3, 12, 15),
+                              until=datetime(2014, 1, 3, 12, 45)))
+        facts = list(backend.find(starts_after=time(12, 0),
+                                  starts_before=time(13, 0)))
+        assert [f.activity for f in facts] == ['lunch']
+
+    def test_sorted_index_changes(self):
+        index = SortedIndex()
+        for value, path in [(5, 'a'), (1, 'b'), (5, 'c'), (3, 'a')]:
+            index.add(value, path)
+        assert index.range(2, 5) == set(['a', 'c'])
+        index.remove(5, 'a')
+        index.add(2, 'd')
+        index.remove(3, 'a')
+        assert index.range(2, 5) == set(['c', 'd'])
+        assert index.range(high=1) == set(['b'])
+        assert len(index) == 3
+
+
+class TestAggregates:
+
+    @pytest.fixture
+    def storage(self, backend):
+        return Storage(backend)
+
+    def test_count(self, storage):
+        assert storage.count() == 11
+        assert storage.count(activity='walk') == 1
+        assert storage.count(since=datetime(2014, 1, 5),
+                             until=datetime(2014, 1, 5)) == 2
+        assert storage.count(description='nothing') == 0
+
+    def test_count_group_by(self, storage):
+        assert storage.count(group_by='activity') == {'sleep': 10, 'walk': 1}
+        assert storage.count(group_by='activity', tag='dog') == {'walk': 1}
+
+    def test_total_duration(self, storage):
+        assert storage.total_duration() == timedelta(hours=71)
+        assert storage.total_duration(activity='walk') == timedelta(hours=1)
+        assert storage.total_duration(activity='nothing') == timedelta()
+
+    def test_exists(self, storage):
+        assert storage.exists(activity='walk')
+        assert not storage.exists(activity='walk', weekdays=[0])
+
+    def test_no_facts_loaded(self, storage):
+        # warm up the index
+        storage.count(activity='x')
+
+        def fail(path):
+            raise AssertionError('loaded {0}'.format(path))
+
+        storage.backend.get_cached_day_file = fail
+
+        assert storage.count() == 11
+        assert storage.total_duration(tag='dog') == timedelta(hours=1)
+        assert storage.count(group_by='activity') == {'sleep': 10, 'walk': 1}
+
+
+class TestParallel:
+
+    @pytest.fixture
+    def backend(self, backend):
+        for year in 2012, 2013:
+            for month in 1, 6:
+                backend.add(make_fact(activity='sleep', tags=['old'],
+                                      description='archived',
+                                      since=datetime(year, month, 1, 0, 0),
+                                      until=datetime(year, month, 1, 8, 0)))
+        return backend
+
+    def cold(self, backend, tmpdir, **kwargs):
+        return YamlBackend(backend.data_dir, parallel=True, workers=2,
+                           cache_dir=str(tmpdir.mkdir('cold')), **kwargs)
+
+    def no_pool(self, *args, **kwargs):
+        raise AssertionError('workers are not needed')
+
+    @pytest.mark.parametrize('split_by', ['year', 'month'])
+    def test_same_order_as_serial(self, backend, tmpdir, split_by):
+        serial = list(backend.find(tag='-dog'))
+        serial_reversed = list(backend.find(tag='-dog', reverse=True))
+        assert len(serial) == 14
+
+        cold = self.cold(backend, tmpdir, split_by=split_by)
+        assert list(cold.find(tag='-dog')) == serial
+        # parsed by the workers
+        assert not any(cold.cache.is_cached(x, type(serial[0]))
+                       for x in cold._collect_day_paths())
+        assert list(cold.find(tag='-dog', reverse=True)) == serial_reversed
+
+    def test_cached_chunks(self, backend, monkeypatch):
+        serial = list(backend.find(tag='-dog'))
+        backend.parallel = True
+        monkeypatch.setattr('multiprocessing.Pool', self.no_pool)
+        assert list(backend.find(tag='-dog')) == serial
+
+    def test_limit(self, backend, tmpdir, monkeypatch):
+        cold = self.cold(backend, tmpdir)
+        monkeypatch.setattr('multiprocessing.Pool', self.no_pool)
+        facts = list(cold.find(activity='sleep', reverse=True, limit=3))
+        assert [f.since.day for f in facts] == [10, 9, 8]
+        assert cold.exists(description='archived')
+        assert cold.get_latest().since.day == 10
@@ -0,0 +1,120 @@
+# coding: utf-8
+
+# python
+from datetime import datetime, timedelta
+import os
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.rollups import compute_contributions, RollupStore
+from timetra.diary.storage import Storage, YamlBackend
+from helpers import make_fact
+
+
+class TestContributions:
+
+    def test_split_across_periods(self):
+        fact = make_fact(activity='sleep', category='self-care',
+                         since=datetime(2014, 1, 31, 23, 30),
+                         until=datetime(2014, 2, 1, 1, 15),
+                         tags=['home'])
+        store = RollupStore()
+        store.add(compute_contributions([fact]))
+
+        hours = store.query('hour', since=datetime(2014, 1, 31, 23, 0),
+                            until=datetime(2014, 2, 1, 1, 0))
+        assert [(x.duration, x.count) for x in hours] == [
+            (timedelta(minutes=30), 1),
+            (timedelta(minutes=60), 0),
+            (timedelta(minutes=15), 0),
+        ]
+
+        months = store.query('month')
+        assert [(x.period, x.duration) for x in months] == [
+            (datetime(2014, 1, 1), timedelta(minutes=30)),
+            (datetime(2014, 2, 1), timedelta(minutes=75)),
+        ]
+
+        weeks = store.query('week', tag='home')
+        assert [(x.period, x.count) for x in weeks] == [
+            (datetime(2014, 1, 27), 1)]
+
+    def test_subtract(self):
+        fact = make_fact(activity='sleep',
+                         since=datetime(2014, 1, 1, 0, 0),
+                         until=datetime(2014, 1, 1, 7, 0))
+        store = RollupStore()
+        contributions = compute_contributions([fact])
+        store.add(contributions)
+        store.add(contributions, sign=-1)
+        assert store.query('day') == []
+
+
+class TestStorageRollups:
+
+    @pytest.fixture
+    def storage(self, tmpdir):
+        backend = YamlBackend(str(tmpdir.mkdir('data')),
+                              cache_dir=str(tmpdir.mkdir('cache')))
+        storage = Storage(backend)
+        for day in range(1, 15):
+            backend.add(make_fact(activity='sleep',
+                                  since=datetime(2014, 1, day, 0, 0),
+                                  until=datetime(2014, 1, day, 7, 0)))
+        return storage
+
+    def test_weekly(self, storage):
+        weeks = storage.get_rollups('week', activity='sleep')
+        assert [(x.period, x.duration, x.count) for x in weeks] == [
+            (datetime(2013, 12, 30), timedelta(hours=35), 5),
+            (datetime(2014, 1, 6), timedelta(hours=49), 7),
+            (datetime(2014, 1, 13), timedelta(hours=14), 2),
+        ]
+
+    def test_sub_range_on_cold_backend(self, storage, tmpdir):
+        cold = Storage(YamlBackend(storage.backend.data_dir,
+                                   cache_dir=str(tmpdir.mkdir('cold'))))
+        since = datetime(2014, 1, 8)
+        until = datetime(2014, 1, 9)
+        weeks = cold.get_rollups('week', since=since, until=until)
+        assert [(x.period, x.duration, x.count) for x in weeks] == [
+            (datetime(2014, 1, 6), timedelta(hours=49), 7)]
+        months = cold.get_rollups('month', since=since, until=until)
+        assert [(x.duration, x.count) for x in months] == [
+            (timedelta(hours=98), 14)]
+
+    def test_updated_on_write(self, storage):
+        since = datetime(2014, 1, 3)
+        until = datetime(2014, 1, 3)
+        days = storage.get_rollups('day', since=since, until=until)
+        assert days[0].count == 1
+
+        storage.add(make_fact(activity='walk',
+                              since=datetime(2014, 1, 3, 8, 0),
+                              until=datetime(2014, 1, 3, 9, 0)))
+        days = storage.get_rollups('day', since=since, until=until)
+        assert days[0].count == 2
+        assert days[0].duration == timedelta(hours=8)
+
+        storage.delete(make_fact(activity='walk',
+                                 since=datetime(2014, 1, 3, 8, 0)))
+        days = storage.get_rollups('day', since=since, until=until)
+        assert days[0].count == 1
+
+    def test_external_edit(self, storage):
+        date = datetime(2014, 1, 3)
+        assert storage.get_rollups('day', since=date, until=date)[0].count == 1
+
+        path = storage.backend.get_file_path_for_day(date)
+        with open(path) as f:
+            content = f.read()
+        with open(path, 'w') as f:
+            f.write(content.replace('07:00:00', '09:00:00'))
+        # make sure the mtime differs even on coarse filesystems
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+
+        days = storage.get_rollups('day', since=date, until=date)
+        assert days[0].duration == timedelta(hours=9)
@@ -0,0 +1,114 @@
+# coding: utf-8
+
+# python
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.sharding import Router, ShardedBackend
+from timetra.diary.storage import FactNotFound, Storage, YamlBackend
+from helpers import make_fact
+
+
+@pytest.fixture
+def backend(tmpdir):
+    shards = OrderedDict()
+    for name in 'home', 'work':
+        shards[name] = YamlBackend(str(tmpdir.mkdir(name)),
+                                   cache_dir=str(tmpdir.mkdir(name + '-cache')))
+    router = Router([{'shard': 'work', 'activity': 'work,meeting'}],
+                    default='home')
+    backend = ShardedBackend(shards, router)
+    for day in range(1, 6):
+        backend.add(make_fact(activity='sleep',
+                              since=datetime(2014, 1, day, 0, 0),
+                              until=datetime(2014, 1, day, 7, 0)))
+        backend.add(make_fact(activity='work',
+                              since=datetime(2014, 1, day, 9, 0),
+                              until=datetime(2014, 1, day, 13, 0)))
+    backend.add(make_fact(activity='meeting', tags=['boss'],
+                          since=datetime(2014, 1, 3, 7, 0),
+                          until=datetime(2014, 1, 3, 8, 0)))
+    return backend
+
+
+def test_routing(backend):
+    assert [f.activity for f in backend.shards['work'].find()].count('work') == 5
+    assert set(f.activity for f in backend.shards['home'].find()) == {'sleep'}
+    with pytest.raises(ValueError):
+        ShardedBackend(backend.shards, lambda fact: 'nowhere').add(
+            make_fact(since=datetime(2014, 1, 1, 8, 0)))
+
+
+def test_find_merges_in_order(backend):
+    facts = list(backend.find(since=datetime(2014, 1, 3),
+                              until=datetime(2014, 1, 3)))
+    assert [f.activity for f in facts] == ['sleep', 'meeting', 'work']
+
+    facts = list(backend.find(reverse=True, offset=1, limit=3))
+    assert [(f.activity, f.since.day) for f in facts] == [
+        ('sleep', 5), ('work', 4), ('sleep', 4)]
+
+    records = list(backend.find(tag='boss', fields=('activity',)))
+    assert [dict(x) for x in records] == [{'activity': 'meeting'}]
+
+
+def test_aggregates(backend):
+    storage = Storage(backend)
+    assert storage.count() == 11
+    assert storage.count(group_by='activity') == {'sleep': 5, 'work': 5,
+                                                  'meeting': 1}
+    assert storage.total_duration(activity='work') == timedelta(hours=20)
+    assert storage.exists(tag='boss')
+    rollups = storage.get_rollups('day', since=datetime(2014, 1, 3),
+                                  until=datetime(2014, 1, 4))
+    assert [x.duration for x in rollups] == [timedelta(hours=12),
+                                             timedelta(hours=11)]
+    assert storage.get_latest().activity == 'work'
+
+
+def test_update_moves_between_shards(backend):
+    fact = backend.get(datetime(2014, 1, 3, 7, 0))
+    backend.update(fact, {'activity': 'nap'})
+    assert not list(backend.shards['work'].find(activity='meeting'))
+    assert [f.activity for f in backend.shards['home'].find(activity='nap')] == ['nap']
+
+    backend.delete(datetime(2014, 1, 3, 7, 0), 'nap')
+    with pytest.raises(FactNotFound):
+        backend.get(datetime(2014, 1, 3, 7, 0))
+
+
+def test_same_start_time_in_two_shards(backend):
+    since = datetime(2014, 1, 1, 0, 0)
+    backend.add(make_fact(activity='work', since=since,
+                          until=datetime(2014, 1, 1, 1, 0)))
+    work = [f for f in backend.find(since=since, until=since)
+            if f.activity == 'work' and f.since == since]
+    backend.update(work[0], {'description': 'night shift'})
+    [updated] = backend.shards['work'].find(description='night')
+    assert updated.since == since
+    assert backend.shards['home'].get(since).activity == 'sleep'
+
+    backend.delete(since, 'work')
+    assert backend.shards['home'].get(since).activity == 'sleep'
+    with pytest.raises(FactNotFound):
+        backend.delete(since, 'work')
+
+
+def test_close(tmpdir):
+    closed = []
+
+    class Shard(YamlBackend):
+        def close(self):
+            closed.append(self)
+
+    shards = {'home': Shard(str(tmpdir.mkdir('home')),
+                            cache_dir=str(tmpdir.mkdir('cache')))}
+    with ShardedBackend(shards, Router(default='home')) as backend:
+        assert backend.count() == 0
+    assert closed == [shards['home']]
+    with pytest.raises(RuntimeError):
+        backend.count()
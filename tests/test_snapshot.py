@@ -0,0 +1,139 @@
+# coding: utf-8
+
+# python
+from datetime import datetime, timedelta
+import os
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.snapshot import Snapshot, update_snapshot
+from timetra.diary.storage import Storage, StorageError, YamlBackend
+from helpers import make_fact
+
+
+@pytest.fixture
+def backend(tmpdir):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')))
+    for day in range(1, 11):
+        backend.add(make_fact(activity='sleep', category='body',
+                              since=datetime(2014, 1, day, 0, 0),
+                              until=datetime(2014, 1, day, 7, 0)))
+    backend.add(make_fact(activity='walk', tags=['with-dog'],
+                          description='around the lake',
+                          since=datetime(2014, 1, 5, 8, 0),
+                          until=datetime(2014, 1, 5, 9, 0)))
+    return backend
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('snapshot'))
+
+
+def test_round_trip(backend, path):
+    assert update_snapshot(backend, path) == (0, 10)
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 11
+        facts = list(snapshot.find())
+    assert [dict(x) for x in facts] == [dict(x) for x in backend.find()]
+    assert facts[5].description == 'around the lake'
+    assert facts[5].tags == ('with-dog',)
+    assert facts[4].category == 'body'
+
+
+def test_queries(backend, path):
+    update_snapshot(backend, path)
+    storage = Storage(Snapshot(path))
+
+    facts = list(storage.find(since=datetime(2014, 1, 5),
+                              until=datetime(2014, 1, 6)))
+    assert [(f.activity, f.since.day) for f in facts] == [
+        ('sleep', 5), ('walk', 5), ('sleep', 6)]
+    assert [f.since.day for f in storage.find(activity='sleep',
+                                              reverse=True, limit=2)] == [10, 9]
+    assert [dict(x) for x in storage.find(description='lake',
+                                          fields=('activity',))] == [
+        {'activity': 'walk'}]
+
+    assert storage.count(group_by='activity') == {'sleep': 10, 'walk': 1}
+    assert storage.total_duration() == timedelta(hours=71)
+    assert storage.total_duration(tag='dog') == timedelta(hours=1)
+    assert storage.exists(activity='walk')
+    assert storage.get_latest().since == datetime(2014, 1, 10, 0, 0)
+    assert storage.get_known_activities() == [
+        {'activity': 'walk', 'category': None},
+        {'activity': 'sleep', 'category': 'body'}]
+
+    rollups = storage.get_rollups('day', since=datetime(2014, 1, 4),
+                                  until=datetime(2014, 1, 5))
+    assert [x.duration for x in rollups] == [timedelta(hours=7),
+                                             timedelta(hours=8)]
+
+    frame = storage.to_frame(since=datetime(2014, 1, 9))
+    assert frame.sum_by('activity') == {'sleep': 14 * 3600}
+    frame = storage.to_frame(activity='walk')
+    assert frame.sum_by('activity') == {'walk': 3600}
+
+    with pytest.raises(StorageError):
+        storage.add(make_fact(since=datetime(2014, 1, 1, 8, 0)))
+
+
+def test_incremental_update(backend, path):
+    update_snapshot(backend, path)
+    assert update_snapshot(backend, path) == (10, 0)
+
+    day_path = backend.get_file_path_for_day(datetime(2014, 1, 7))
+    backend.add(make_fact(activity='nap', tags=['lazy'],
+                          since=datetime(2014, 1, 7, 14, 0),
+                          until=datetime(2014, 1, 7, 14, 30)))
+    # make sure the change is noticed on filesystems with coarse mtime
+    stat = os.stat(day_path)
+    os.utime(day_path, (stat.st_atime, stat.st_mtime + 1))
+
+    assert update_snapshot(backend, path) == (9, 1)
+    with Snapshot(path) as snapshot:
+        facts = list(snapshot.find())
+    assert [dict(x) for x in facts] == [dict(x) for x in backend.find()]
+    assert [f.tags for f in facts if f.activity != 'sleep'] == [
+        ('with-dog',), ('lazy',)]
+
+
+@pytest.mark.parametrize('period', ['week', 'month'])
+def test_rollups_mid_period(backend, path, period):
+    update_snapshot(backend, path)
+    since = datetime(2014, 1, 8)
+    until = datetime(2014, 1, 9)
+    with Snapshot(path) as snapshot:
+        rollups = snapshot.get_rollups(period, since=since, until=until)
+    expected = backend.get_rollups(period, since=since, until=until)
+    assert rollups == expected
+    assert rollups[0].count == (5 if period == 'week' else 11)
+
+
+def test_unsorted_day_file(backend, path):
+    day_path = backend.get_file_path_for_day(datetime(2014, 1, 5))
+    with open(day_path, 'a') as f:
+        f.write('- activity: nap\n'
+                '  since: 2014-01-05 06:00:00\n'
+                '  until: 2014-01-05 06:30:00\n'
+                '  description: null\n')
+    update_snapshot(backend, path)
+    with Snapshot(path) as snapshot:
+        facts = list(snapshot.find(since=datetime(2014, 1, 5),
+                                   until=datetime(2014, 1, 5)))
+    assert [f.activity for f in facts] == ['sleep', 'nap', 'walk']
+
+
+def test_fact_filed_under_another_day(backend, path):
+    day_path = backend.get_file_path_for_day(datetime(2014, 1, 5))
+    with open(day_path, 'a') as f:
+        f.write('- activity: nap\n'
+                '  since: 2014-01-07 06:00:00\n'
+                '  until: 2014-01-07 06:30:00\n'
+                '  description: null\n')
+    with pytest.raises(StorageError):
+        update_snapshot(backend, path)
+    assert not os.path.exists(path)
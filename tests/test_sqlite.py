@@ -0,0 +1,188 @@
+# coding: utf-8
+
+# python
+import asyncio
+from datetime import datetime, time, timedelta
+import os
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary.aio import AsyncStorage
+from timetra.diary.models import Fact
+from timetra.diary.sharding import Router, ShardedBackend
+from timetra.diary.sqlite import SqliteBackend, import_yaml, export_yaml
+from timetra.diary.storage import FactNotFound, Storage, YamlBackend
+
+
+FACTS = [
+    dict(activity='sleep', category='self-care',
+         since=datetime(2014, 1, 4, 23, 0), until=datetime(2014, 1, 5, 7, 30),
+         description=None, tags=[]),
+    dict(activity='walk', category='errands',
+         since=datetime(2014, 1, 5, 8, 0, 15), until=datetime(2014, 1, 5, 9, 0),
+         description='walked the dog\nin the park', tags=['with-dog', None],
+         hamster_fact_id=44047),
+    dict(activity='timetra',
+         since=datetime(2014, 1, 6, 10, 0, 0, 500),
+         until=datetime(2014, 1, 6, 13, 0), description='Тест'),
+]
+
+
+@pytest.fixture
+def yaml_backend(tmpdir):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')))
+    for data in FACTS:
+        backend.add(Fact(data))
+    return backend
+
+
+@pytest.fixture
+def sqlite_backend(tmpdir, yaml_backend):
+    backend = SqliteBackend(str(tmpdir.join('facts.db')))
+    import_yaml(yaml_backend, backend)
+    return backend
+
+
+def test_wal_mode(sqlite_backend):
+    mode, = sqlite_backend.db.execute('PRAGMA journal_mode').fetchone()
+    assert mode == 'wal'
+
+
+def test_find_same_as_yaml(yaml_backend, sqlite_backend):
+    queries = [
+        {},
+        dict(since=datetime(2014, 1, 5)),
+        dict(until=datetime(2014, 1, 5)),
+        dict(activity='sleep,walk'),
+        dict(activity='-sleep'),
+        dict(description='тест'),
+        dict(tag='dog'),
+        dict(starts_after=time(22, 0), starts_before=time(9, 0)),
+        dict(weekdays=[5]),
+        dict(min_duration=timedelta(hours=3)),
+        dict(max_duration=timedelta(hours=3)),
+        dict(reverse=True, limit=2),
+        dict(offset=1),
+    ]
+    for kwargs in queries:
+        expected = [dict(x) for x in yaml_backend.find(**kwargs)]
+        assert [dict(x) for x in sqlite_backend.find(**kwargs)] == expected, kwargs
+
+
+def test_aggregates(sqlite_backend):
+    storage = Storage(sqlite_backend)
+    assert storage.count() == 3
+    assert storage.count(group_by='activity') == {
+        'sleep': 1, 'walk': 1, 'timetra': 1}
+    assert storage.total_duration(activity='walk') == timedelta(minutes=59,
+                                                                seconds=45)
+    assert storage.exists(tag='dog')
+    assert not storage.exists(tag='cat')
+
+
+def test_crud(sqlite_backend):
+    storage = Storage(sqlite_backend)
+    assert storage.get_latest().activity == 'timetra'
+    assert storage.get(datetime(2014, 1, 5, 8, 0, 15)).activity == 'walk'
+
+    storage.add(Fact(activity='read', since=datetime(2014, 1, 7, 20, 0),
+                     until=datetime(2014, 1, 7, 21, 0), description=None,
+                     tags=['book']))
+    assert storage.get_latest().activity == 'read'
+
+    fact = storage.get(datetime(2014, 1, 7, 20, 0))
+    storage.update(fact, {'activity': 'write'})
+    assert storage.get_latest().activity == 'write'
+    assert list(storage.find(tag='book'))[0].activity == 'write'
+
+    storage.delete(Fact(activity='write', since=datetime(2014, 1, 7, 20, 0)))
+    assert storage.get_latest().activity == 'timetra'
+    assert not storage.exists(tag='book')
+
+    with pytest.raises(FactNotFound):
+        storage.get(datetime(2014, 1, 7, 20, 0))
+
+
+def test_known_activities(sqlite_backend):
+    assert sqlite_backend.get_known_activities() == [
+        {'category': None, 'activity': 'timetra'},
+        {'category': 'errands', 'activity': 'walk'},
+        {'category': 'self-care', 'activity': 'sleep'},
+    ]
+
+
+def read_tree(root):
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def test_round_trip(tmpdir, yaml_backend, sqlite_backend):
+    target = YamlBackend(str(tmpdir.mkdir('exported')),
+                         cache_dir=str(tmpdir.mkdir('cache2')))
+    assert export_yaml(sqlite_backend, target) == len(FACTS)
+
+    original = read_tree(yaml_backend.data_dir)
+    assert len(original) == 3
+    assert read_tree(target.data_dir) == original
+
+
+def test_round_trip_keeps_files_as_they_are(tmpdir, yaml_backend):
+    # an unsorted day file with a fact that belongs to another day
+    day_path = yaml_backend.get_file_path_for_day(datetime(2014, 1, 5))
+    with open(day_path, 'a') as f:
+        f.write('- activity: nap\n'
+                '  since: 2014-01-06 06:00:00\n'
+                '  until: 2014-01-06 06:30:00\n'
+                '  description: null\n'
+                '- activity: tea\n'
+                '  since: 2014-01-05 07:00:00\n'
+                '  until: 2014-01-05 07:15:00\n'
+                '  description: null\n')
+    sqlite_backend = SqliteBackend(str(tmpdir.join('facts.db')))
+    assert import_yaml(yaml_backend, sqlite_backend) == len(FACTS) + 2
+
+    target = YamlBackend(str(tmpdir.mkdir('exported')),
+                         cache_dir=str(tmpdir.mkdir('cache2')))
+    assert export_yaml(sqlite_backend, target) == len(FACTS) + 2
+    assert read_tree(target.data_dir) == read_tree(yaml_backend.data_dir)
+
+    # new facts are filed by date
+    sqlite_backend.add(Fact(activity='x', since=datetime(2014, 1, 5, 9, 0),
+                            until=datetime(2014, 1, 5, 9, 10),
+                            description=None))
+    sqlite_backend.add(Fact(activity='y', since=datetime(2014, 1, 7, 8, 0),
+                            until=datetime(2014, 1, 7, 8, 10),
+                            description=None))
+    assert export_yaml(sqlite_backend, target) == len(FACTS) + 4
+    day_facts = target.get_cached_day_file(day_path.replace(
+        yaml_backend.data_dir, target.data_dir))
+    assert [x.activity for x in day_facts] == ['walk', 'x', 'nap', 'tea']
+    assert [x.activity for x in target.find(since=datetime(2014, 1, 7))] == [
+        'y']
+
+
+def test_threads(tmpdir, sqlite_backend):
+    storage = AsyncStorage(Storage(sqlite_backend))
+
+    async def run():
+        facts = [f async for f in storage.find(activity='sleep,walk')]
+        assert [f.activity for f in facts] == ['sleep', 'walk']
+        await storage.add(Fact(FACTS[0], since=datetime(2014, 2, 1, 23, 0),
+                               until=datetime(2014, 2, 2, 7, 0)))
+        assert await storage.count() == 4
+
+    asyncio.run(run())
+
+    sharded = ShardedBackend({'a': sqlite_backend,
+                              'b': SqliteBackend(str(tmpdir.join('b.db')))},
+                             Router(default='a'))
+    assert sharded.count() == 4
+    sqlite_backend.close()
@@ -0,0 +1,45 @@
+# coding: utf-8
+
+# python
+import subprocess
+import sys
+
+# 3rd-party
+import pytest
+
+try:
+    from timetra.diary import diary
+except ImportError:
+    diary = None
+
+
+CHECK_IMPORTS = '''
+import sys
+from timetra.diary import app, storage
+s = storage.Storage(storage.YamlBackend(sys.argv[1]))
+app._get_command_loaders(s, lambda: s)[None]()
+print(' '.join(sorted(sys.modules)))
+'''
+
+
+def test_client_imports_stdlib_only():
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, timetra.diary.client; print(" ".join(sys.modules))'])
+    modules = output.decode().split()
+    assert 'timetra.diary.client' in modules
+    heavy = ('yaml', 'argh', 'monk', 'timetra.diary.storage')
+    assert not [x for x in modules if x.startswith(heavy)]
+
+
+@pytest.mark.skipif(diary is None, reason='diary dependencies are not installed')
+def test_diary_commands_do_not_import_other_namespaces(tmpdir):
+    output = subprocess.check_output([sys.executable, '-c', CHECK_IMPORTS,
+                                      str(tmpdir)])
+    modules = output.decode().split()
+    assert 'timetra.diary.diary' in modules
+    for name in ('urwid', 'terminaltables', 'colorclass', 'numpy',
+                 'multiprocessing', 'timetra.diary.reporting',
+                 'timetra.diary.timer', 'timetra.diary.curses',
+                 'timetra.diary.watching'):
+        assert name not in modules
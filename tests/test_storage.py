@@ -28,8 +28,11 @@ class MockBackend:
                 return fact
 
     def find(self, since=None, until=None, activity=None, description=None,
-             tag=None):
-        for fact in self.data:
+             tag=None, limit=None, offset=0, reverse=False, fields=None,
+             **criteria):
+        data = list(reversed(self.data)) if reverse else self.data
+        found = 0
+        for fact in data:
             # NOTE: overlapping facts (that partially fit) are not considered matching
             if since and fact.since < since:
                 continue
@@ -41,6 +44,11 @@ class MockBackend:
                 continue
             if tag and tag not in fact.tags:
                 continue
+            found += 1
+            if found <= offset:
+                continue
+            if limit is not None and found > offset + limit:
+                return
             yield fact
 
     def update(self, fact, values):
@@ -150,6 +158,16 @@ class TestStorage:
         xs = list(self.storage.find(tag='in-ekb'))
         assert len(xs) == 2
 
+    def test_find_facts_limit_offset_reverse(self):
+        xs = list(self.storage.find(limit=1))
+        assert [x.activity for x in xs] == ['timetra']
+
+        xs = list(self.storage.find(offset=1))
+        assert [x.activity for x in xs] == ['walk']
+
+        xs = list(self.storage.find(reverse=True, limit=1))
+        assert [x.activity for x in xs] == ['walk']
+
     def test_get_fact_latest(self):
         fact = self.storage.get_latest()
         assert fact.activity == 'walk'
@@ -0,0 +1,115 @@
+# coding: utf-8
+
+# python
+from datetime import datetime
+
+# 3rd-party
+import monk
+import pytest
+
+# this app
+from timetra.diary import models
+from timetra.diary.storage import YamlBackend
+from timetra.diary.validation import CompiledValidator, validate_fact
+
+
+SINCE = datetime(2014, 1, 1, 0, 0)
+UNTIL = datetime(2014, 1, 1, 7, 0)
+
+
+def make_fact(**kwargs):
+    fact = dict(activity='sleep', since=SINCE, until=UNTIL, description=None)
+    fact.update(kwargs)
+    return fact
+
+
+def make_fact_without(key):
+    fact = make_fact(category='body', tags=['a'], hamster_fact_id=1)
+    del fact[key]
+    return fact
+
+
+VALID = [
+    make_fact(),
+    make_fact(description='zzz'),
+    make_fact(category='body', hamster_fact_id=123),
+    make_fact(tags=[]),
+    make_fact(tags=['a', None, 'b']),
+    make_fact_without('category'),
+    make_fact_without('tags'),
+    make_fact_without('hamster_fact_id'),
+    models.Fact(activity='sleep', since=SINCE, until=UNTIL),
+]
+
+INVALID = [
+    None,
+    [],
+    'sleep',
+    {},
+    make_fact(activity=None),
+    make_fact(activity=1),
+    make_fact(since='2014-01-01'),
+    make_fact(until=None),
+    make_fact(category=None),
+    make_fact(description=1),
+    make_fact(hamster_fact_id='1'),
+    make_fact(tags=None),
+    make_fact(tags=('a',)),
+    make_fact(tags=[1]),
+    make_fact(tags=['a', ['b']]),
+    make_fact(extra=1),
+    make_fact(extra=1, activity=None),
+    make_fact_without('activity'),
+    make_fact_without('since'),
+    make_fact_without('description'),
+]
+
+
+@pytest.mark.parametrize('fact', VALID)
+def test_valid(fact):
+    monk.validate(models.fact_schema, fact)
+    assert validate_fact.check(fact)
+    validate_fact(fact)
+
+
+@pytest.mark.parametrize('fact', INVALID)
+def test_invalid_same_error(fact):
+    with pytest.raises(Exception) as expected:
+        monk.validate(models.fact_schema, fact)
+    assert not validate_fact.check(fact)
+    with pytest.raises(type(expected.value)) as error:
+        validate_fact(fact)
+    assert str(error.value) == str(expected.value)
+
+
+def test_unknown_validators():
+    schema = {'count': monk.validators.InRange(1, 10), 'name': str}
+    validate = CompiledValidator(schema)
+    validate({'count': 3, 'name': 'a'})
+    with pytest.raises(monk.ValidationError):
+        validate({'count': 11, 'name': 'a'})
+
+
+def test_trusted(tmpdir):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')), trusted=True)
+    backend.add(models.Fact(activity='sleep', since=SINCE, until=UNTIL))
+    path = backend.get_file_path_for_day(SINCE)
+
+    # break the file behind the backend's back
+    with open(path) as f:
+        text = f.read()
+    with open(path, 'w') as f:
+        f.write(text.replace('description: null\n', ''))
+
+    # the loaded fact is not validated again in trusted mode...
+    backend.add(models.Fact(activity='work', since=datetime(2014, 1, 1, 9),
+                            until=datetime(2014, 1, 1, 13)))
+    # ...but the new one is
+    with pytest.raises(monk.ValidationError):
+        backend.add(make_fact_without('description'))
+
+    backend.trusted = False
+    with pytest.raises(monk.ValidationError):
+        backend.add(models.Fact(activity='walk', since=datetime(2014, 1, 1, 14),
+                                until=datetime(2014, 1, 1, 15)))
@@ -0,0 +1,156 @@
+# coding: utf-8
+
+# python
+from datetime import datetime
+import os
+import threading
+import time
+
+# 3rd-party
+import pytest
+
+# this app
+from timetra.diary import caching, watching
+from timetra.diary.storage import YamlBackend
+from helpers import make_fact
+
+
+inotify = pytest.mark.skipif(watching._libc is None,
+                             reason='inotify is not available')
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.paths = []
+        self.event = threading.Event()
+
+    def __call__(self, path):
+        self.paths.append(path)
+        self.event.set()
+
+    def wait_for(self, path, timeout=5):
+        deadline = time.time() + timeout
+        while path not in self.paths and time.time() < deadline:
+            self.event.wait(0.05)
+            self.event.clear()
+        return path in self.paths
+
+
+@inotify
+def test_inotify(tmpdir):
+    root = tmpdir.mkdir('data')
+    month = root.mkdir('2014').mkdir('01')
+    day = month.join('01.yaml')
+    day.write('[]')
+
+    recorder = Recorder()
+    watcher = watching.InotifyWatcher(str(root), recorder)
+    watcher.start()
+    try:
+        day.write('- x')
+        assert recorder.wait_for(str(day))
+
+        # new directories are watched as well
+        new_day = root.mkdir('2015').mkdir('02').join('03.yaml')
+        new_day.write('[]')
+        assert recorder.wait_for(str(new_day))
+        recorder.paths.clear()
+        new_day.write('- y')
+        assert recorder.wait_for(str(new_day))
+
+        day.remove()
+        assert recorder.wait_for(str(day))
+    finally:
+        watcher.stop()
+
+
+@inotify
+def test_inotify_sync(tmpdir):
+    root = tmpdir.mkdir('data')
+    day = root.mkdir('2014').mkdir('01').join('01.yaml')
+    day.write('[]')
+
+    recorder = Recorder()
+    watcher = watching.InotifyWatcher(str(root), recorder)
+    watcher.start()
+    try:
+        # only `sync()` handles the events now
+        watcher._stopped.set()
+        watcher._thread.join()
+        assert not watcher.sync()
+        day.write('- x')
+        assert watcher.sync()
+        assert set(recorder.paths) == {str(day)}
+        assert not watcher.sync()
+    finally:
+        watcher.stop()
+    assert not watcher.sync()
+
+
+def test_polling(tmpdir):
+    root = tmpdir.mkdir('data')
+    day = root.mkdir('2014').mkdir('01').join('01.yaml')
+    day.write('[]')
+
+    recorder = Recorder()
+    watcher = watching.PollingWatcher(str(root), recorder, interval=60)
+    watcher.start()
+    try:
+        watcher.check()
+        assert recorder.paths == []
+        os.utime(str(day), (0, 0))
+        other = day.dirpath().join('02.yaml')
+        other.write('[]')
+        watcher.check()
+        assert recorder.paths == [str(day), str(other)]
+    finally:
+        watcher.stop()
+
+
+@inotify
+def test_backend(tmpdir, monkeypatch):
+    backend = YamlBackend(str(tmpdir.mkdir('data')),
+                          cache_dir=str(tmpdir.mkdir('cache')), watch=True)
+    try:
+        assert backend.cache.watched
+        backend.add(make_fact(hour=0))
+        assert [x.activity for x in backend.find()] == ['sleep']
+
+        # known files are not stat'ed again
+        stats = []
+        real_stat = os.stat
+
+        def stat(path, *args, **kwargs):
+            if str(path).endswith('.yaml'):
+                stats.append(path)
+            return real_stat(path, *args, **kwargs)
+
+        monkeypatch.setattr(caching.os, 'stat', stat)
+        assert [x.activity for x in backend.find()] == ['sleep']
+        assert stats == []
+
+        # own writes are seen at once
+        backend.add(make_fact(hour=5, category='body'))
+        assert [x.since.hour for x in backend.find()] == [0, 5]
+
+        # external edits are seen as soon as they are reported
+        path = backend.get_file_path_for_day(datetime(2014, 1, 1))
+        recorder = Recorder()
+        backend.watcher.callback = lambda path: (
+            backend.cache.mark_dirty(path), recorder(path))
+        with open(path, 'w') as f:
+            f.write('[]\n')
+        assert recorder.wait_for(path)
+        assert list(backend.find()) == []
+
+        # ...or at once if the backend is synced before the read
+        with open(path, 'w') as f:
+            f.write('- activity: nap\n'
+                    '  since: 2014-01-01 02:00:00\n'
+                    '  until: 2014-01-01 03:00:00\n')
+        backend.sync()
+        assert [x.activity for x in backend.find()] == ['nap']
+    finally:
+        backend.unwatch()
+    assert not backend.cache.watched
@@ -333,3 +333,11 @@ def test_parse_bounds_for_a_date_in_the_past():
     # `delta` = `delta..`
     assert f('+5', last) == (d(2014,1,30, 22,21), now)
     assert f('-5', last) == (d(2014,1,31, 19,47), now)
+
+
+def test_parse_weekdays():
+    assert utils.parse_weekdays('mo') == [0]
+    assert utils.parse_weekdays('sa,su') == [5, 6]
+    assert utils.parse_weekdays('Sat, Sun') == [5, 6]
+    with pytest.raises(ValueError):
+        utils.parse_weekdays('xx')
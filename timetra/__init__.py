@@ -1 +1,3 @@
-__import__('pkg_resources').declare_namespace(__name__)
+# a pkgutil-style namespace package: `pkg_resources` takes longer to import
+# than the client (see `timetra.diary.client`) may spend on its whole startup
+__path__ = __import__('pkgutil').extend_path(__path__, __name__)
@@ -0,0 +1,136 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Async storage
+=============
+
+An `asyncio` facade for :class:`~timetra.diary.storage.Storage`.  Blocking
+work (file access, YAML parsing, index updates) runs in an executor, so the
+event loop stays responsive.
+
+Reads may run concurrently; concurrent loads of the same day file are
+coalesced by the cache (see :meth:`~timetra.diary.caching.Cache.get_cached_yaml_file`).
+Writes are serialized.
+
+Usage::
+
+    storage = AsyncStorage(Storage(backend))
+    async for fact in storage.find(activity='sleep', reverse=True, limit=3):
+        print(fact.since)
+"""
+import asyncio
+import functools
+import itertools
+import threading
+
+from .storage import FactNotFound
+
+
+__all__ = ['AsyncStorage']
+
+
+def _take(iterator, count, lock):
+    with lock:
+        return list(itertools.islice(iterator, count))
+
+
+def _close(iterator, lock):
+    # waits for the batch being read if the consumer was cancelled
+    with lock:
+        iterator.close()
+
+
+class AsyncStorage(object):
+    """
+    :param storage: a :class:`~timetra.diary.storage.Storage` instance.
+    :param executor: a `concurrent.futures.Executor`; the default executor
+        of the event loop is used if omitted.
+    :param batch_size: number of facts fetched by `find()` per executor
+        call.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self, storage, executor=None, batch_size=BATCH_SIZE):
+        self.storage = storage
+        self.executor = executor
+        self.batch_size = batch_size
+        self._write_lock = asyncio.Lock()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    async def find(self, **kwargs):
+        """
+        Async generator yielding facts; accepts the same arguments as
+        :meth:`~timetra.diary.storage.Storage.find`.
+        """
+        facts = await self._run(self.storage.find, **kwargs)
+        lock = threading.Lock()
+        try:
+            while True:
+                batch = await self._run(_take, facts, self.batch_size, lock)
+                for fact in batch:
+                    yield fact
+                if len(batch) < self.batch_size:
+                    return
+        finally:
+            if hasattr(facts, 'close'):
+                await self._run(_close, facts, lock)
+
+    async def get(self, date_time):
+        return await self._run(self.storage.get, date_time)
+
+    async def get_latest(self):
+        """
+        Returns the latest fact.  Raises
+        :class:`~timetra.diary.storage.FactNotFound` if there are no facts.
+        """
+        return await self._run(self._get_latest)
+
+    def _get_latest(self):
+        try:
+            return self.storage.get_latest()
+        except StopIteration:
+            # cannot be passed through a future
+            raise FactNotFound('the storage is empty')
+
+    async def count(self, **kwargs):
+        return await self._run(self.storage.count, **kwargs)
+
+    async def total_duration(self, **kwargs):
+        return await self._run(self.storage.total_duration, **kwargs)
+
+    async def exists(self, **kwargs):
+        return await self._run(self.storage.exists, **kwargs)
+
+    async def add(self, fact):
+        async with self._write_lock:
+            return await self._run(self.storage.add, fact)
+
+    async def update(self, fact, values):
+        async with self._write_lock:
+            return await self._run(self.storage.update, fact, values)
+
+    async def delete(self, spec):
+        async with self._write_lock:
+            return await self._run(self.storage.delete, spec)
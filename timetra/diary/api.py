@@ -0,0 +1,684 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+HTTP API
+========
+
+A local HTTP server for dashboards and editor plugins.  It keeps one
+:class:`~timetra.diary.storage.Storage` (and thus its caches and indexes)
+warm for all clients.  Start it with::
+
+    $ timetra-diary daemon http --port 8421
+
+Dates and times are ISO 8601 strings, durations are numbers of seconds.
+Lists are streamed as NDJSON (``application/x-ndjson``, one JSON object per
+line) as they are read; other responses are single JSON objects.  Errors are
+reported as ``{"error": message}`` with a 4xx/5xx status, or as the last
+line of a stream if they happen while it is being sent.
+
+Facts:
+
+``GET /facts``
+    Facts matching the query string: `since`, `until` (``YYYY-MM-DD`` or
+    date and time), `activity`, `description`, `tag` (patterns as in
+    ``find``), `starts_after`, `starts_before` (``HH:MM``), `weekdays`
+    (``sa,su``), `min_duration`, `max_duration` (``H:MM``), `limit`,
+    `offset` and `reverse` (``1``).
+``GET /facts/latest``, ``GET /facts/<since>``
+    A single fact.
+``POST /facts``
+    Adds the fact given in the JSON body.
+``PATCH /facts/<since>``
+    Updates the fact with the values given in the JSON body.
+
+Reports (`activity` defaults to ``sleep``):
+
+``GET /reports/drift?activity=&days=7``
+    Per day: time spent in each hour, total, number of facts, first start
+    and last end.
+``GET /reports/weekly?activity=&weeks=4``
+    Per week: average and total daily duration.
+``GET /reports/predict?activity=``
+    Expected start, end and duration of the next occurrence, or `null`.
+
+Aggregates (same query as ``/facts``):
+
+``GET /aggregates/count?group_by=``, ``GET /aggregates/duration``
+    The number and total duration of matching facts.
+``GET /aggregates/rollups?period=day``
+    Duration and number of facts per hour, day, week or month; filtered by
+    `since`, `until`, `activity`, `category` and `tag`.
+
+Identical GET requests which arrive before the first one starts sending its
+result share it instead of querying the storage again.
+"""
+import asyncio
+import datetime
+import functools
+import json
+import logging
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from monk.errors import ValidationError
+
+from . import models, utils
+from .aio import AsyncStorage
+from .storage import FactNotFound, StorageError
+
+
+__all__ = ['Server', 'serve', 'DEFAULT_HOST', 'DEFAULT_PORT']
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8421
+
+MAX_BODY_SIZE = 1024 * 1024
+
+JSON = 'application/json'
+NDJSON = 'application/x-ndjson'
+
+REASONS = {
+    200: 'OK',
+    201: 'Created',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError('cannot encode {0!r}'.format(obj))
+
+
+def encode(obj):
+    "Returns given object as a line of JSON (bytes)."
+    return json.dumps(obj, default=_default,
+                      ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def fact_to_json(fact):
+    data = dict(fact)
+    data['duration'] = fact.duration
+    return data
+
+
+def _parse_date_time(value):
+    if len(value) == 10:
+        return utils.parse_date(value)
+    return datetime.datetime.fromisoformat(value)
+
+
+def _parse_time(value):
+    return datetime.time(*utils.split_time(value))
+
+
+def _parse_flag(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+CRITERIA = {
+    'since': _parse_date_time,
+    'until': _parse_date_time,
+    'activity': str,
+    'description': str,
+    'tag': str,
+    'starts_after': _parse_time,
+    'starts_before': _parse_time,
+    'weekdays': utils.parse_weekdays,
+    'min_duration': utils.parse_delta,
+    'max_duration': utils.parse_delta,
+}
+""" Query string parameters accepted as `find()` criteria, with parsers.
+"""
+
+
+def _parse_params(params, parsers, required=()):
+    "Returns a dictionary of parsed values; raises :class:`HTTPError`."
+    unknown = set(params) - set(parsers)
+    if unknown:
+        raise HTTPError(400, 'unknown parameters: {0}'.format(
+            ', '.join(sorted(unknown))))
+    missing = set(required) - set(params)
+    if missing:
+        raise HTTPError(400, 'missing parameters: {0}'.format(
+            ', '.join(sorted(missing))))
+    values = {}
+    for key, value in params.items():
+        try:
+            values[key] = parsers[key](value)
+        except Exception as e:
+            raise HTTPError(400, 'bad value for "{0}": {1}'.format(key, e))
+    return values
+
+
+def _parse_fact_values(data):
+    "Returns fact fields from a JSON object; raises :class:`HTTPError`."
+    if not isinstance(data, dict):
+        raise HTTPError(400, 'expected a JSON object')
+    unknown = set(data) - set(models.FactRecord.FIELDS)
+    if unknown:
+        raise HTTPError(400, 'unknown fields: {0}'.format(
+            ', '.join(sorted(unknown))))
+    values = dict(data)
+    for key in ('since', 'until'):
+        if values.get(key) is not None:
+            try:
+                values[key] = datetime.datetime.fromisoformat(values[key])
+            except (TypeError, ValueError) as e:
+                raise HTTPError(400, 'bad value for "{0}": {1}'.format(
+                    key, e))
+    return values
+
+
+def _error_status(error):
+    if isinstance(error, HTTPError):
+        return error.status
+    if isinstance(error, FactNotFound):
+        return 404
+    if isinstance(error, StorageError):
+        return 409
+    if isinstance(error, (ValueError, AssertionError, ValidationError)):
+        return 400
+    return 500
+
+
+def _drift_rows(storage, activity, days):
+    from .reporting.drift import collect_drift_data
+    dates = collect_drift_data(storage, activity=activity, span_days=days)
+    return [{
+        'date': date,
+        'hours': [x.duration for x in dates[date]],
+        'duration': dates[date].duration,
+        'facts': dates[date].fact_cnt,
+        'start': dates[date].min_start,
+        'end': dates[date].max_end,
+    } for date in sorted(dates)]
+
+
+def _weekly_rows(storage, activity, weeks):
+    from .reporting.drift import collect_weekly_averages
+    return [{
+        'since': since,
+        'until': until,
+        'average': average,
+        'total': total,
+        'days': days,
+    } for since, until, average, total, days
+        in collect_weekly_averages(storage, activity, weeks)]
+
+
+def _predict(storage, activity):
+    from .reporting.prediction import predict_next_occurence
+    return predict_next_occurence(storage, activity)
+
+
+def _rollup_rows(storage, period, **kwargs):
+    return [{'period': x.period, 'duration': x.duration, 'count': x.count}
+            for x in storage.get_rollups(period, **kwargs)]
+
+
+class _Broadcast(object):
+    """
+    Produces the chunks of a response once and sends them to each reader.
+
+    Readers may only join before the first chunk is produced.  Chunks are
+    dropped as soon as every reader has got them; production waits while
+    the slowest reader is `MAX_PENDING` chunks behind and stops if all
+    readers leave.
+    """
+    MAX_PENDING = 16
+
+    def __init__(self, chunks):
+        self.chunks = []
+        # position of `chunks[0]` in the response
+        self.offset = 0
+        self.done = False
+        self.error = None
+        # set if the response may predate a write (see `Server._respond`)
+        self.stale = False
+        # `{reader: position}`
+        self._positions = {}
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._produce(chunks))
+
+    @property
+    def produced(self):
+        return self.offset + len(self.chunks)
+
+    @property
+    def joinable(self):
+        return not (self.produced or self.done or self.stale)
+
+    def join(self):
+        "Returns an async iterator over the chunks for a new reader."
+        reader = object()
+        self._positions[reader] = 0
+        return self._read(reader)
+
+    def _trim(self):
+        "Drops chunks which every reader has got."
+        low = min(self._positions.values(), default=self.produced)
+        del self.chunks[:low - self.offset]
+        self.offset = low
+
+    async def _produce(self, chunks):
+        try:
+            async for chunk in chunks:
+                async with self._changed:
+                    await self._changed.wait_for(
+                        lambda: (len(self.chunks) < self.MAX_PENDING or
+                                 not self._positions))
+                    if not self._positions:
+                        # nobody is listening anymore
+                        break
+                    self.chunks.append(chunk)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            await chunks.aclose()
+            self.done = True
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def _read(self, reader):
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(
+                        lambda: (self._positions[reader] < self.produced or
+                                 self.done))
+                    pos = self._positions[reader]
+                    chunks = self.chunks[pos - self.offset:]
+                    self._positions[reader] = self.produced
+                    self._trim()
+                    self._changed.notify_all()
+                for chunk in chunks:
+                    yield chunk
+                if self.done and self._positions[reader] == self.produced:
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            del self._positions[reader]
+            self._trim()
+            async with self._changed:
+                self._changed.notify_all()
+
+
+class Server(object):
+    """
+    :param storage: a :class:`~timetra.diary.storage.Storage` or
+        :class:`~timetra.diary.aio.AsyncStorage` instance.
+    :param port: use `0` to pick a free port (see `port` after `start()`).
+    :param sync: a callable which makes the storage aware of changes made to
+        its files so far and returns `True` if there were any (see
+        :func:`timetra.diary.daemon.watching`); called before each request.
+    """
+
+    def __init__(self, storage, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 sync=None):
+        if not isinstance(storage, AsyncStorage):
+            storage = AsyncStorage(storage)
+        self.storage = storage
+        self.host = host
+        self.port = port
+        self.sync = sync
+        self._server = None
+        # `{(path, query): _Broadcast}` for GET requests being answered
+        self._inflight = {}
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        log.info('listening on http://%s:%s', self.host, self.port)
+        await self._server.serve_forever()
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.storage.executor, functools.partial(func, *args, **kwargs))
+
+    #--- HTTP
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                method, target, body = await self._read_request(reader)
+            except HTTPError as e:
+                await self._send(writer, e.status, JSON,
+                                 encode({'error': str(e)}))
+                return
+            await self._respond(writer, method, target, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            log.debug('client went away')
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400, 'malformed request line')
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    raise HTTPError(400, 'bad Content-Length')
+        if MAX_BODY_SIZE < length:
+            raise HTTPError(413, 'the body is too large')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, body
+
+    async def _send(self, writer, status, content_type, body):
+        writer.write(self._head(status, content_type,
+                                'Content-Length: {0}'.format(len(body))))
+        writer.write(body)
+        await writer.drain()
+
+    def _head(self, status, content_type, *headers):
+        lines = ['HTTP/1.1 {0} {1}'.format(status, REASONS[status]),
+                 'Content-Type: {0}; charset=utf-8'.format(content_type),
+                 'Connection: close']
+        lines.extend(headers)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _respond(self, writer, method, target, body):
+        if self.sync is not None and self.sync():
+            self._mark_stale()
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        try:
+            content_type, chunks = self._route(method, url.path, params,
+                                               body)
+        except Exception as e:
+            await self._send_error(writer, e)
+            return
+
+        if method == 'GET':
+            key = url.path, tuple(sorted(params.items()))
+            broadcast = self._inflight.get(key)
+            if broadcast is None or not broadcast.joinable:
+                broadcast = self._inflight[key] = _Broadcast(chunks)
+                broadcast.task.add_done_callback(
+                    lambda _: self._forget(key, broadcast))
+            chunks = broadcast.join()
+        else:
+            self._mark_stale()
+
+        chunks = chunks.__aiter__()
+        try:
+            await self._stream(writer, method, target, content_type, chunks)
+        finally:
+            # stops the broadcast or the query if the client went away
+            await chunks.aclose()
+
+    async def _stream(self, writer, method, target, content_type, chunks):
+        # nothing is sent until the first chunk, so that errors raised
+        # before it get a proper status
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = b''
+        except Exception as e:
+            await self._send_error(writer, e)
+            return
+
+        status = 201 if method == 'POST' else 200
+        writer.write(self._head(status, content_type,
+                                'Transfer-Encoding: chunked'))
+        self._write_chunk(writer, first)
+        try:
+            async for chunk in chunks:
+                self._write_chunk(writer, chunk)
+                await writer.drain()
+        except Exception as e:
+            if _error_status(e) == 500:
+                log.exception('failed to stream %s', target)
+            self._write_chunk(writer, encode({'error': str(e)}))
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    def _write_chunk(self, writer, data):
+        if data:
+            writer.write('{0:x}\r\n'.format(len(data)).encode('ascii'))
+            writer.write(data)
+            writer.write(b'\r\n')
+
+    async def _send_error(self, writer, error):
+        status = _error_status(error)
+        if status == 500:
+            log.exception('request failed', exc_info=error)
+        await self._send(writer, status, JSON, encode({'error': str(error)}))
+
+    def _mark_stale(self):
+        # results being produced may predate the change
+        for broadcast in self._inflight.values():
+            broadcast.stale = True
+
+    def _forget(self, key, broadcast):
+        if self._inflight.get(key) is broadcast:
+            del self._inflight[key]
+
+    def _route(self, method, path, params, body):
+        """
+        Returns `(content_type, chunks)` where `chunks` is an async iterator
+        of encoded response lines.  Raises :class:`HTTPError` if the request
+        is invalid.
+        """
+        parts = [unquote(x) for x in path.strip('/').split('/')]
+        args = []
+        if parts[0] == 'facts' and len(parts) <= 2:
+            if len(parts) == 1:
+                handlers = {'GET': self.find, 'POST': self.add}
+            elif parts[1] == 'latest':
+                handlers = {'GET': self.get_latest}
+            else:
+                handlers = {'GET': self.get, 'PATCH': self.update}
+                args.append(parts[1])
+        elif len(parts) == 2 and parts[0] == 'reports':
+            handlers = {'GET': {
+                'drift': self.drift,
+                'weekly': self.weekly,
+                'predict': self.predict,
+            }.get(parts[1])}
+        elif len(parts) == 2 and parts[0] == 'aggregates':
+            handlers = {'GET': {
+                'count': self.count,
+                'duration': self.duration,
+                'rollups': self.rollups,
+            }.get(parts[1])}
+        else:
+            handlers = {}
+        if not any(handlers.values()):
+            raise HTTPError(404, 'no such resource: {0}'.format(path))
+        if method not in handlers:
+            raise HTTPError(405, '{0} is not allowed here'.format(method))
+        if method in ('POST', 'PATCH'):
+            try:
+                args.append(json.loads(body.decode('utf-8')))
+            except ValueError as e:
+                raise HTTPError(400, 'malformed JSON: {0}'.format(e))
+        return handlers[method](params, *args)
+
+    #--- resources
+
+    async def _one(self, func, *args, **kwargs):
+        result = await func(*args, **kwargs)
+        yield encode(result)
+
+    async def _lines(self, func, *args, **kwargs):
+        for row in await self._call(func, *args, **kwargs):
+            yield encode(row)
+
+    async def _facts(self, criteria):
+        facts = self.storage.find(**criteria)
+        try:
+            batch = []
+            async for fact in facts:
+                batch.append(encode(fact_to_json(fact)))
+                if len(batch) >= self.storage.batch_size:
+                    yield b''.join(batch)
+                    batch = []
+            if batch:
+                yield b''.join(batch)
+        finally:
+            await facts.aclose()
+
+    def find(self, params):
+        parsers = dict(CRITERIA, limit=int, offset=int, reverse=_parse_flag)
+        return NDJSON, self._facts(_parse_params(params, parsers))
+
+    def get(self, params, since):
+        _parse_params(params, {})
+        try:
+            since = datetime.datetime.fromisoformat(since)
+        except ValueError as e:
+            raise HTTPError(400, 'bad date and time: {0}'.format(e))
+        return JSON, self._one(self._get, since)
+
+    async def _get(self, since):
+        return fact_to_json(await self.storage.get(since))
+
+    def get_latest(self, params):
+        _parse_params(params, {})
+        return JSON, self._one(self._get_latest)
+
+    async def _get_latest(self):
+        return fact_to_json(await self.storage.get_latest())
+
+    def add(self, params, data):
+        _parse_params(params, {})
+        values = _parse_fact_values(data)
+        if not values.get('activity') or not values.get('since'):
+            raise HTTPError(400, '"activity" and "since" are required')
+        fact = dict(until=None, description=None, tags=[])
+        fact.update(values)
+        fact = models.Fact(fact)
+        return JSON, self._one(self._add, fact)
+
+    async def _add(self, fact):
+        await self.storage.add(fact)
+        return fact_to_json(fact)
+
+    def update(self, params, since, data):
+        _parse_params(params, {})
+        try:
+            since = datetime.datetime.fromisoformat(since)
+        except ValueError as e:
+            raise HTTPError(400, 'bad date and time: {0}'.format(e))
+        values = _parse_fact_values(data)
+        if not values:
+            raise HTTPError(400, 'nothing to update')
+        return JSON, self._one(self._update, since, values)
+
+    async def _update(self, since, values):
+        fact = await self.storage.get(since)
+        await self.storage.update(fact, values)
+        return fact_to_json(models.Fact(fact, **values))
+
+    def drift(self, params):
+        params = _parse_params(params, {'activity': str, 'days': int})
+        return NDJSON, self._lines(_drift_rows, self.storage.storage,
+                                   params.get('activity', 'sleep'),
+                                   params.get('days', 7))
+
+    def weekly(self, params):
+        params = _parse_params(params, {'activity': str, 'weeks': int})
+        return NDJSON, self._lines(_weekly_rows, self.storage.storage,
+                                   params.get('activity', 'sleep'),
+                                   params.get('weeks', 4))
+
+    def predict(self, params):
+        params = _parse_params(params, {'activity': str})
+        return JSON, self._one(self._call, _predict, self.storage.storage,
+                               params.get('activity', 'sleep'))
+
+    def count(self, params):
+        criteria = _parse_params(params, dict(CRITERIA, group_by=str))
+        group_by = criteria.pop('group_by', None)
+        return JSON, self._one(self._count, group_by, criteria)
+
+    async def _count(self, group_by, criteria):
+        result = await self.storage.count(group_by=group_by, **criteria)
+        if group_by is None:
+            return {'count': result}
+        return {'counts': result}
+
+    def duration(self, params):
+        criteria = _parse_params(params, CRITERIA)
+        return JSON, self._one(self._duration, criteria)
+
+    async def _duration(self, criteria):
+        return {'duration': await self.storage.total_duration(**criteria)}
+
+    def rollups(self, params):
+        parsers = {'period': str, 'since': _parse_date_time,
+                   'until': _parse_date_time, 'activity': str,
+                   'category': str, 'tag': str}
+        kwargs = _parse_params(params, parsers, required=['period'])
+        return NDJSON, self._lines(_rollup_rows, self.storage.storage,
+                                   kwargs.pop('period'), **kwargs)
+
+
+def serve(storage, host=DEFAULT_HOST, port=DEFAULT_PORT, sync=None):
+    "Serves the API until interrupted."
+    server = Server(storage, host, port, sync=sync)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -28,65 +28,166 @@ Timetra Application
 :author: Andrey Mikhaylenko
 
 """
+from collections import OrderedDict
 import logging
 import os
+import sys
 
 import argh
+from argh.constants import ATTR_NAME
 import yaml
 
 from .storage import Storage, YamlBackend
 
-from .diary import Diary
-from .reporting import Reporting
-from .timer import Timing
-from .curses import TUI
-#from .cli_old import LegacyCLI
-
-
-logging.basicConfig(level=logging.INFO)
+# Command modules (and their dependencies: urwid, terminaltables, etc.) are
+# imported by the `_get_*_commands()` functions only when needed.
 
 
 CONF_FILE = os.getenv('TIMETRA_DIARY_CONFIG', 'conf.yaml')
 
 
-def _init_storage():
+def _load_conf():
     with open(CONF_FILE) as f:
-        conf = yaml.load(f)
-    backend = YamlBackend(**conf['backend'])
-    storage = Storage(backend)
-    return storage
+        return yaml.load(f, Loader=yaml.Loader)
 
 
-def main():
-    storage = _init_storage()
+def _init_storage(conf):
+    storage = Storage(_init_backend(conf['backend']))
+    return storage
 
-    p = argh.ArghParser()
 
-    diary = Diary({'storage': storage})
+def _init_backend(backend_conf):
+    backend_conf = dict(backend_conf)
+    backend_type = backend_conf.pop('type', 'yaml')
+    if backend_type == 'sqlite':
+        from .sqlite import SqliteBackend
+        return SqliteBackend(**backend_conf)
+    if backend_type == 'sharded':
+        from .sharding import Router, ShardedBackend
+        shards = OrderedDict((name, _init_backend(shard_conf))
+                             for name, shard_conf
+                             in backend_conf['shards'].items())
+        router = Router(backend_conf.get('routes', ()),
+                        default=backend_conf.get('default', next(iter(shards))))
+        return ShardedBackend(shards, router)
+    return YamlBackend(**backend_conf)
+
+
+def _init_reporting_storage(conf, storage):
+    """
+    Returns the storage for reports: a read-only snapshot (refreshed on the
+    fly) if `snapshot` is set in the configuration, otherwise the main
+    storage.
+    """
+    path = conf.get('snapshot')
+    if not path or not isinstance(storage.backend, YamlBackend):
+        return storage
+    from .snapshot import Snapshot, update_snapshot
+    path = os.path.expanduser(path)
+    update_snapshot(storage.backend, path)
+    return Storage(Snapshot(path))
+
+
+def _get_diary_commands(storage):
+    from .diary import Diary
+    return Diary({'storage': storage}).commands
+
+
+def _get_report_commands(storage):
+    from .reporting import Reporting
     reporting = Reporting({'storage': storage})
+    return [
+        reporting.drift,
+        reporting.weekly,
+        reporting.predict,
+    ]
+
+
+def _get_timing_commands(storage):
+    from .timer import Timing
     timing = Timing({'storage': storage})
+    return [
+        timing.pomodoro,
+    ]
+
+
+def _get_tui_commands(storage):
+    from .curses import TUI
     tui = TUI({'storage': storage})
-    #old_cli = LegacyCLI({'storage': storage})
-
-    command_tree = {
-        None: diary.commands,
-        'report': [
-            reporting.drift,
-            reporting.weekly,
-            reporting.predict,
-        ],
-        'timing': [
-            timing.pomodoro,
-        ],
-        'tui': [
-            tui.run,
-        ],
-        #'old':    old_cli.commands,
-    }
-    for namespace, commands in command_tree.items():
-        p.add_commands(commands, namespace=namespace)
-
-    p.dispatch()
+    return [
+        tui.run,
+    ]
+
+
+def _get_command_loaders(storage, get_reporting_storage):
+    """
+    Returns a `{namespace: loader}` dictionary; each loader returns the
+    commands of its namespace.  `get_reporting_storage` is only called if
+    the reports are needed.
+    """
+    return OrderedDict([
+        (None, lambda: _get_diary_commands(storage)),
+        ('report', lambda: _get_report_commands(get_reporting_storage())),
+        ('timing', lambda: _get_timing_commands(storage)),
+        ('tui', lambda: _get_tui_commands(storage)),
+        #('old', lambda: LegacyCLI({'storage': storage}).commands),
+    ])
+
+
+def _get_command_name(function):
+    return getattr(function, ATTR_NAME, function.__name__.replace('_', '-'))
+
+
+def _make_parser(loaders, argv=None):
+    """
+    Returns a parser with the commands needed to dispatch `argv`: only the
+    namespace it refers to is loaded.  All namespaces are loaded for help
+    (e.g. ``timetra-diary -h``), shell completion, unknown commands and if
+    `argv` is `None`.
+    """
+    first = argv[0] if argv else None
+    if os.getenv('_ARGCOMPLETE') or not first or first.startswith('-'):
+        wanted = None
+    elif first in loaders:
+        wanted = [first]
+    else:
+        # presumably a command without namespace
+        wanted = [None]
+
+    p = argh.ArghParser()
+    for namespace, load in loaders.items():
+        if wanted is None or namespace in wanted:
+            commands = load()
+            p.add_commands(commands, namespace=namespace)
+            if namespace is None and wanted == [None] and first not in [
+                    _get_command_name(x) for x in commands]:
+                wanted = None
+    return p
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    conf = _load_conf()
+    storage = _init_storage(conf)
+
+    loaders = _get_command_loaders(
+        storage, lambda: _init_reporting_storage(conf, storage))
+
+    def get_daemon_commands():
+        from .daemon import Daemon
+        # the daemon lives longer than a snapshot is fresh, so its reports
+        # are built from the main storage (which it keeps cached)
+        make_parser = lambda: _make_parser(
+            _get_command_loaders(storage, lambda: storage))
+        return Daemon(storage, os.path.abspath(CONF_FILE),
+                      make_parser).commands
+
+    loaders['daemon'] = get_daemon_commands
+
+    argv = sys.argv[1:]
+    p = _make_parser(loaders, argv)
+    p.dispatch(argv=argv)
 
 
 if __name__ == '__main__':
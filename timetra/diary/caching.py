@@ -1,83 +1,271 @@
 # coding: utf-8
+from collections import OrderedDict
+from concurrent import futures
 import logging
 import os
 import shelve
+import threading
+
+try:
+    import fcntl
+except ImportError:     # not on POSIX
+    fcntl = None
 
 import yaml
 from monk import ValidationError, validate
 
+from .loader import DayFileLoader
+
 
-__all__ = ['Cache']
+__all__ = ['Cache', 'load_object_list']
 
 
 log = logging.getLogger(__name__)
 
 
+def load_object_list(path, model, loader=DayFileLoader):
+    "Yields validated `model` instances from given YAML file."
+    with open(path) as f:
+        try:
+            items = yaml.load(f, Loader=loader)
+        except:
+            print('FAILED to load', model, 'from', path)
+            raise
+
+    if not items:
+        return
+
+    for data in items:
+        obj = model(data)
+
+        try:
+            validate(model, obj)
+        except (ValidationError, TypeError) as e:
+            raise type(e)('{path}: {e}'.format(path=path, e=e))
+
+        yield obj
+
+
 class Cache:
+    """
+    Day files and their indexes, kept in a shelve and (recently used ones)
+    in memory.
+
+    Only one process at a time uses the shelve: it is locked for the
+    lifetime of the object (or until :meth:`close`).  Other processes, e.g.
+    commands run locally while the daemon is running, get a private
+    in-memory cache instead of opening the file concurrently.
+    """
     APP_NAME = 'timetra-diary'
     FILE_NAME = 'yaml_files.db'
+    # number of day files kept in memory in addition to the shelve
+    MEMORY_SIZE = 1024
 
-    def __init__(self, root_dir=None):
+    def __init__(self, root_dir=None, loader=DayFileLoader):
         cache_dir = root_dir or self._make_xdg_dir()
         path = cache_dir + '/' + self.FILE_NAME
 
-        if not os.path.exists(path):
-            log.info('Creating cache database...')
-
-        try:
-            db = shelve.open(path, protocol=-1)
-        except:
-            log.warn('Could not load cache, recreating...')
-            os.remove(path)
-            db = shelve.open(path, protocol=-1)
+        self._lock_file = self._acquire(path)
+        if self._lock_file is None:
+            log.info('Cache is in use by another process, not sharing it')
+            db = {}
+        else:
+            if not os.path.exists(path):
+                log.info('Creating cache database...')
+            try:
+                db = shelve.open(path, protocol=-1)
+            except:
+                # nobody else has it open: it is safe to start over
+                log.warn('Could not load cache, recreating...')
+                os.remove(path)
+                db = shelve.open(path, protocol=-1)
 
         self.path = path
         self.db = db
+        self.loader = loader
+        # the shelve is not thread-safe (see `timetra.diary.prefetch`)
+        self.lock = threading.RLock()
+        # `{path: future}` for day files being loaded
+        self._pending = {}
+        # `{(model, path): (mtime, objects)}`, least recently used first
+        self._memory = OrderedDict()
+        # set if an instant watcher reports changes (see `mark_dirty`);
+        # readers sync the watcher first
+        self.watched = False
+        # `{path: mtime}` for files not changed since they were stat'ed
+        self._clean = {}
+        # incremented on each change reported by the watcher
+        self._generation = 0
+
+    def _acquire(self, path):
+        """
+        Returns the open lock file of the shelve at given path, or `None` if
+        another process holds the lock.
+        """
+        lock_file = open(path + '.lock', 'a')
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    @property
+    def persistent(self):
+        "`True` if the shelve is used (see the class docs)."
+        return self._lock_file is not None
+
+    def close(self):
+        "Closes the shelve and releases its lock."
+        with self.lock:
+            if self.persistent:
+                self.db.close()
+                self._lock_file.close()
+                self._lock_file = None
+            self.db = {}
 
     def _make_xdg_dir(self):
         import xdg.BaseDirectory
         return xdg.BaseDirectory.save_cache_path(self.APP_NAME)
 
+    def get_mtime(self, path):
+        """
+        Returns the modification time of given file.  If the cache is
+        `watched`, the file is only stat'ed again after it was reported as
+        changed.
+        """
+        with self.lock:
+            mtime = self._clean.get(path)
+            if mtime is not None:
+                return mtime
+            generation = self._generation
+        mtime = os.stat(path).st_mtime
+        if self.watched:
+            with self.lock:
+                # a change reported meanwhile may predate the stat call
+                if self._generation == generation:
+                    self._clean[path] = mtime
+        return mtime
+
+    def mark_dirty(self, path=None):
+        """
+        Makes the cache check given file (or all files if `path` is `None`)
+        on next access.  Called by a watcher (see
+        :mod:`timetra.diary.watching`) and after writes.
+        """
+        with self.lock:
+            self._generation += 1
+            if path is None:
+                self._clean.clear()
+            else:
+                self._clean.pop(path, None)
+
     def get_cached_yaml_file(self, path, model):
+        """
+        Returns the tuple of facts from given day file, loading it only if it
+        was modified.  Concurrent requests for the same file (from different
+        threads) share a single load.
+
+        Recently used files are kept in memory and the same tuple is returned
+        to every caller, so the objects must be read-only (see
+        :class:`~timetra.diary.models.FactRecord`).
+        """
         #results = tmpl_cache.get(key=search_param, createfunc=load_card)
-        time_key = 'changed:' + path
-        data_key = 'content:' + path
-        mtime_cache = self.db.get(time_key)
-        mtime_file = os.stat(path).st_mtime
-        if mtime_cache == mtime_file:
-            data = self.db[data_key]
-            log.debug('[x]', path)
-        else:
-            log.debug('[ ]', path)
-            data = list(self._load_object_list(path, model))
+        time_key, data_key = self._get_keys(path, model)
+        memory_key = model, path
+        with self.lock:
+            pending = self._pending.get(path)
+            if pending is None:
+                mtime_file = self.get_mtime(path)
+                mtime_memory, data = self._memory.get(memory_key, (None, None))
+                if mtime_memory == mtime_file:
+                    self._memory.move_to_end(memory_key)
+                    return data
+                mtime_cache = self.db.get(time_key)
+                if mtime_cache == mtime_file:
+                    log.debug('[x]', path)
+                    data = tuple(self.db[data_key])
+                    self._remember(memory_key, mtime_file, data)
+                    return data
+                pending = self._pending[path] = futures.Future()
+                loading = True
+            else:
+                loading = False
+
+        if not loading:
+            return pending.result()
+
+        log.debug('[ ]', path)
+        try:
+            data = tuple(self._load_object_list(path, model))
+        except Exception as e:
+            with self.lock:
+                del self._pending[path]
+            pending.set_exception(e)
+            raise
+        with self.lock:
             self.db[data_key] = data
             self.db[time_key] = mtime_file
+            self._remember(memory_key, mtime_file, data)
+            del self._pending[path]
+        pending.set_result(data)
         #cache.close()
         return data
 
+    def _get_keys(self, path, model):
+        # the model is part of the key: cached objects are pickled
+        return ('changed:{0}:{1}'.format(model.__name__, path),
+                'content:{0}:{1}'.format(model.__name__, path))
 
-    def _load_object_list(self, path, model):
-        with open(path) as f:
-            try:
-                items = yaml.load(f)
-            except:
-                print('FAILED to load', model, 'from', path)
-                raise
+    def is_cached(self, path, model):
+        """
+        Returns `True` if the contents of given file are cached and the file
+        was not modified since.  The file is not loaded.
+        """
+        time_key, _ = self._get_keys(path, model)
+        with self.lock:
+            mtime_file = self.get_mtime(path)
+            mtime_memory, _ = self._memory.get((model, path), (None, None))
+            return (mtime_memory == mtime_file or
+                    self.db.get(time_key) == mtime_file)
 
-        if not items:
-            return
+    def _remember(self, key, mtime, data):
+        self._memory[key] = mtime, data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.MEMORY_SIZE:
+            self._memory.popitem(last=False)
 
-        for data in items:
-            obj = model(data)
+    def get_cached_index(self, path, model, index_class):
+        """
+        Returns a `(mtime, index)` pair for given day file, where `index` is
+        an instance of `index_class` built from the file contents.  The index
+        is rebuilt only if the file was modified.
+        """
+        index_key = 'index:{0}:{1}'.format(index_class.VERSION, path)
+        mtime_file = self.get_mtime(path)
+        with self.lock:
+            cached = self.db.get(index_key)
+        if cached and cached[0] == mtime_file:
+            return cached
+        data = self.get_cached_yaml_file(path, model)
+        cached = mtime_file, index_class(data)
+        with self.lock:
+            self.db[index_key] = cached
+        return cached
 
-            try:
-                validate(model, obj)
-            except (ValidationError, TypeError) as e:
-                raise type(e)('{path}: {e}'.format(path=path, e=e))
 
-            yield obj
+    def _load_object_list(self, path, model):
+        return load_object_list(path, model, loader=self.loader)
 
     def reset(self):
+        self._memory.clear()
+        self.mark_dirty()
+        if not self.persistent:
+            # the file belongs to another process
+            self.db.clear()
+            return
         try:
             self.db.close()
         except:
@@ -0,0 +1,146 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Changes
+=======
+
+A feed of changes made to the facts database, so that timers, indexes and
+user interfaces can react to them instead of rescanning or polling.
+
+Each :class:`Change` has a sequence number; numbers grow monotonically
+within a feed.  Consumers can either subscribe a callback::
+
+    storage.subscribe(lambda change: print(change.kind, change.fact))
+
+or keep the number of the last change they have seen and ask for newer
+ones::
+
+    changes = storage.changes.read(after=last_seq)
+
+Writes through :class:`~timetra.diary.storage.Storage` are reported as
+``add``, ``update`` and ``delete``.  Day files edited by other means (e.g.
+in a text editor) are reported as ``modify`` by
+:meth:`~timetra.diary.storage.Storage.check_for_changes`.
+"""
+from collections import deque, namedtuple
+import logging
+import threading
+
+
+__all__ = ['Change', 'ChangeFeed', 'ADD', 'UPDATE', 'DELETE', 'MODIFY']
+
+
+log = logging.getLogger(__name__)
+
+
+ADD = 'add'
+UPDATE = 'update'
+DELETE = 'delete'
+MODIFY = 'modify'
+
+
+Change = namedtuple('Change', 'seq kind fact previous path')
+Change.__doc__ = """
+A change in the facts database.
+
+:param seq: sequence number.
+:param kind: ``add``, ``update``, ``delete`` or ``modify``.
+:param fact: the added or updated fact (as stored), or the deleted one;
+    `None` for ``modify``.
+:param previous: the fact before an update; `None` for other kinds.
+:param path: the day file that was changed if known, otherwise `None`.
+"""
+
+
+class ChangeFeed(object):
+    """
+    Keeps the last `size` changes and notifies subscribers.  Thread-safe.
+    """
+    SIZE = 1000
+
+    def __init__(self, size=SIZE):
+        self._changes = deque(maxlen=size)
+        self._subscribers = []
+        self._seq = 0
+        self._condition = threading.Condition()
+
+    @property
+    def last_seq(self):
+        "The sequence number of the latest change (`0` if none)."
+        return self._seq
+
+    def publish(self, kind, fact=None, previous=None, path=None):
+        """
+        Records a change and calls the subscribers.  Returns the
+        :class:`Change`.
+        """
+        with self._condition:
+            self._seq += 1
+            change = Change(self._seq, kind, fact, previous, path)
+            self._changes.append(change)
+            subscribers = list(self._subscribers)
+            self._condition.notify_all()
+        for callback in subscribers:
+            try:
+                callback(change)
+            except Exception:
+                # a broken consumer must not break the write
+                log.exception('change subscriber %r failed', callback)
+        return change
+
+    def subscribe(self, callback):
+        """
+        Calls `callback(change)` for each new change (in the thread that
+        made it).  Returns a function that cancels the subscription.
+        """
+        with self._condition:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._condition:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def read(self, after=0):
+        """
+        Returns the list of kept changes with sequence numbers greater than
+        `after`.  If the first returned change is not `after + 1`, older
+        changes were dropped and the consumer should rescan.
+        """
+        with self._condition:
+            return [x for x in self._changes if x.seq > after]
+
+    def wait(self, after=0, timeout=None):
+        """
+        Like :meth:`read` but blocks until there are changes newer than
+        `after` or the timeout (in seconds) expires.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after, timeout)
+            return [x for x in self._changes if x.seq > after]
+
+    def __iter__(self):
+        return iter(self.read())
+
+    def __len__(self):
+        return len(self._changes)
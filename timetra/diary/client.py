@@ -0,0 +1,154 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Client
+======
+
+The command-line entry point.  Read-only commands are sent to the daemon
+(see :mod:`timetra.diary.daemon`) if it is running; everything else, and
+everything if the daemon is not running, is executed in this process by
+:func:`timetra.diary.app.main`.
+
+This module is imported on every invocation, so it must only depend on the
+standard library.
+"""
+import json
+import os
+import socket
+import sys
+
+
+__all__ = ['main', 'get_socket_path', 'send', 'ConnectionLost']
+
+
+REMOTE_COMMANDS = frozenset([
+    ('find',),
+    ('today',),
+    ('yesterday',),
+    ('list-activities',),
+    ('report', 'drift'),
+    ('report', 'weekly'),
+    ('report', 'predict'),
+])
+""" Commands the daemon may run: they do not need the terminal (no prompts,
+editors or screens) and do not write.
+"""
+
+
+class ConnectionLost(Exception):
+    """
+    Raised if the daemon went away after it had started responding (the
+    command cannot be run again locally: its output is partly written).
+    """
+
+
+def get_socket_path():
+    path = os.getenv('TIMETRA_DIARY_SOCKET')
+    if path:
+        return path
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'timetra-diary.sock')
+    return '/tmp/timetra-diary-{0}.sock'.format(os.getuid())
+
+
+def get_config_path():
+    # same as `timetra.diary.app.CONF_FILE`
+    return os.path.abspath(os.getenv('TIMETRA_DIARY_CONFIG', 'conf.yaml'))
+
+
+def is_remote(argv):
+    if '-h' in argv or '--help' in argv:
+        return False
+    return tuple(argv[:1]) in REMOTE_COMMANDS or \
+        tuple(argv[:2]) in REMOTE_COMMANDS
+
+
+def send(request, socket_path=None, stdout=None, stderr=None):
+    """
+    Sends a request to the daemon and copies the output to given streams.
+    Returns the response which ended the exchange (a dictionary), or `None`
+    if the daemon is not running or went away before responding.  Raises
+    :class:`ConnectionLost` if it went away in the middle of a response.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    received = False
+    try:
+        try:
+            sock.connect(socket_path or get_socket_path())
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        try:
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            with sock.makefile('r', encoding='utf-8') as responses:
+                for line in responses:
+                    # a truncated last line is not valid JSON
+                    response = json.loads(line)
+                    received = True
+                    if 'out' in response:
+                        stdout.write(response['out'])
+                    elif 'err' in response:
+                        stderr.write(response['err'])
+                    else:
+                        return response
+        except (OSError, ValueError):
+            pass
+    finally:
+        sock.close()
+    # the daemon went away
+    if received:
+        raise ConnectionLost('the daemon went away')
+    return None
+
+
+def run_remote(argv):
+    """
+    Runs the command in the daemon.  Returns the exit code, or `None` if the
+    command must be run locally.
+    """
+    if not is_remote(argv):
+        return None
+    request = {
+        'argv': argv,
+        'config': get_config_path(),
+        'tty': sys.stdout.isatty(),
+        'term': os.getenv('TERM'),
+    }
+    try:
+        response = send(request)
+    except ConnectionLost as e:
+        sys.stdout.flush()
+        sys.stderr.write('timetra-diary: {0}\n'.format(e))
+        return 1
+    if response is None or response.get('fallback'):
+        return None
+    sys.stdout.flush()
+    return response['exit']
+
+
+def main():
+    code = run_remote(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+    from .app import main as local_main
+    local_main()
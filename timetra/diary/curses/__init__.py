@@ -209,7 +209,9 @@ class DayView(object):
     def refresh_data(self):
 
         today = datetime.datetime.today()
-        facts = list(reversed(list(self.storage.find(since=today))))
+        fields = ('since', 'until', 'activity', 'category')
+        facts = list(self.storage.find(since=today, reverse=True,
+                                       fields=fields))
 
         if not facts:
             facts = [self.storage.get_latest_fact()]
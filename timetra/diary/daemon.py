@@ -0,0 +1,354 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Daemon
+======
+
+A resident process which keeps the storage, its caches and indexes loaded
+and runs read-only commands for :mod:`timetra.diary.client`.  Start it with::
+
+    $ timetra-diary daemon serve
+
+and the usual commands (``find``, ``today``, ``report drift``, etc.) are
+answered by the daemon while it is running.  Commands which write or need
+the terminal are always run by the client itself; the daemon keeps the
+cache file locked, so they use a private in-memory cache meanwhile (see
+:class:`~timetra.diary.caching.Cache`).
+
+Protocol
+--------
+
+The client connects to a Unix socket (see
+:func:`~timetra.diary.client.get_socket_path`; only the owner may connect)
+and sends one JSON object on a line::
+
+    {"argv": ["find", "--days", "7"], "config": "/home/me/conf.yaml",
+     "tty": true, "term": "xterm"}
+
+The daemon answers with a sequence of JSON lines: ``{"out": text}`` and
+``{"err": text}`` are copied to the client's stdout and stderr, and the last
+line is ``{"exit": code}``.  If the daemon cannot run the command (e.g. it
+was started with another configuration file) it answers
+``{"fallback": true}`` and the client runs the command itself.
+
+Requests ``{"command": "status"}`` and ``{"command": "stop"}`` control the
+daemon.
+"""
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+import errno
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+from . import client
+
+
+__all__ = ['Server', 'Daemon', 'serve', 'watching']
+
+
+log = logging.getLogger(__name__)
+
+
+FLUSH_SIZE = 64 * 1024
+""" Output is sent to the client in chunks of about this size (in
+characters) so that long reports are streamed.
+"""
+
+STYLED_MODULES = ('timetra.diary.diary',)
+""" Modules whose `t` (a `blessings.Terminal`) is replaced for each request
+so that the output is styled for the client's terminal, not the daemon's.
+"""
+
+
+class _Frames(object):
+    "Buffers the command output and sends it as response lines."
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self._key = None
+        self._buffer = []
+        self._size = 0
+
+    def write(self, key, text):
+        if key != self._key:
+            # keep the order of interleaved stdout and stderr output
+            self.flush()
+            self._key = key
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.send({self._key: ''.join(self._buffer)})
+            self._buffer = []
+            self._size = 0
+
+    def send(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class _Stream(object):
+    "A text file-like object writing to given :class:`_Frames`."
+
+    def __init__(self, frames, key, isatty=False):
+        self.frames = frames
+        self.key = key
+        self._isatty = isatty
+
+    def write(self, text):
+        self.frames.write(self.key, text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self._isatty
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        frames = _Frames(self.wfile)
+        try:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                frames.send({'error': 'malformed request'})
+                return
+            frames.send(self.server.respond(request, frames))
+        except (BrokenPipeError, ConnectionResetError):
+            # e.g. the output was piped to `head`
+            log.debug('client went away')
+
+
+class Server(socketserver.UnixStreamServer):
+    """
+    Runs commands with given `argh` parser for clients connecting to the
+    socket at `path`.  Requests are served one at a time.
+
+    :param config_path: absolute path to the configuration file the storage
+        was created from; clients with another file are told to fall back.
+    :param sync: a callable which makes the storage aware of changes made to
+        its files so far (see :func:`watching`); called before each command.
+    """
+    def __init__(self, path, parser, config_path, sync=None):
+        self.path = path
+        self.parser = parser
+        self.config_path = config_path
+        self.sync = sync
+        self.started = time.time()
+        self.request_count = 0
+        self._terminals = {}
+        _remove_stale_socket(path)
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def respond(self, request, frames):
+        """
+        Handles a request; returns the final response.  The command output
+        is sent through `frames` on the way.
+        """
+        command = request.get('command')
+        if command == 'status':
+            return {
+                'pid': os.getpid(),
+                'config': self.config_path,
+                'uptime': time.time() - self.started,
+                'requests': self.request_count,
+            }
+        if command == 'stop':
+            # `shutdown()` waits for the loop, i.e. for this very request
+            threading.Thread(target=self.shutdown).start()
+            return {'stopping': True}
+
+        argv = request.get('argv')
+        if (not isinstance(argv, list) or not client.is_remote(argv)
+                or request.get('config') != self.config_path):
+            return {'fallback': True}
+
+        started = time.time()
+        if self.sync is not None:
+            self.sync()
+        code = self.run(argv, frames, tty=bool(request.get('tty')),
+                        term=request.get('term'))
+        self.request_count += 1
+        log.debug('%s: exit %s in %.1f ms', ' '.join(argv), code,
+                  (time.time() - started) * 1000)
+        return {'exit': code}
+
+    def run(self, argv, frames, tty=False, term=None):
+        "Runs the command; returns the exit code."
+        out = _Stream(frames, 'out', isatty=tty)
+        err = _Stream(frames, 'err', isatty=tty)
+        self._set_terminal(tty, term)
+        code = 0
+        try:
+            with redirect_stdout(out), redirect_stderr(err):
+                self.parser.dispatch(argv=argv, completion=False,
+                                     output_file=out, errors_file=err)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                code = e.code or 0
+            else:
+                err.write('{0}\n'.format(e.code))
+                code = 1
+        except Exception:
+            err.write(traceback.format_exc())
+            code = 1
+        frames.flush()
+        return code
+
+    def _set_terminal(self, tty, term):
+        modules = [sys.modules[x] for x in STYLED_MODULES if x in sys.modules]
+        if not modules:
+            return
+        key = (term, tty)
+        if key not in self._terminals:
+            import blessings
+            self._terminals[key] = blessings.Terminal(
+                kind=term, force_styling=True if tty else None)
+        for module in modules:
+            module.t = self._terminals[key]
+
+
+def _remove_stale_socket(path):
+    """
+    Removes the socket file left by a daemon which was killed.  Raises
+    `OSError` if a daemon is still listening on it.
+    """
+    if not os.path.exists(path):
+        return
+    if client.send({'command': 'status'}, path) is not None:
+        raise OSError(errno.EADDRINUSE, 'the daemon is already running', path)
+    os.remove(path)
+
+
+def _get_yaml_backends(backend):
+    from .storage import YamlBackend
+    if isinstance(backend, YamlBackend):
+        return [backend]
+    shards = getattr(backend, 'shards', {})
+    return [x for shard in shards.values() for x in _get_yaml_backends(shard)]
+
+
+@contextmanager
+def watching(storage):
+    """
+    Watches day files of the storage (if it is YAML-based) so that the
+    cached facts are trusted until they change.  Yields a function which
+    must be called before each read: changes are reported by a background
+    thread, so without it the read could miss a change made just before.
+    The function returns `True` if any files were changed.
+    """
+    backends = _get_yaml_backends(storage.backend) if storage else []
+    for backend in backends:
+        backend.watch()
+
+    def sync():
+        changed = [backend.sync() for backend in backends]
+        return any(changed)
+
+    try:
+        yield sync
+    finally:
+        for backend in backends:
+            backend.unwatch()
+
+
+def serve(parser, config_path, storage=None, socket_path=None):
+    "Serves requests until stopped."
+    with watching(storage) as sync:
+        server = Server(socket_path or client.get_socket_path(), parser,
+                        config_path, sync=sync)
+        log.info('listening on %s', server.path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+class Daemon(object):
+    """
+    The ``daemon`` commands.
+
+    :param make_parser: a callable returning the parser for the commands
+        which the daemon runs.
+    """
+    def __init__(self, storage, config_path, make_parser):
+        self.storage = storage
+        self.config_path = config_path
+        self.make_parser = make_parser
+
+    @property
+    def commands(self):
+        return [
+            self.serve,
+            self.stop,
+            self.status,
+            self.http,
+        ]
+
+    def serve(self, socket_path=None):
+        "Runs the daemon in the foreground."
+        serve(self.make_parser(), self.config_path, self.storage,
+              socket_path)
+
+    def stop(self, socket_path=None):
+        response = client.send({'command': 'stop'}, socket_path)
+        if response is None:
+            return 'not running'
+        return 'stopped'
+
+    def status(self, socket_path=None):
+        response = client.send({'command': 'status'}, socket_path)
+        if response is None:
+            return 'not running'
+        return ('running (pid {pid}, {requests} requests served, '
+                'up {uptime:.0f}s, config {config})'.format(**response))
+
+    def http(self, host='127.0.0.1', port=8421):
+        "Serves the HTTP API (see :mod:`timetra.diary.api`)."
+        from . import api
+        with watching(self.storage) as sync:
+            api.serve(self.storage, host, port, sync=sync)
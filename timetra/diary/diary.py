@@ -52,6 +52,31 @@ FACT_FORMAT = ('{since.year}-{since.month:0>2}-{since.day:0>2} '
 FISHY_FACT_DURATION_THRESHOLD = 6 * 60 * 60   # 6 hours is a lot
 
 
+def render_fact(fact):
+    """
+    Returns a new dictionary with the fields of given fact formatted for the
+    terminal, plus `duration` and `with_ppl`.  The fact itself is not
+    modified: storage hands out shared read-only objects.
+    """
+    rendered = dict(fact)
+    rendered['activity'] = t.yellow(fact['activity'])
+    # avoid "None" in textual representation
+    rendered['description'] = t.blue(fact['description'] or '')
+    try:
+        delta = fact['until'] - fact['since']
+        rendered['duration'] = '{:.0f}m'.format(delta.total_seconds() / 60)
+    except:
+        rendered['duration'] = ''
+
+    with_ppl_tags = [tag[5:] for tag in fact.get('tags',[])
+                     if tag.startswith('with-')]
+    if with_ppl_tags:
+        rendered['with_ppl'] = t.blue('😊 '+' & '.join(with_ppl_tags))
+    else:
+        rendered['with_ppl'] = ''
+    return rendered
+
+
 class Diary(Configurable):
     needs = {
         'storage': Storage,
@@ -74,17 +99,20 @@ class Diary(Configurable):
         of current storage as keys, and the number of relevant facts as
         values.
         """
-        # TODO: cache results and only scan the whole storage if forced
-        xs = {}
-        for x in self.storage.find():
-            if 'activity' not in x:
-                continue
-            activity = x['activity']
-            xs[activity] = xs.get(activity, 0) + 1
-        return xs
+        counts = self.storage.count(group_by='activity')
+        return dict((k, v) for k, v in counts.items() if k)
 
+    @argh.arg('--limit', type=int)
     def find(self, when=None, days=0, since=None, until=None, activity=None,
-             note=None, tag=None, fmt=FACT_FORMAT, count=False):
+             note=None, tag=None, fmt=FACT_FORMAT, count=False,
+             explain=False, limit=None, reverse=False, starts_after=None,
+             starts_before=None, weekdays=None, min_duration=None,
+             max_duration=None):
+        """
+        Displays facts matching given criteria.  Patterns for activity, note
+        and tag support "," as OR, " " as AND and "-" as NOT.  Weekdays are
+        given as two-letter names ("sa,su"); durations as "H:MM".
+        """
 
         if since:
             since = utils.parse_date(since)
@@ -101,29 +129,31 @@ class Diary(Configurable):
             since = utils.parse_date(when)
             until = utils.parse_date(when)
 
-        facts = self.storage.find(since=since, until=until, activity=activity,
-                                  description=note, tag=tag)
+        criteria = dict(since=since, until=until, activity=activity,
+                        description=note, tag=tag)
+        if starts_after:
+            criteria['starts_after'] = datetime.time(*utils.split_time(starts_after))
+        if starts_before:
+            criteria['starts_before'] = datetime.time(*utils.split_time(starts_before))
+        if weekdays:
+            criteria['weekdays'] = utils.parse_weekdays(weekdays)
+        if min_duration:
+            criteria['min_duration'] = utils.parse_delta(min_duration)
+        if max_duration:
+            criteria['max_duration'] = utils.parse_delta(max_duration)
+
+        if explain:
+            yield self.storage.explain(**criteria)
+            return
+
+        facts = self.storage.find(limit=limit, reverse=reverse, **criteria)
         total_hours = 0
         for fact in facts:
-            fact['activity'] = t.yellow(fact['activity'])
-            # avoid "None" in textual representation
-            fact['description'] = t.blue(fact['description'] or '')
-            try:
+            # unfinished facts are not counted
+            if count and fact.get('until'):
                 delta = fact['until'] - fact['since']
-                fact['duration'] = '{:.0f}m'.format(delta.total_seconds() / 60)
-                if count:
-                    total_hours += delta.total_seconds() / 60. / 60.
-            except:
-                fact['duration'] = ''
-
-            with_ppl_tags = [tag[5:] for tag in fact.get('tags',[])
-                             if tag.startswith('with-')]
-            if with_ppl_tags:
-                with_ppl = t.blue('😊 '+' & '.join(with_ppl_tags))
-            else:
-                with_ppl = ''
-
-            yield fmt.format(with_ppl=with_ppl, **fact)
+                total_hours += delta.total_seconds() / 60. / 60.
+            yield fmt.format(**render_fact(fact))
 
         if count:
             yield ''
@@ -152,9 +182,12 @@ class Diary(Configurable):
             date = datetime.date.today()
 
         path = self.storage.backend.get_file_path_for_day(date)
+        # remember the state to report the edits to subscribers
+        self.storage.check_for_changes()
         print('opening', path, 'in editor...')
         subprocess.Popen(['vim', path]).wait()
         print('editor finished.')
+        self.storage.check_for_changes()
 
 
     def _validate_activity_interactively(self, pattern):
@@ -0,0 +1,218 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Emitter
+=======
+
+Writes day files without going through the generic `yaml` machinery
+(representer → serializer → emitter events).
+
+The output is byte-identical to::
+
+    yaml.dump([_prepare_fact_for_yaml(x) for x in facts],
+              allow_unicode=True, default_flow_style=False)
+
+The emitter follows the fixed layout of a day file (a list of flat
+mappings whose values are scalars or lists of scalars) and reproduces the
+scalar style rules and line folding of the PyYAML emitter for that layout.
+Anything else (e.g. strings requiring double quotes) is reported as
+unsupported, and the caller falls back to `yaml.dump`.
+"""
+import datetime
+import functools
+import re
+
+import yaml
+
+from . import models
+
+
+__all__ = ['emit_facts']
+
+
+WIDTH = 80
+""" Preferred line width of `yaml.dump`.
+"""
+
+# mapping keys are written at column 2 ("- key" or "  key"), scalar values
+# are folded with indentation 4
+KEY_INDENT = '  '
+VALUE_INDENT = '    '
+
+KNOWN_KEYS = frozenset(['category', 'activity', 'since', 'until', 'tags',
+                        'hamster_fact_id', 'description'])
+
+TAG_PREFIX = 'tag:yaml.org,2002:'
+
+_RUNS = re.compile(' +|[^ ]+')
+
+_dumper = yaml.Dumper(None, allow_unicode=True, default_flow_style=False)
+
+
+class Unsupported(Exception):
+    "Raised if a value cannot be emitted without the generic emitter."
+
+
+def _represent(value, literal):
+    """
+    Returns `(tag, text, style)` for given value.  Multi-line strings get
+    the literal style if `literal` is true.
+    """
+    if value is None:
+        return 'null', 'null', None
+    value_type = type(value)
+    if value_type is str:
+        if literal and '\n' in value:
+            # see `storage._prepare_value_for_yaml`
+            return 'str', value, '|'
+        return 'str', value, None
+    if value_type is datetime.datetime:
+        return 'timestamp', value.isoformat(' '), None
+    if value_type is bool:
+        return 'bool', 'true' if value else 'false', None
+    if value_type is int:
+        return 'int', str(value), None
+    raise Unsupported(value_type)
+
+
+@functools.lru_cache(maxsize=4096)
+def _choose_style(tag, text, style):
+    """
+    Returns "plain", "single" or "literal" for a block mapping value (see
+    `Emitter.choose_scalar_style`).
+    """
+    analysis = _dumper.analyze_scalar(text)
+    if style is None:
+        detected = _dumper.resolve(yaml.ScalarNode, text, (True, False))
+        if detected == TAG_PREFIX + tag and analysis.allow_block_plain:
+            return 'plain'
+    if style == '|' and analysis.allow_block:
+        if text[0] in ' \n' or text.endswith('\n\n') or text == '\n':
+            # indentation hint or "keep" chomping
+            raise Unsupported(text)
+        if '\x85' in text or '\u2028' in text or '\u2029' in text:
+            raise Unsupported(text)
+        return 'literal'
+    if analysis.allow_single_quoted and not analysis.multiline:
+        return 'single'
+    raise Unsupported(text)
+
+
+def _write_plain(out, text, column):
+    out.append(' ')
+    column += 1
+    for run in _RUNS.findall(text):
+        if run == ' ' and column > WIDTH:
+            out.append('\n' + VALUE_INDENT)
+            column = len(VALUE_INDENT)
+        else:
+            out.append(run)
+            column += len(run)
+    return column
+
+
+def _write_single_quoted(out, text, column):
+    out.append(" '")
+    column += 2
+    runs = _RUNS.findall(text)
+    last = len(runs) - 1
+    for i, run in enumerate(runs):
+        if run == ' ' and column > WIDTH and 0 < i < last:
+            out.append('\n' + VALUE_INDENT)
+            column = len(VALUE_INDENT)
+        else:
+            run = run.replace("'", "''")
+            out.append(run)
+            column += len(run)
+    out.append("'")
+    return column + 1
+
+
+def _write_literal(out, text):
+    out.append(' |' if text.endswith('\n') else ' |-')
+    if text.endswith('\n'):
+        text = text[:-1]
+    for line in text.split('\n'):
+        out.append('\n' + VALUE_INDENT + line if line else '\n')
+
+
+def _write_scalar(out, value, column, literal=False):
+    tag, text, style = _represent(value, literal)
+    chosen = _choose_style(tag, text, style)
+    if chosen == 'plain':
+        _write_plain(out, text, column)
+    elif chosen == 'single':
+        _write_single_quoted(out, text, column)
+    else:
+        _write_literal(out, text)
+
+
+def _get_keys(fact):
+    # same order as `storage._prepare_fact_for_yaml`
+    keys = [k for k in models.Fact.structure if k in fact]
+    keys.extend(k for k in fact if k not in models.Fact.structure)
+    return keys
+
+
+def _write_fact(out, fact):
+    keys = _get_keys(fact)
+    if not keys:
+        raise Unsupported(fact)
+    for i, key in enumerate(keys):
+        if key not in KNOWN_KEYS:
+            raise Unsupported(key)
+        out.append('- ' if i == 0 else '\n' + KEY_INDENT)
+        out.append(key)
+        out.append(':')
+        value = fact[key]
+        if isinstance(value, list):
+            if not value:
+                out.append(' []')
+                continue
+            for item in value:
+                out.append('\n' + KEY_INDENT + '-')
+                if isinstance(item, (list, dict)):
+                    raise Unsupported(item)
+                _write_scalar(out, item, len(KEY_INDENT) + 1)
+        elif isinstance(value, dict):
+            raise Unsupported(value)
+        else:
+            # `_prepare_fact_for_yaml` only wraps the values of plain keys of
+            # the structure (not of optional ones such as "category")
+            _write_scalar(out, value, len(KEY_INDENT) + len(key) + 1,
+                          literal=key in models.Fact.structure)
+    out.append('\n')
+
+
+def emit_facts(facts):
+    """
+    Returns the YAML text of given list of facts, or `None` if some values
+    are not supported (then `yaml.dump` must be used instead).
+    """
+    if not facts:
+        return '[]\n'
+    out = []
+    try:
+        for fact in facts:
+            _write_fact(out, fact)
+    except Unsupported:
+        return None
+    return ''.join(out)
@@ -0,0 +1,302 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Frames
+======
+
+A :class:`FactFrame` keeps facts column by column so that reports can
+aggregate them without creating a `datetime` per fact (or per hour).
+
+Columns are NumPy arrays if NumPy is installed and `array.array` objects
+otherwise; the helpers return the same values either way.  Times are whole
+seconds since 1970-01-01 (naive).
+"""
+from array import array
+import bisect
+import datetime
+import itertools
+
+
+_numpy = False   # not imported yet
+
+
+__all__ = ['FactFrame', 'to_seconds', 'from_seconds']
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400
+UNFINISHED = -1
+""" Value of `until` for unfinished facts in the columns passed to
+:class:`FactFrame`; replaced with current time.
+"""
+NO_CODE = -1
+
+
+def to_seconds(date_time):
+    delta = date_time - EPOCH
+    return delta.days * SECONDS_PER_DAY + delta.seconds
+
+
+def from_seconds(value):
+    return EPOCH + datetime.timedelta(seconds=int(value))
+
+
+def _get_numpy():
+    """
+    Returns the `numpy` module or `None` if it is not installed.  NumPy is
+    imported on first use: most commands never build a frame, and importing
+    it would add to the startup time of each of them.
+    """
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy as _numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+
+def _column(typecode, values):
+    numpy = _get_numpy()
+    if numpy is not None:
+        dtype = numpy.int64 if typecode == 'q' else numpy.int32
+        return numpy.asarray(values, dtype=dtype)
+    if isinstance(values, array) and values.typecode == typecode:
+        return values
+    return array(typecode, values)
+
+
+def _bound(value, size):
+    "Turns a scalar or a sequence into a sequence of given size."
+    if isinstance(value, (int, float)):
+        return itertools.repeat(value, size)
+    return value
+
+
+class FactFrame(object):
+    """
+    Columns of a list of facts:
+
+    * `since`, `until`, `duration`: seconds (int64);
+    * `activity`, `category`: codes (int32) in the `activities` and
+      `categories` lists; `-1` stands for an empty value.
+    """
+    FIELDS = ('since', 'until', 'activity', 'category')
+
+    def __init__(self, since, until, activity, category, activities,
+                 categories, now=None):
+        if now is None:
+            now = datetime.datetime.now()
+        now = to_seconds(now)
+        self.since = _column('q', since)
+        until = _column('q', until)
+        numpy = _get_numpy()
+        if numpy is not None:
+            self.until = numpy.where(until == UNFINISHED, now, until)
+            self.duration = self.until - self.since
+        else:
+            self.until = array('q', (now if x == UNFINISHED else x
+                                     for x in until))
+            self.duration = array('q', (u - s for s, u in
+                                        zip(self.since, self.until)))
+        self.activity = _column('i', activity)
+        self.category = _column('i', category)
+        self.activities = list(activities)
+        self.categories = list(categories)
+
+    @classmethod
+    def from_records(cls, records, now=None):
+        """
+        Builds a frame from facts (or projections including the
+        :attr:`FIELDS`).
+        """
+        since, until, activity, category = [], [], [], []
+        activities, categories = {}, {}
+        for record in records:
+            seconds = getattr(record, 'seconds', None)
+            if seconds is not None:
+                # a `FactRecord`; timestamps may be stored as seconds
+                since.append(seconds('since'))
+                value = seconds('until')
+                until.append(UNFINISHED if value is None else value)
+            else:
+                since.append(to_seconds(record['since']))
+                if record.get('until'):
+                    until.append(to_seconds(record['until']))
+                else:
+                    until.append(UNFINISHED)
+            for value, codes, column in (
+                    (record.get('activity'), activities, activity),
+                    (record.get('category'), categories, category)):
+                if value is None:
+                    column.append(NO_CODE)
+                else:
+                    column.append(codes.setdefault(value, len(codes)))
+        return cls(since, until, activity, category,
+                   sorted(activities, key=activities.get),
+                   sorted(categories, key=categories.get), now=now)
+
+    def __len__(self):
+        return len(self.since)
+
+    def __repr__(self):
+        return '<{0.__class__.__name__} {1} facts>'.format(self, len(self))
+
+    def day_numbers(self, field='since'):
+        "Returns the number of days since 1970-01-01 for each fact."
+        column = getattr(self, field)
+        numpy = _get_numpy()
+        if numpy is not None:
+            return column // SECONDS_PER_DAY
+        return array('q', (x // SECONDS_PER_DAY for x in column))
+
+    def day_ends(self, field='since'):
+        "Returns the last second of the day of given field for each fact."
+        column = getattr(self, field)
+        numpy = _get_numpy()
+        if numpy is not None:
+            return column - column % SECONDS_PER_DAY + SECONDS_PER_DAY - 1
+        return array('q', (x - x % SECONDS_PER_DAY + SECONDS_PER_DAY - 1
+                           for x in column))
+
+    def clip(self, low=None, high=None):
+        """
+        Returns `(since, until)` columns with each interval clipped to
+        `low..high`.  Boundaries can be scalars or columns.  Intervals outside
+        the boundaries become empty (`since == until`).
+        """
+        since = self.since
+        until = self.until
+        numpy = _get_numpy()
+        if numpy is not None:
+            if low is not None:
+                since = numpy.maximum(since, low)
+                until = numpy.maximum(until, low)
+            if high is not None:
+                since = numpy.minimum(since, high)
+                until = numpy.minimum(until, high)
+            return since, until
+        if low is not None:
+            low = list(_bound(low, len(self)))
+            since = array('q', map(max, since, low))
+            until = array('q', map(max, until, low))
+        if high is not None:
+            high = list(_bound(high, len(self)))
+            since = array('q', map(min, since, high))
+            until = array('q', map(min, until, high))
+        return since, until
+
+    def group_by(self, codes, values=None, func='sum'):
+        """
+        Returns a `{code: result}` dictionary where the results are computed
+        by applying `func` ("sum", "count", "min" or "max") to the values
+        (durations by default) of facts with the same code.  Groups without
+        facts are omitted.
+        """
+        if values is None:
+            values = self.duration
+        if func not in ('sum', 'count', 'min', 'max'):
+            raise ValueError('unknown function "{0}"'.format(func))
+        numpy = _get_numpy()
+        if numpy is not None:
+            codes = numpy.asarray(codes)
+            if not len(codes):
+                return {}
+            keys, positions = numpy.unique(codes, return_inverse=True)
+            counts = numpy.bincount(positions)
+            if func == 'count':
+                results = counts
+            elif func == 'sum':
+                results = numpy.zeros(len(keys), dtype=numpy.int64)
+                numpy.add.at(results, positions, values)
+            else:
+                ufunc = numpy.minimum if func == 'min' else numpy.maximum
+                results = numpy.array(values)[numpy.unique(
+                    positions, return_index=True)[1]]
+                ufunc.at(results, positions, values)
+            return dict(zip(keys.tolist(), results.tolist()))
+
+        results = {}
+        for code, value in zip(codes, values):
+            if code not in results:
+                results[code] = 1 if func == 'count' else value
+            elif func == 'count':
+                results[code] += 1
+            elif func == 'sum':
+                results[code] += value
+            elif func == 'min':
+                results[code] = min(results[code], value)
+            else:
+                results[code] = max(results[code], value)
+        return results
+
+    def sum_by(self, field):
+        """
+        Returns total duration (in seconds) per value of given field
+        ("activity" or "category").
+        """
+        labels = self.activities if field == 'activity' else self.categories
+        totals = self.group_by(getattr(self, field))
+        return dict((labels[code] if code != NO_CODE else None, seconds)
+                    for code, seconds in totals.items())
+
+    def histogram(self, start, step, bins):
+        """
+        Returns a list with the number of seconds covered by the facts within
+        each of `bins` consecutive periods of `step` seconds starting at
+        `start`.  A fact spanning several periods contributes to each of
+        them.
+
+        The coverage up to moment `t` is `sum(t - since) - sum(t - until)`
+        over the facts started (finished) before `t`, so each period only
+        takes two binary searches.
+        """
+        numpy = _get_numpy()
+        if numpy is not None:
+            edges = start + step * numpy.arange(bins + 1, dtype=numpy.int64)
+            coverage = (self._covered(numpy.sort(self.since), edges) -
+                        self._covered(numpy.sort(self.until), edges))
+            return numpy.diff(coverage).tolist()
+
+        edges = [start + step * i for i in range(bins + 1)]
+        started = sorted(self.since)
+        finished = sorted(self.until)
+        coverage = [a - b for a, b in zip(self._covered(started, edges),
+                                          self._covered(finished, edges))]
+        return [b - a for a, b in zip(coverage, coverage[1:])]
+
+    @staticmethod
+    def _covered(moments, edges):
+        """
+        Returns `sum(edge - x for x in moments if x < edge)` for each edge
+        (`moments` must be sorted).
+        """
+        numpy = _get_numpy()
+        if numpy is not None:
+            sums = numpy.concatenate(([0], numpy.cumsum(moments)))
+            counts = numpy.searchsorted(moments, edges)
+            return counts * edges - sums[counts]
+        sums = [0] + list(itertools.accumulate(moments))
+        results = []
+        for edge in edges:
+            count = bisect.bisect_left(moments, edge)
+            results.append(count * edge - sums[count])
+        return results
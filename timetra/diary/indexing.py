@@ -0,0 +1,351 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Indexing
+========
+
+Per-day summaries of the facts database.  A :class:`DayIndex` is built
+whenever a day file is (re)loaded and stored in the cache next to the file
+contents; :class:`FactIndex` combines them into inverted and sorted indexes
+that let the query planner skip day files without loading them.
+"""
+import bisect
+import datetime
+import threading
+
+from . import rollups
+from .frame import SECONDS_PER_DAY, from_seconds
+from .models import get_timestamp
+
+
+__all__ = ['DayIndex', 'FactIndex', 'SortedIndex', 'ROW_FIELDS']
+
+
+ROW_FIELDS = ('since', 'until', 'activity', 'category', 'tags')
+""" Fact fields stored in :attr:`DayIndex.rows`.  Queries involving only
+these fields can be answered without loading day files.
+"""
+
+
+class DayIndex(object):
+    """
+    Summary of a single day file.
+
+    The `VERSION` is part of the cache key, so bump it whenever the set of
+    stored attributes changes.
+    """
+    VERSION = 6
+
+    def __init__(self, facts):
+        activities = set()
+        tags = set()
+        weekdays = set()
+        minutes = []
+        durations = []
+        rows = []
+        has_open = False
+        totals = {}
+        unfinished = []
+        for fact in facts:
+            if fact.get('activity'):
+                activities.add(fact['activity'])
+            tags.update(x for x in fact.get('tags') or [] if x)
+            # timestamps are stored as loaded (see `records()`)
+            since = get_timestamp(fact, 'since')
+            until = get_timestamp(fact, 'until')
+            rows.append((since, until) + tuple(fact.get(k)
+                                               for k in ROW_FIELDS[2:]))
+
+            if not since:
+                continue
+            if type(since) is int:
+                days, seconds = divmod(since, SECONDS_PER_DAY)
+                # 1970-01-01 was a Thursday
+                weekdays.add((days + 3) % 7)
+                minutes.append(seconds // 60)
+            else:
+                weekdays.add(since.weekday())
+                minutes.append(since.hour * 60 + since.minute)
+            if until:
+                seconds = until - since
+                if type(seconds) is datetime.timedelta:
+                    seconds = seconds.total_seconds()
+                durations.append(seconds)
+                cnt, total = totals.get(fact.get('activity'), (0, 0))
+                totals[fact.get('activity')] = cnt + 1, total + seconds
+            else:
+                # duration of an unfinished fact depends on current time
+                has_open = True
+                if type(since) is int:
+                    since = from_seconds(since)
+                unfinished.append((fact.get('activity'), since))
+        self.activities = frozenset(activities)
+        self.tags = frozenset(tags)
+        self.weekdays = frozenset(weekdays)
+        self.minutes = sorted(minutes)
+        self.durations = sorted(durations)
+        self.has_open = has_open
+        self.rows = rows
+        # `{activity: (count, seconds)}` for finished facts
+        self.totals = totals
+        # `(activity, since)` for unfinished facts
+        self.unfinished = unfinished
+        self.contributions = rollups.compute_contributions(facts)
+
+    @property
+    def count(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return '<{0.__class__.__name__} {1} activities, {2} tags>'.format(
+            self, len(self.activities), len(self.tags))
+
+    def records(self):
+        """
+        Returns a list of `{field: value}` dictionaries (one per fact, in file
+        order) with the fields listed in :data:`ROW_FIELDS`.
+        """
+        records = []
+        for row in self.rows:
+            record = dict(zip(ROW_FIELDS, row))
+            for key in ('since', 'until'):
+                if type(record[key]) is int:
+                    record[key] = from_seconds(record[key])
+            records.append(record)
+        return records
+
+    def values(self, field):
+        if field == 'activity':
+            return self.activities
+        if field == 'tags':
+            return self.tags
+        if field == 'weekday':
+            return self.weekdays
+        if field == 'minute':
+            return self.minutes
+        if field == 'duration':
+            return self.durations
+        raise KeyError(field)
+
+
+class SortedIndex(object):
+    """
+    A sorted multimap `value -> path` that supports range lookups.
+
+    Changes are buffered and applied by a single sort on the next lookup, so
+    building the index from many day files costs O(n log n) rather than a
+    list insertion per value.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._paths = []
+        self._added = []
+        # `{(value, path): count}`
+        self._removed = {}
+
+    def __len__(self):
+        self._apply()
+        return len(self._keys)
+
+    def add(self, value, path):
+        self._added.append((value, path))
+
+    def remove(self, value, path):
+        entry = value, path
+        self._removed[entry] = self._removed.get(entry, 0) + 1
+
+    def _apply(self):
+        if not self._added and not self._removed:
+            return
+        entries = list(zip(self._keys, self._paths)) + self._added
+        removed = self._removed
+        if removed:
+            kept = []
+            for entry in entries:
+                count = removed.get(entry)
+                if count:
+                    removed[entry] = count - 1
+                else:
+                    kept.append(entry)
+            entries = kept
+        # mostly sorted already: the existing entries come first
+        entries.sort()
+        self._keys = [x[0] for x in entries]
+        self._paths = [x[1] for x in entries]
+        self._added = []
+        self._removed = {}
+
+    def range(self, low=None, high=None):
+        """
+        Returns the set of paths with values within `low..high` (inclusive).
+        Omitted boundaries are unlimited.
+        """
+        self._apply()
+        start = 0 if low is None else bisect.bisect_left(self._keys, low)
+        end = (len(self._keys) if high is None
+               else bisect.bisect_right(self._keys, high))
+        return set(self._paths[start:end])
+
+
+class _DayView(object):
+    """
+    The lookup interface of :class:`FactIndex` over a single day file, so
+    that predicate nodes can tell whether that file may contain matching
+    facts.
+    """
+
+    def __init__(self, path, day_index):
+        self.path = path
+        self.day_index = day_index
+        self.open_paths = set([path]) if day_index.has_open else set()
+
+    def lookup(self, field, test):
+        values = self.day_index.values(field)
+        return set([self.path]) if any(test(x) for x in values) else set()
+
+    def lookup_range(self, field, low=None, high=None):
+        values = self.day_index.values(field)
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        end = (len(values) if high is None
+               else bisect.bisect_right(values, high))
+        return set([self.path]) if start < end else set()
+
+
+class FactIndex(object):
+    """
+    Indexes over all day files seen so far:
+
+    * inverted indexes `{value: set_of_day_paths}` for activities, tags and
+      weekdays;
+    * sorted indexes for start minute-of-day and duration (in seconds);
+    * rollups (see :mod:`timetra.diary.rollups`).
+
+    Call :meth:`refresh` with the day paths a query is going to touch before
+    doing any lookups.
+    """
+    FIELDS = ('activity', 'tags', 'weekday')
+    SORTED_FIELDS = ('minute', 'duration')
+
+    def __init__(self, cache, model):
+        self.cache = cache
+        self.model = model
+        self._days = {}
+        self._inverted = dict((field, {}) for field in self.FIELDS)
+        self._sorted = dict((field, SortedIndex())
+                            for field in self.SORTED_FIELDS)
+        # day files with unfinished facts (their duration is not indexed)
+        self.open_paths = set()
+        self.rollups = rollups.RollupStore()
+        # held while the indexes are being changed or read
+        self.lock = threading.RLock()
+
+    def refresh(self, paths):
+        """
+        Makes sure the index reflects current contents of given day files.
+        Only the files changed since the last refresh are re-indexed.
+        """
+        for path in paths:
+            with self.lock:
+                known = self._days.get(path)
+            if known and known[0] == self.cache.get_mtime(path):
+                # the cached index would not be even unpickled
+                continue
+            mtime, day_index = self.cache.get_cached_index(path, self.model,
+                                                           DayIndex)
+            with self.lock:
+                self._add(path, mtime, day_index)
+
+    def _add(self, path, mtime, day_index):
+        known = self._days.get(path)
+        if known and known[0] == mtime:
+            return
+        if known:
+            self._forget(path, known[1])
+        self._days[path] = mtime, day_index
+        for field in self.FIELDS:
+            inverted = self._inverted[field]
+            for value in day_index.values(field):
+                inverted.setdefault(value, set()).add(path)
+        for field in self.SORTED_FIELDS:
+            sorted_index = self._sorted[field]
+            for value in day_index.values(field):
+                sorted_index.add(value, path)
+        if day_index.has_open:
+            self.open_paths.add(path)
+        self.rollups.add(day_index.contributions)
+
+    def _forget(self, path, day_index):
+        for field in self.FIELDS:
+            inverted = self._inverted[field]
+            for value in day_index.values(field):
+                paths = inverted.get(value)
+                if paths is None:
+                    continue
+                paths.discard(path)
+                if not paths:
+                    del inverted[value]
+        for field in self.SORTED_FIELDS:
+            sorted_index = self._sorted[field]
+            for value in day_index.values(field):
+                sorted_index.remove(value, path)
+        self.open_paths.discard(path)
+        self.rollups.add(day_index.contributions, sign=-1)
+
+    def get(self, path):
+        "Returns the :class:`DayIndex` for given (refreshed) day file."
+        with self.lock:
+            return self._days[path][1]
+
+    def may_contain(self, node, path, fields=None):
+        """
+        Returns `False` if given (refreshed) day file cannot contain facts
+        matching the predicate `node` according to the indexes over given
+        fields (all fields by default).
+        """
+        view = _DayView(path, self.get(path))
+        if fields is None:
+            fields = self.FIELDS + self.SORTED_FIELDS
+        for field in fields:
+            candidates = node.candidate_paths(field, view)
+            if candidates is not None and path not in candidates:
+                return False
+        return True
+
+    def lookup(self, field, test):
+        """
+        Returns the set of day paths containing at least one value of given
+        field for which `test(value)` is true.
+        """
+        paths = set()
+        with self.lock:
+            for value, value_paths in self._inverted[field].items():
+                if test(value):
+                    paths |= value_paths
+        return paths
+
+    def lookup_range(self, field, low=None, high=None):
+        """
+        Returns the set of day paths containing at least one value of given
+        sorted field within `low..high` (inclusive).
+        """
+        with self.lock:
+            return self._sorted[field].range(low, high)
@@ -0,0 +1,130 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Loader
+======
+
+YAML loaders for day files.  The parser of `libyaml` is used if PyYAML was
+built with it; the results are the same as with `yaml.Loader`.
+
+Timestamps in day files are written by `yaml.dump` (see
+:mod:`timetra.diary.emitter`) in a fixed format: ``2014-01-05 23:00:00``,
+optionally with microseconds.  The generic loader resolves them by trying
+several regular expressions and builds the `datetime` with another one;
+:class:`DayFileLoader` recognizes the fixed format directly and builds
+the `datetime` with `datetime.fromisoformat`.  Other timestamp forms are
+handled by the generic code.
+
+:class:`EpochDayFileLoader` returns whole-second `since` and `until`
+values as integer seconds since 1970-01-01 (naive) instead; the day part is
+converted once per date within a file.
+:class:`~timetra.diary.models.FactRecord` accepts such values and creates
+the `datetime` on first access.
+"""
+import datetime
+import re
+
+import yaml
+
+try:
+    # libyaml
+    from yaml import CLoader as BaseLoader
+except ImportError:
+    from yaml import Loader as BaseLoader
+
+from .frame import SECONDS_PER_DAY, EPOCH
+
+
+__all__ = ['DayFileLoader', 'EpochDayFileLoader']
+
+
+TIMESTAMP_TAG = 'tag:yaml.org,2002:timestamp'
+EPOCH_TAG = 'tag:timetra,2014:epoch'
+
+_FIXED_TIMESTAMP = re.compile(
+    r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d\d\d\d\d\d)?\Z')
+_EPOCH_DAY = EPOCH.toordinal()
+
+
+class DayFileLoader(BaseLoader):
+
+    def resolve(self, kind, value, implicit):
+        if (kind is yaml.ScalarNode and implicit[0]
+                and _FIXED_TIMESTAMP.match(value)):
+            return TIMESTAMP_TAG
+        return super(DayFileLoader, self).resolve(kind, value, implicit)
+
+    def construct_yaml_timestamp(self, node):
+        if _FIXED_TIMESTAMP.match(node.value):
+            try:
+                return datetime.datetime.fromisoformat(node.value)
+            except ValueError:
+                # e.g. February 30th; let the generic code complain
+                pass
+        return super(DayFileLoader, self).construct_yaml_timestamp(node)
+
+
+DayFileLoader.add_constructor(TIMESTAMP_TAG,
+                              DayFileLoader.construct_yaml_timestamp)
+
+
+class EpochDayFileLoader(DayFileLoader):
+    FIELDS = ('since', 'until')
+
+    def __init__(self, stream):
+        super(EpochDayFileLoader, self).__init__(stream)
+        # `{'YYYY-MM-DD': seconds}`; a day file rarely has more than two
+        self._day_seconds = {}
+
+    def construct_mapping(self, node, deep=False):
+        for key_node, value_node in node.value:
+            if (key_node.value in self.FIELDS
+                    and value_node.tag == TIMESTAMP_TAG
+                    and len(value_node.value) == 19):
+                # microseconds are not representable
+                value_node.tag = EPOCH_TAG
+        return super(EpochDayFileLoader, self).construct_mapping(node, deep)
+
+    def construct_epoch_timestamp(self, node):
+        value = node.value
+        if _FIXED_TIMESTAMP.match(value):
+            try:
+                return self._to_seconds(value)
+            except ValueError:
+                pass
+        return self.construct_yaml_timestamp(node)
+
+    def _to_seconds(self, value):
+        day = value[:10]
+        seconds = self._day_seconds.get(day)
+        if seconds is None:
+            date = datetime.date(int(day[:4]), int(day[5:7]), int(day[8:]))
+            seconds = (date.toordinal() - _EPOCH_DAY) * SECONDS_PER_DAY
+            self._day_seconds[day] = seconds
+        hour, minute, second = (int(value[11:13]), int(value[14:16]),
+                                int(value[17:]))
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError(value)
+        return seconds + hour * 3600 + minute * 60 + second
+
+
+EpochDayFileLoader.add_constructor(
+    EPOCH_TAG, EpochDayFileLoader.construct_epoch_timestamp)
@@ -2,11 +2,16 @@
 
 # python
 from collections import OrderedDict
+from collections.abc import Mapping
 import datetime
+import sys
 
 # 3rd party
 from monk import modeling, nullable, optional, IsA, Equals, Exists
 
+# this app
+from .frame import from_seconds, to_seconds
+
 
 fact_schema = OrderedDict([
     (Equals('category') | ~Exists(), str),
@@ -35,6 +40,198 @@ class Model(modeling.TypedDictReprMixin,
 class Fact(Model):
     structure = fact_schema
 
+    def __init__(self, *args, **kwargs):
+        super(Fact, self).__init__(*args, **kwargs)
+        # tags of a :class:`FactRecord` are a tuple
+        if type(self.get('tags')) is tuple:
+            self['tags'] = list(self['tags'])
+
     @property
     def duration(self):
         return (self.until or datetime.datetime.now()) - self.since
+
+
+class FactProjection(dict):
+    """
+    A subset of fact fields returned by `find(fields=...)`.  Fields listed
+    in `lazy` are not loaded until first accessed; `loader` must return the
+    complete fact.
+    """
+
+    def __init__(self, data, lazy=(), loader=None):
+        super(FactProjection, self).__init__(data)
+        self._lazy = frozenset(lazy) if loader else frozenset()
+        self._loader = loader
+
+    def __missing__(self, key):
+        if key not in self._lazy:
+            raise KeyError(key)
+        fact = self._loader()
+        for k in self._lazy:
+            self[k] = fact.get(k)
+        self._lazy = frozenset()
+        self._loader = None
+        return self[key]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @property
+    def duration(self):
+        return (self['until'] or datetime.datetime.now()) - self['since']
+
+
+class FactRecord(Mapping):
+    """
+    A lightweight read-only fact returned by queries.  Supports the same
+    item and attribute access as :class:`Fact` (missing optional fields
+    raise `KeyError` and `AttributeError` respectively).  Activity, category
+    and tag strings are interned, so records share them; tags are a tuple.
+
+    `since` and `until` may also be given as integer seconds since
+    1970-01-01 (see :class:`~timetra.diary.loader.EpochDayFileLoader`);
+    they are turned into `datetime` objects on first access.
+
+    Use :meth:`to_fact` to get an editable :class:`Fact`.
+    """
+    FIELDS = ('category', 'activity', 'since', 'until', 'tags',
+              'hamster_fact_id', 'description')
+    # fields inserted by `Fact._insert_defaults` if missing
+    DEFAULTS = ('activity', 'until', 'description')
+    # `{field: slot}` for fields accessed through properties
+    STORED_AS = {'since': '_since', 'until': '_until'}
+
+    __slots__ = ('category', 'activity', '_since', '_until', 'tags',
+                 'hamster_fact_id', 'description', '_extra')
+
+    def __init__(self, *args, **kwargs):
+        data = dict(*args, **kwargs)
+        init = object.__setattr__
+        for key in self.FIELDS:
+            if key in data:
+                value = data.pop(key)
+            elif key in self.DEFAULTS:
+                value = None
+            else:
+                continue
+            if key in ('activity', 'category') and type(value) is str:
+                value = sys.intern(value)
+            elif key == 'tags' and type(value) in (list, tuple):
+                # a tuple, so that the record shared by the cache cannot
+                # be modified through it
+                value = tuple(sys.intern(x) if type(x) is str else x
+                              for x in value)
+            init(self, self.STORED_AS.get(key, key), value)
+        # unknown keys are not expected in day files but must not get lost
+        init(self, '_extra', data or None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{0} is read-only'.format(
+            self.__class__.__name__))
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        # the constructor interns strings of unpickled records; timestamps
+        # are pickled as they are
+        data = {}
+        for key in self.FIELDS:
+            slot = self.STORED_AS.get(key, key)
+            if hasattr(self, slot):
+                data[key] = getattr(self, slot)
+        data.update(self._extra or {})
+        return self.__class__, (data,)
+
+    def __getitem__(self, key):
+        if key in _RECORD_FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def get(self, key, default=None):
+        if key in _RECORD_FIELDS:
+            return getattr(self, key, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def __contains__(self, key):
+        if key in _RECORD_FIELDS:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for x in self)
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__, dict(self))
+
+    def _get_timestamp(self, slot):
+        value = getattr(self, slot)
+        if type(value) is int:
+            value = from_seconds(value)
+            object.__setattr__(self, slot, value)
+        return value
+
+    @property
+    def since(self):
+        return self._get_timestamp('_since')
+
+    @property
+    def until(self):
+        return self._get_timestamp('_until')
+
+    def seconds(self, field):
+        """
+        Returns the value of `since` or `until` as whole seconds since
+        1970-01-01 without creating a `datetime` (`None` if not set).
+        """
+        value = getattr(self, self.STORED_AS[field])
+        if value is None or type(value) is int:
+            return value
+        return to_seconds(value)
+
+    @property
+    def duration(self):
+        return (self.until or datetime.datetime.now()) - self.since
+
+    def to_fact(self):
+        "Returns an editable copy of this record."
+        return Fact(self)
+
+
+_RECORD_FIELDS = frozenset(FactRecord.FIELDS)
+
+
+def get_timestamp(fact, field):
+    """
+    Returns `since` or `until` of given fact or record as it is stored: a
+    `datetime` or, for records loaded with epoch timestamps, whole seconds
+    since 1970-01-01.  Unlike item access this does not turn the seconds of
+    a (possibly shared) record into a `datetime`.
+    """
+    if isinstance(fact, FactRecord):
+        return getattr(fact, FactRecord.STORED_AS[field], None)
+    return fact.get(field)
@@ -0,0 +1,91 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Prefetching
+===========
+
+Loads the next few items (day files) in a background thread while the
+caller is busy with the current one.
+"""
+import queue
+import threading
+
+
+__all__ = ['prefetch']
+
+
+_DONE = object()
+
+POLL_INTERVAL = 0.1
+""" How often (in seconds) a blocked loader checks whether the consumer is
+gone.
+"""
+
+
+def _produce(load, items, results, stopped):
+    try:
+        for item in items:
+            if stopped.is_set():
+                return
+            result = load(item), None
+            # a bounded queue: wait until the consumer catches up
+            while not stopped.is_set():
+                try:
+                    results.put(result, timeout=POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    pass
+    except Exception as e:
+        results.put((None, e))
+    else:
+        results.put((_DONE, None))
+
+
+def prefetch(load, items, depth=2):
+    """
+    Returns a generator that yields `load(item)` for each item, in order.
+    Up to `depth` items are loaded ahead in a background thread.  Exceptions
+    raised by `load` are re-raised by the generator.  Closing the generator
+    stops the thread.
+    """
+    results = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    thread = threading.Thread(target=_produce,
+                              args=(load, items, results, stopped))
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            result, error = results.get()
+            if error is not None:
+                raise error
+            if result is _DONE:
+                return
+            yield result
+    finally:
+        stopped.set()
+        # unblock the loader if it is waiting for a free slot
+        while thread.is_alive():
+            try:
+                results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        thread.join()
@@ -0,0 +1,491 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Query
+=====
+
+Compiles `find()` filters into predicates and describes how a backend is
+going to evaluate them.
+
+A filter pattern follows the syntax of the legacy `find_facts` command:
+
+* ``,`` separates alternatives (OR);
+* whitespace separates terms that must all match (AND);
+* a term prefixed with ``-`` must *not* match (NOT).
+
+Each term is a case-insensitive substring.  Example: ``"sleep,nap -dream"``
+means "(sleep) OR (nap AND NOT dream)".
+
+Time-of-day windows, weekdays and durations are expressed with
+:class:`StartTime`, :class:`Weekday` and :class:`Duration` nodes.
+"""
+import datetime
+
+
+__all__ = ['Term', 'And', 'Or', 'Not', 'StartTime', 'Weekday', 'Duration',
+           'parse_pattern', 'compile_filters', 'make_query', 'Query', 'Plan']
+
+
+MINUTES_PER_DAY = 24 * 60
+
+
+NEGATION_PREFIX = '-'
+
+
+class Node(object):
+    "Base class for predicate tree nodes."
+
+    def compile(self):
+        """
+        Returns a function that takes a fact and returns `True` if the fact
+        matches this node.
+        """
+        raise NotImplementedError
+
+    def keys(self):
+        "Returns the set of fact fields this node refers to."
+        return set()
+
+    def index_keys(self):
+        """
+        Returns the set of index names (see
+        :class:`~timetra.diary.indexing.FactIndex`) this node may be narrowed
+        down by.
+        """
+        return set()
+
+    def candidate_paths(self, field, index):
+        """
+        Returns the set of day file paths which *may* contain matching facts
+        according to the index over given field, or `None` if this node
+        cannot be narrowed down by that index.
+        """
+        return None
+
+    def __and__(self, other):
+        return And([self, other])
+
+    def __or__(self, other):
+        return Or([self, other])
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Term(Node):
+    "Case-insensitive substring match against a fact field."
+
+    def __init__(self, key, pattern):
+        self.key = key
+        self.pattern = pattern
+        self.needle = pattern.lower()
+
+    def __repr__(self):
+        return '{0} ~ "{1}"'.format(self.key, self.pattern)
+
+    def compile(self):
+        key = self.key
+        needle = self.needle
+
+        def match(fact):
+            value = fact.get(key)
+            if isinstance(value, list):
+                return any(needle in str(v or '').lower() for v in value)
+            return needle in str(value or '').lower()
+
+        return match
+
+    def keys(self):
+        return set([self.key])
+
+    def index_keys(self):
+        return set([self.key])
+
+    def candidate_paths(self, field, index):
+        if field != self.key:
+            return None
+        return index.lookup(field, lambda value: self.needle in value.lower())
+
+
+class And(Node):
+
+    def __init__(self, children):
+        self.children = list(children)
+
+    def __repr__(self):
+        return '({0})'.format(' AND '.join(repr(x) for x in self.children))
+
+    def compile(self):
+        predicates = tuple(x.compile() for x in self.children)
+        if len(predicates) == 1:
+            return predicates[0]
+
+        def match(fact):
+            for predicate in predicates:
+                if not predicate(fact):
+                    return False
+            return True
+
+        return match
+
+    def keys(self):
+        return set().union(*(x.keys() for x in self.children))
+
+    def index_keys(self):
+        return set().union(*(x.index_keys() for x in self.children))
+
+    def candidate_paths(self, field, index):
+        result = None
+        for child in self.children:
+            paths = child.candidate_paths(field, index)
+            if paths is None:
+                continue
+            result = paths if result is None else result & paths
+        return result
+
+
+class Or(Node):
+
+    def __init__(self, children):
+        self.children = list(children)
+
+    def __repr__(self):
+        return '({0})'.format(' OR '.join(repr(x) for x in self.children))
+
+    def compile(self):
+        predicates = tuple(x.compile() for x in self.children)
+        if len(predicates) == 1:
+            return predicates[0]
+
+        def match(fact):
+            for predicate in predicates:
+                if predicate(fact):
+                    return True
+            return False
+
+        return match
+
+    def keys(self):
+        return set().union(*(x.keys() for x in self.children))
+
+    def index_keys(self):
+        return set().union(*(x.index_keys() for x in self.children))
+
+    def candidate_paths(self, field, index):
+        result = set()
+        for child in self.children:
+            paths = child.candidate_paths(field, index)
+            if paths is None:
+                # one of the alternatives can match anything
+                return None
+            result |= paths
+        return result
+
+
+class Not(Node):
+
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return 'NOT {0!r}'.format(self.child)
+
+    def compile(self):
+        predicate = self.child.compile()
+
+        def match(fact):
+            return not predicate(fact)
+
+        return match
+
+    def keys(self):
+        return self.child.keys()
+
+
+class StartTime(Node):
+    """
+    Matches facts started within given time-of-day window.  The window is
+    half-open (`after` is included, `before` is not) and wraps around
+    midnight if `after` is later than `before`.  Seconds are ignored.
+
+    :param after: `datetime.time` or `None` (start of the day)
+    :param before: `datetime.time` or `None` (end of the day)
+    """
+
+    def __init__(self, after=None, before=None):
+        self.after = after
+        self.before = before
+        self.low = after.hour * 60 + after.minute if after else 0
+        self.high = (before.hour * 60 + before.minute if before
+                     else MINUTES_PER_DAY)
+
+    def __repr__(self):
+        return 'since.time in [{0}, {1})'.format(self.after or '00:00',
+                                                 self.before or '24:00')
+
+    def compile(self):
+        low, high = self.low, self.high
+        wraps = high < low
+
+        def match(fact):
+            since = fact.get('since')
+            if not since:
+                return False
+            minute = since.hour * 60 + since.minute
+            if wraps:
+                return low <= minute or minute < high
+            return low <= minute < high
+
+        return match
+
+    def keys(self):
+        return set(['since'])
+
+    def index_keys(self):
+        return set(['minute'])
+
+    def candidate_paths(self, field, index):
+        if field != 'minute':
+            return None
+        if self.high < self.low:
+            return (index.lookup_range(field, self.low, None) |
+                    index.lookup_range(field, None, self.high - 1))
+        return index.lookup_range(field, self.low, self.high - 1)
+
+
+class Weekday(Node):
+    """
+    Matches facts started on given weekdays (0 is Monday, 6 is Sunday).
+    """
+
+    def __init__(self, days):
+        self.days = frozenset(days)
+
+    def __repr__(self):
+        return 'since.weekday in {0}'.format(sorted(self.days))
+
+    def compile(self):
+        days = self.days
+
+        def match(fact):
+            since = fact.get('since')
+            return bool(since) and since.weekday() in days
+
+        return match
+
+    def keys(self):
+        return set(['since'])
+
+    def index_keys(self):
+        return set(['weekday'])
+
+    def candidate_paths(self, field, index):
+        if field != 'weekday':
+            return None
+        days = self.days
+        return index.lookup(field, lambda value: value in days)
+
+
+class Duration(Node):
+    """
+    Matches facts with duration within given range (inclusive).  Unfinished
+    facts are measured up to current time.
+
+    :param min_duration: `datetime.timedelta` or `None`
+    :param max_duration: `datetime.timedelta` or `None`
+    """
+
+    def __init__(self, min_duration=None, max_duration=None):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+
+    def __repr__(self):
+        return 'duration in [{0}, {1}]'.format(self.min_duration or 0,
+                                               self.max_duration or '*')
+
+    def compile(self):
+        min_duration = self.min_duration
+        max_duration = self.max_duration
+
+        def match(fact):
+            since = fact.get('since')
+            if not since:
+                return False
+            duration = (fact.get('until') or datetime.datetime.now()) - since
+            if min_duration is not None and duration < min_duration:
+                return False
+            if max_duration is not None and max_duration < duration:
+                return False
+            return True
+
+        return match
+
+    def keys(self):
+        return set(['since', 'until'])
+
+    def index_keys(self):
+        return set(['duration'])
+
+    def candidate_paths(self, field, index):
+        if field != 'duration':
+            return None
+        low = high = None
+        if self.min_duration is not None:
+            low = self.min_duration.total_seconds()
+        if self.max_duration is not None:
+            high = self.max_duration.total_seconds()
+        return index.lookup_range(field, low, high) | index.open_paths
+
+
+class Everything(Node):
+    "Matches any fact."
+
+    def __repr__(self):
+        return '*'
+
+    def compile(self):
+        return lambda fact: True
+
+
+def parse_pattern(key, pattern):
+    """
+    Returns a predicate tree for given field and pattern in the legacy
+    `find_facts` syntax (see module docs).
+    """
+    alternatives = []
+    for group in pattern.split(','):
+        terms = []
+        for word in group.split():
+            if word.startswith(NEGATION_PREFIX) and len(word) > 1:
+                terms.append(Not(Term(key, word[1:])))
+            else:
+                terms.append(Term(key, word))
+        if terms:
+            alternatives.append(And(terms) if 1 < len(terms) else terms[0])
+    if not alternatives:
+        return Everything()
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return Or(alternatives)
+
+
+def compile_filters(filters):
+    """
+    Returns a predicate tree for given `{field: pattern}` dictionary.
+    Patterns may also be ready-made nodes.  Fields are joined with AND.
+    """
+    if not filters:
+        return Everything()
+    nodes = []
+    for key, pattern in sorted(filters.items()):
+        if isinstance(pattern, Node):
+            nodes.append(pattern)
+        else:
+            nodes.append(parse_pattern(key, pattern))
+    if len(nodes) == 1:
+        return nodes[0]
+    return And(nodes)
+
+
+class Query(object):
+    """
+    A compiled `find()` request: date range plus a predicate tree.  The
+    predicate is compiled once and can be applied to any number of facts.
+    """
+
+    def __init__(self, since=None, until=None, filters=None):
+        self.since = since
+        self.until = until
+        self.where = compile_filters(filters)
+        self.match = self.where.compile()
+
+    def __getstate__(self):
+        # the compiled predicate is a closure and cannot be pickled
+        return {'since': self.since, 'until': self.until, 'where': self.where}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.match = self.where.compile()
+
+    def __repr__(self):
+        return '<Query {0!r} {1}..{2}>'.format(self.where, self.since or '*',
+                                              self.until or '*')
+
+
+def make_query(since=None, until=None, activity=None, description=None,
+               tag=None, starts_after=None, starts_before=None, weekdays=None,
+               min_duration=None, max_duration=None):
+    """
+    Returns a :class:`Query` for the criteria accepted by `find()`.
+    """
+    filters = {}
+    if activity:
+        filters['activity'] = activity
+    if description:
+        filters['description'] = description
+    if tag:
+        filters['tags'] = tag
+    if starts_after or starts_before:
+        filters['starts'] = StartTime(starts_after, starts_before)
+    if weekdays:
+        filters['weekday'] = Weekday(weekdays)
+    if min_duration is not None or max_duration is not None:
+        filters['duration'] = Duration(min_duration, max_duration)
+    return Query(since=since, until=until, filters=filters)
+
+
+class Plan(object):
+    """
+    Describes the chosen access path for a query and the day files it is
+    going to read.
+
+    :param access_path:
+        name of the access path (e.g. "date-range scan").
+    :param day_paths:
+        the list of day file paths to be read, in chronological order.
+    :param estimates:
+        a `{access_path: number_of_day_files}` dictionary with all paths
+        that were considered.
+    """
+
+    def __init__(self, query, access_path, day_paths, estimates):
+        self.query = query
+        self.access_path = access_path
+        self.day_paths = day_paths
+        self.estimates = estimates
+
+    def __repr__(self):
+        return '<Plan {0}: {1} day files>'.format(self.access_path,
+                                                 len(self.day_paths))
+
+    def explain(self):
+        "Returns a human-readable description of the plan."
+        lines = [
+            'access path: {0}'.format(self.access_path),
+            'date range: {0} .. {1}'.format(self.query.since or '*',
+                                           self.query.until or '*'),
+            'predicate: {0!r}'.format(self.query.where),
+            'considered:',
+        ]
+        for name, cost in sorted(self.estimates.items(), key=lambda x: x[1]):
+            marker = '*' if name == self.access_path else ' '
+            lines.append(' {0} {1}: {2} day files'.format(marker, name, cost))
+        return '\n'.join(lines)
@@ -23,12 +23,10 @@ Reporting
 =========
 """
 from confu import Configurable
-from terminaltables import SingleTable
 
 from ..storage import Storage
-from .. import formatdelta
 from .drift import show_drift, show_weekly_averages
-from .prediction import predict_next_occurence
+from .prediction import predict_next_occurence, render_prediction
 
 
 class Reporting(Configurable):
@@ -46,14 +44,4 @@ class Reporting(Configurable):
         """ Predicts next occurence of given activity.
         """
         guess = predict_next_occurence(self['storage'], activity)
-        data = [
-            ['start', 'end', 'duration', 'ETA'],
-        ]
-        data.append([
-            guess['start'].strftime('%Y-%m-%d %H:%M'),
-            guess['end'].strftime('%Y-%m-%d %H:%M'),
-            formatdelta.render_delta(guess['duration']),
-            '{0}{1}'.format('-' if guess['eta_is_negative'] else '+',
-                            formatdelta.render_delta(guess['eta'])),
-        ])
-        return SingleTable(data).table
+        return render_prediction(guess)
@@ -32,6 +32,7 @@ from colorclass import Color
 from terminaltables import SingleTable
 
 from .. import utils
+from ..frame import from_seconds
 
 
 MARKER_EMPTY = '‧'
@@ -160,6 +161,42 @@ class DriftData(dict):
                 day.max_end = start_time.replace(
                     hour=23, minute=59, second=59, microsecond=0)
 
+    def add_frame(self, frame):
+        """
+        Same as calling :meth:`add_fact` for each fact in given
+        :class:`~timetra.diary.frame.FactFrame`, but without per-fact loops.
+        """
+        if not len(frame):
+            return
+        start = int(min(frame.since))
+        start -= start % 3600
+        bins = (int(max(frame.until)) - start) // 3600 + 1
+        for i, seconds in enumerate(frame.histogram(start, 3600, bins)):
+            if not seconds:
+                continue
+            pos = from_seconds(start + i * 3600)
+            self.ensure_date(pos.date())
+            self[pos.date()][pos.hour].duration += timedelta(seconds=seconds)
+
+        # a fact is counted in the day it ends; its end is trimmed to the
+        # day it starts
+        days = frame.day_numbers('until')
+        _, ends = frame.clip(high=frame.day_ends('since'))
+        counts = frame.group_by(days, func='count')
+        min_starts = frame.group_by(days, frame.since, func='min')
+        max_ends = frame.group_by(days, ends, func='max')
+        for number, count in counts.items():
+            date = from_seconds(number * 86400).date()
+            self.ensure_date(date)
+            day = self[date]
+            day.fact_cnt += count
+            min_start = from_seconds(min_starts[number])
+            if not day.min_start or min_start < day.min_start:
+                day.min_start = min_start
+            max_end = from_seconds(max_ends[number])
+            if not day.max_end or day.max_end < max_end:
+                day.max_end = max_end
+
 
 def collect_drift_data(storage, activity, span_days):
     span_days = span_days - 1  # otherwise it's zero-based
@@ -168,9 +205,7 @@ def collect_drift_data(storage, activity, span_days):
 
     dates = DriftData(span_days, until)
 
-    facts = storage.find(since, until=until, activity=activity)
-    for fact in facts:
-        dates.add_fact(fact.since, fact.until)
+    dates.add_frame(storage.to_frame(since, until=until, activity=activity))
 
     return dates
 
@@ -181,8 +216,11 @@ def show_drift(storage, activity, days=7, shift=False):
     trends, cycles. Initial intention was to find out my sleeping drift.
     """
     dates = collect_drift_data(storage, activity=activity, span_days=days)
+    return render_drift(dates, shift)
 
 
+def render_drift(dates, shift=False):
+    "Returns the table for :class:`DriftData`."
     fields = [
         'date',
         'wd',
@@ -241,13 +279,47 @@ def show_drift(storage, activity, days=7, shift=False):
     return table.table
 
 
-def show_weekly_averages(storage, activity, weeks=4):
+def collect_weekly_averages(storage, activity, weeks=4):
+    """
+    Returns a list of `(since, until, average, total, days)` tuples, one per
+    seven days with data (the last group may be shorter).
+    """
 
     # TODO: option: always start with Monday -> incomplete last week
 
-    dates = collect_drift_data(storage, activity=activity, span_days=7*weeks)
+    end = datetime.now()
+    start = end - timedelta(days=7*weeks - 1)
+    day_rollups = storage.get_rollups('day', since=start, until=end,
+                                      activity=activity)
+    durations = dict((x.period.date(), x.duration) for x in day_rollups)
+
+    groups = []
+    dates = sorted(durations)
+    since = None
+    spent = timedelta()
+    collected = 0
+    for date in dates:
+        if not since:
+            since = date
+
+        collected += 1
+        spent += durations[date]
+        if collected >= 7 or date == dates[-1]:
+            groups.append((since, date, spent / collected, spent, collected))
+
+            since = None
+            spent = timedelta()
+            collected = 0
+    return groups
+
+
+def show_weekly_averages(storage, activity, weeks=4):
+    groups = collect_weekly_averages(storage, activity, weeks)
+    return render_weekly_averages(groups)
 
 
+def render_weekly_averages(groups):
+    "Returns the table for the result of :func:`collect_weekly_averages`."
     fields = ['since', 'until', 'avg', 'total', 'days']
 
     # prettytable would break if we appended items directly to this attr
@@ -258,32 +330,11 @@ def show_weekly_averages(storage, activity, weeks=4):
 
     data.append(fields)
 
+    for since, until, avg, spent, collected in groups:
+        avg_fmt = utils.format_delta(avg, fmt='{hours}h {minutes:0>2}m')
+        spent_fmt = utils.format_delta(spent, fmt='{days}d {hours}h {minutes:0>2}m')
 
-    since = None
-    spent = timedelta()
-    collected = 0
-    for date in sorted(dates):
-        if not since:
-            since = date
-        #print(dates[date])
-        #marks = dates[date]
-        #day = dates[date]
-
-
-        collected += 1
-        spent += dates[date].duration
-        if collected >= 7 or date == sorted(dates)[-1]:
-            avg = spent / collected
-            avg_fmt = utils.format_delta(avg, fmt='{hours}h {minutes:0>2}m')
-            spent_fmt = utils.format_delta(spent, fmt='{days}d {hours}h {minutes:0>2}m')
-
-            data.append([str(x) for x in (since, date, avg_fmt, spent_fmt, collected)])
-
-            since = None
-            spent = timedelta()
-            collected = 0
-    else:
-        print('remainder?')
+        data.append([str(x) for x in (since, until, avg_fmt, spent_fmt, collected)])
 
     table = SingleTable(data)
     return table.table
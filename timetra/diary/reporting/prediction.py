@@ -32,6 +32,10 @@ Prediction
 """
 from datetime import datetime, timedelta
 
+from terminaltables import SingleTable
+
+from .. import formatdelta
+
 
 def avg_delta(deltas):
     deltas_as_seconds = [delta.total_seconds() for delta in deltas]
@@ -48,8 +52,10 @@ def predict_next_occurence(storage, activity, num_facts=4):
     average duration as estimated duration.
     """
     yesterday = (datetime.now() - timedelta(days=1)).date()
-    all_facts = storage.find(since=yesterday, activity=activity)
-    recent_facts = list(all_facts)[-num_facts:]
+    latest_facts = storage.find(since=yesterday, activity=activity,
+                                reverse=True, limit=num_facts,
+                                fields=('since', 'until'))
+    recent_facts = list(reversed(list(latest_facts)))
     if len(recent_facts) < 2:
         return None
     gaps = []
@@ -72,3 +78,18 @@ def predict_next_occurence(storage, activity, num_facts=4):
         eta_is_negative = True
     return {'start': est_start, 'end': est_end, 'duration': est_duration,
             'eta': eta, 'eta_is_negative': eta_is_negative}
+
+
+def render_prediction(guess):
+    "Returns the table for the result of :func:`predict_next_occurence`."
+    data = [
+        ['start', 'end', 'duration', 'ETA'],
+    ]
+    data.append([
+        guess['start'].strftime('%Y-%m-%d %H:%M'),
+        guess['end'].strftime('%Y-%m-%d %H:%M'),
+        formatdelta.render_delta(guess['duration']),
+        '{0}{1}'.format('-' if guess['eta_is_negative'] else '+',
+                        formatdelta.render_delta(guess['eta'])),
+    ])
+    return SingleTable(data).table
@@ -0,0 +1,198 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Rollups
+=======
+
+Total duration and number of facts per period (hour, day, week, month),
+activity, category and tag.
+
+Each day file contributes to a number of rollups; the contributions are
+computed with the day index (see :mod:`timetra.diary.indexing`) and added to
+or subtracted from a :class:`RollupStore` whenever the file changes.
+
+Rules:
+
+* a fact spanning several periods contributes its duration to each of them
+  (clipped to period boundaries) but is counted only in the period it
+  starts in;
+* the tag `None` stands for "all facts" regardless of their tags;
+* unfinished facts are not included.
+"""
+from collections import namedtuple
+import datetime
+
+from .frame import from_seconds
+from .models import get_timestamp
+
+
+__all__ = ['PERIODS', 'Rollup', 'RollupStore', 'compute_contributions',
+           'get_period_start', 'get_source_range']
+
+
+PERIODS = ('hour', 'day', 'week', 'month')
+
+
+Rollup = namedtuple('Rollup', 'period duration count')
+
+
+def get_period_start(period, date_time):
+    "Returns the beginning of the period containing given date and time."
+    if period == 'hour':
+        return date_time.replace(minute=0, second=0, microsecond=0)
+    day = datetime.datetime(date_time.year, date_time.month, date_time.day)
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    raise ValueError('unknown period "{0}"'.format(period))
+
+
+def get_next_period_start(period, start):
+    if period == 'hour':
+        return start + datetime.timedelta(hours=1)
+    if period == 'day':
+        return start + datetime.timedelta(days=1)
+    if period == 'week':
+        return start + datetime.timedelta(days=7)
+    if period == 'month':
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+    raise ValueError('unknown period "{0}"'.format(period))
+
+
+def get_source_range(period, since=None, until=None):
+    """
+    Returns the `(since, until)` range of days whose facts contribute to the
+    periods between `since` and `until`: from the day before the first
+    period (facts started then may spill over into it) to the last day of
+    the last period.  Omitted boundaries stay `None`.
+    """
+    if since:
+        since = get_period_start(period, since) - datetime.timedelta(days=1)
+    if until:
+        end = get_next_period_start(period, get_period_start(period, until))
+        until = end - datetime.timedelta(microseconds=1)
+    return since, until
+
+
+def split_by_period(period, since, until):
+    """
+    Yields `(period_start, seconds)` for each period overlapped by given
+    time span.
+    """
+    start = get_period_start(period, since)
+    while start < until:
+        end = get_next_period_start(period, start)
+        seconds = (min(end, until) - max(start, since)).total_seconds()
+        yield start, seconds
+        start = end
+
+
+def compute_contributions(facts):
+    """
+    Returns a `{(period, period_start, activity, category, tag): (seconds,
+    count)}` dictionary for given facts.
+    """
+    contributions = {}
+    for fact in facts:
+        since = get_timestamp(fact, 'since')
+        until = get_timestamp(fact, 'until')
+        if not since or not until:
+            continue
+        if type(since) is int:
+            # records are shared, so the `datetime` is not stored in them
+            since = from_seconds(since)
+            until = from_seconds(until)
+        activity = fact.get('activity')
+        category = fact.get('category')
+        tags = [None] + sorted(set(x for x in fact.get('tags') or [] if x))
+        for period in PERIODS:
+            count = 1
+            for start, seconds in split_by_period(period, since, until):
+                for tag in tags:
+                    key = period, start, activity, category, tag
+                    known = contributions.get(key, (0, 0))
+                    contributions[key] = (known[0] + seconds,
+                                          known[1] + count)
+                count = 0
+    return contributions
+
+
+class RollupStore(object):
+    """
+    In-memory rollups: `{period: {period_start: {(activity, category, tag):
+    [seconds, count, contributors]}}}`.
+    """
+
+    def __init__(self):
+        self._data = dict((x, {}) for x in PERIODS)
+
+    def add(self, contributions, sign=1):
+        """
+        Adds (or, with `sign=-1`, subtracts) contributions computed by
+        :func:`compute_contributions`.
+        """
+        for key, (seconds, count) in contributions.items():
+            period, start, activity, category, tag = key
+            buckets = self._data[period].setdefault(start, {})
+            bucket_key = activity, category, tag
+            bucket = buckets.setdefault(bucket_key, [0, 0, 0])
+            bucket[0] += sign * seconds
+            bucket[1] += sign * count
+            bucket[2] += sign
+            if not bucket[2]:
+                del buckets[bucket_key]
+                if not buckets:
+                    del self._data[period][start]
+
+    def query(self, period, since=None, until=None, match=None, tag=None):
+        """
+        Returns a list of :class:`Rollup` objects, one per period between
+        `since` and `until`, summed over the activities and categories for
+        which `match({'activity': ..., 'category': ...})` is true.  Periods
+        without matching facts are included with zero values.
+        """
+        periods = self._data[period]
+        if not periods:
+            return []
+        start = get_period_start(period, since) if since else min(periods)
+        last = get_period_start(period, until) if until else max(periods)
+
+        rollups = []
+        while start <= last:
+            seconds = 0
+            count = 0
+            for (activity, category, _tag), bucket in periods.get(start, {}).items():
+                if _tag != tag:
+                    continue
+                if match and not match({'activity': activity,
+                                        'category': category}):
+                    continue
+                seconds += bucket[0]
+                count += bucket[1]
+            rollups.append(Rollup(start, datetime.timedelta(seconds=seconds),
+                                  count))
+            start = get_next_period_start(period, start)
+        return rollups
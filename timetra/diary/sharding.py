@@ -0,0 +1,267 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Sharding
+========
+
+A backend combining several diaries (e.g. per person or per machine) into
+one logical facts database.
+
+* reads are sent to all shards in parallel; `find()` merges their
+  time-ordered streams with a heap, aggregates are summed up;
+* new facts are routed to a shard by a :class:`Router`.
+
+Configuration example (see :func:`~timetra.diary.app._init_storage`)::
+
+    backend:
+        type: sharded
+        shards:
+            home:
+                data_dir: ~/diary
+            work:
+                data_dir: ~/work-diary
+        routes:
+            - shard: work
+              activity: work,meeting
+        default: home
+"""
+from concurrent import futures
+import datetime
+import heapq
+import operator
+
+from . import models, rollups
+from .prefetch import prefetch
+from .query import make_query
+from .storage import FactNotFound
+
+
+__all__ = ['Router', 'ShardedBackend']
+
+
+READ_AHEAD = 256
+""" Number of facts fetched ahead from each shard during `find()`.
+"""
+
+
+class Router(object):
+    """
+    Picks the shard for a new fact.  Each rule is a dictionary with the
+    shard name (`shard`) and `find()` criteria (`activity`, `description`,
+    `tag`); the first matching rule wins.  Facts matching no rule go to the
+    `default` shard.
+    """
+
+    def __init__(self, rules=(), default=None):
+        self.default = default
+        self.rules = []
+        for rule in rules:
+            criteria = dict(rule)
+            shard = criteria.pop('shard')
+            self.rules.append((shard, make_query(**criteria).match))
+
+    def __call__(self, fact):
+        for shard, match in self.rules:
+            if match(fact):
+                return shard
+        return self.default
+
+
+class ShardedBackend(object):
+    """
+    :param shards: `{name: backend}`; the order matters for facts starting
+        at the same time (they are returned in shard order).
+    :param route: a callable that takes a fact and returns the name of the
+        shard to store it in (e.g. a :class:`Router`).
+    """
+
+    def __init__(self, shards, route):
+        if not shards:
+            raise ValueError('at least one shard is required')
+        self.shards = shards
+        self.route = route
+        self._executor = futures.ThreadPoolExecutor(len(shards))
+
+    def _map(self, method, *args, **kwargs):
+        "Calls given method of each shard in parallel; returns the results."
+        calls = [self._executor.submit(getattr(x, method), *args, **kwargs)
+                 for x in self.shards.values()]
+        return [x.result() for x in calls]
+
+    def _get_shard(self, fact):
+        name = self.route(fact)
+        if name not in self.shards:
+            raise ValueError('unknown shard "{0}"'.format(name))
+        return self.shards[name]
+
+    def _find_shard(self, fact):
+        """
+        Returns the shard containing a fact with the start time and activity
+        of given one.  The shard it is routed to is tried first; others are
+        probed in case the fact was stored before the rules changed.
+        """
+        shards = list(self.shards.values())
+        routed = self.shards.get(self.route(fact))
+        if routed is not None:
+            shards.remove(routed)
+            shards.insert(0, routed)
+        for shard in shards:
+            try:
+                found = shard.get(fact['since'])
+            except FactNotFound:
+                continue
+            if found.get('activity') == fact.get('activity'):
+                return shard
+        raise FactNotFound('{} {}'.format(fact['since'], fact.get('activity')))
+
+    def close(self):
+        "Stops the threads and closes the shards which support it."
+        self._executor.shutdown()
+        for shard in self.shards.values():
+            if hasattr(shard, 'close'):
+                shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find(self, limit=None, offset=0, reverse=False, fields=None,
+             **criteria):
+        """
+        Returns a generator that yields facts from all shards in
+        chronological order (or newest first if `reverse` is true).  Each
+        shard is scanned in its own thread.
+        """
+        shard_fields = fields
+        if fields is not None and 'since' not in fields:
+            # needed for merging
+            shard_fields = tuple(fields) + ('since',)
+        shard_limit = None if limit is None else offset + limit
+        streams = [prefetch(lambda x: x,
+                            shard.find(limit=shard_limit, reverse=reverse,
+                                       fields=shard_fields, **criteria),
+                            READ_AHEAD)
+                   for shard in self.shards.values()]
+        return self._merge(streams, limit, offset, reverse,
+                           strip_since=shard_fields is not fields)
+
+    def _merge(self, streams, limit, offset, reverse, strip_since):
+        merged = heapq.merge(*streams, key=operator.itemgetter('since'),
+                             reverse=reverse)
+        try:
+            for i, fact in enumerate(merged):
+                if i < offset:
+                    continue
+                if limit is not None and offset + limit <= i:
+                    return
+                if strip_since:
+                    del fact['since']
+                yield fact
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def explain(self, **criteria):
+        lines = []
+        for name, text in zip(self.shards, self._map('explain', **criteria)):
+            lines.append('shard {0}:'.format(name))
+            lines.extend('  ' + x for x in text.splitlines())
+        return '\n'.join(lines)
+
+    def count(self, group_by=None, **criteria):
+        results = self._map('count', group_by=group_by, **criteria)
+        if group_by is None:
+            return sum(results)
+        counts = {}
+        for result in results:
+            for key, value in result.items():
+                counts[key] = counts.get(key, 0) + value
+        return counts
+
+    def total_duration(self, **criteria):
+        return sum(self._map('total_duration', **criteria),
+                   datetime.timedelta())
+
+    def exists(self, **criteria):
+        return any(self._map('exists', **criteria))
+
+    def get_rollups(self, period, since=None, until=None, activity=None,
+                    category=None, tag=None):
+        totals = {}
+        for result in self._map('get_rollups', period, since=since,
+                                until=until, activity=activity,
+                                category=category, tag=tag):
+            for rollup in result:
+                duration, count = totals.get(rollup.period,
+                                             (datetime.timedelta(), 0))
+                totals[rollup.period] = (duration + rollup.duration,
+                                         count + rollup.count)
+        return [rollups.Rollup(start, duration, count)
+                for start, (duration, count) in sorted(totals.items())]
+
+    def get_day_file_mtimes(self, since=None, until=None):
+        "See :meth:`~timetra.diary.storage.YamlBackend.get_day_file_mtimes`."
+        mtimes = {}
+        for shard in self.shards.values():
+            get_mtimes = getattr(shard, 'get_day_file_mtimes', None)
+            if get_mtimes is not None:
+                mtimes.update(get_mtimes(since=since, until=until))
+        return mtimes
+
+    def get(self, date_time):
+        for shard in self.shards.values():
+            try:
+                return shard.get(date_time)
+            except FactNotFound:
+                pass
+        raise FactNotFound(date_time)
+
+    def get_latest(self):
+        latest = []
+        for shard in self.shards.values():
+            try:
+                latest.append(shard.get_latest())
+            except StopIteration:
+                pass
+        if not latest:
+            raise StopIteration
+        # the first shard wins if facts start at the same time
+        return max(latest, key=operator.itemgetter('since'))
+
+    def add(self, fact):
+        return self._get_shard(fact).add(fact)
+
+    def delete(self, since, activity):
+        shard = self._find_shard({'since': since, 'activity': activity})
+        return shard.delete(since, activity)
+
+    def update(self, old_fact, kwargs):
+        shard = self._find_shard(old_fact)
+        new_fact = models.Fact(old_fact, **kwargs)
+        target = self._get_shard(new_fact)
+        if target is shard:
+            return shard.update(old_fact, kwargs)
+        # the fact moves to another shard; it is added (and validated)
+        # first, so that nothing is lost if it is invalid
+        target.add(new_fact)
+        shard.delete(old_fact['since'], old_fact['activity'])
@@ -0,0 +1,449 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Snapshot
+========
+
+A read-only columnar copy of the whole diary for analytics.  The file is
+opened with `mmap`, so processes reading the same snapshot share its pages
+and no data is copied until a fact is actually looked at.
+
+File layout (native byte order, every section aligned to 8 bytes):
+
+* header: magic, number of facts `N`, number of tag references `T`, size of
+  the description heap `H`, size of the metadata `M`;
+* `since`, `until`: int64[N], seconds since 1970-01-01 (naive; `until` of an
+  unfinished fact is :data:`NO_VALUE`);
+* `activity`, `category`: int32[N], ids in the metadata dictionaries
+  (:data:`NO_VALUE` if not set);
+* `flags`: int8[N], see `FLAG_*`;
+* `tag_offsets`: int64[N+1] and `tag_ids`: int32[T];
+* `description_offsets`: int64[N+1] and the UTF-8 heap: bytes[H];
+* metadata: JSON with the dictionaries and `{day_path: [mtime, first_row,
+  row_count]}` for incremental updates.
+
+Facts are stored in chronological order, so date ranges are found by
+bisection.  The facts of each day file are sorted when the snapshot is
+built; if a day file contains facts which start after those of the next
+day, the build fails.  The snapshot only keeps whole seconds.
+
+Use :func:`update_snapshot` to (re)build the file; only day files modified
+since the previous build are parsed.  A :class:`Snapshot` can be wrapped
+in :class:`~timetra.diary.storage.Storage` and passed to reporting
+functions.
+"""
+from array import array
+import bisect
+import datetime
+import json
+import mmap
+import os
+import struct
+
+from . import models, rollups, utils
+from .frame import FactFrame, UNFINISHED, from_seconds, to_seconds
+from .query import compile_filters, make_query
+from .storage import StorageError
+
+
+__all__ = ['Snapshot', 'update_snapshot']
+
+
+MAGIC = b'TTSNAP\x00\x01'
+HEADER = struct.Struct('=8sqqqq')
+NO_VALUE = UNFINISHED
+
+FLAG_NO_DESCRIPTION = 1
+FLAG_NO_TAGS = 2
+
+
+def _padding(size):
+    return -size % 8
+
+
+class Snapshot(object):
+    "Read-only access to a snapshot file."
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, tag_count, heap_size, meta_size = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise StorageError('{0} is not a snapshot file'.format(path))
+
+        self._views = [memoryview(self._mmap)]
+        self._pos = HEADER.size
+        section = self._read_section
+        self.since = section('q', count)
+        self.until = section('q', count)
+        self.activity = section('i', count)
+        self.category = section('i', count)
+        self.flags = section('b', count)
+        self.tag_offsets = section('q', count + 1)
+        self.tag_ids = section('i', tag_count)
+        self.description_offsets = section('q', count + 1)
+        self._heap = section('B', heap_size)
+        meta = json.loads(bytes(section('B', meta_size)).decode('utf-8'))
+
+        self.activities = meta['activities']
+        self.categories = meta['categories']
+        self.tags = meta['tags']
+        self.days = meta['days']
+
+    def _read_section(self, fmt, length):
+        size = struct.calcsize(fmt) * length
+        chunk = self._views[0][self._pos:self._pos + size]
+        self._views.append(chunk)
+        self._pos += size + _padding(size)
+        if fmt == 'B':
+            return chunk
+        view = chunk.cast(fmt)
+        self._views.append(view)
+        return view
+
+    def __len__(self):
+        return len(self.since)
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_description(self, i):
+        if self.flags[i] & FLAG_NO_DESCRIPTION:
+            return None
+        start = self.description_offsets[i]
+        end = self.description_offsets[i + 1]
+        return bytes(self._heap[start:end]).decode('utf-8')
+
+    def get_tags(self, i):
+        if self.flags[i] & FLAG_NO_TAGS:
+            return None
+        start = self.tag_offsets[i]
+        end = self.tag_offsets[i + 1]
+        return [self.tags[x] if x != NO_VALUE else None
+                for x in self.tag_ids[start:end]]
+
+    def get_record(self, i, description=True):
+        """
+        Returns a dictionary with the fields of `i`-th fact.  The description
+        is only decoded if requested.
+        """
+        activity = self.activity[i]
+        category = self.category[i]
+        until = self.until[i]
+        record = {
+            'since': from_seconds(self.since[i]),
+            'until': None if until == NO_VALUE else from_seconds(until),
+            'activity': None if activity == NO_VALUE else self.activities[activity],
+        }
+        if category != NO_VALUE:
+            record['category'] = self.categories[category]
+        tags = self.get_tags(i)
+        if tags is not None:
+            record['tags'] = tags
+        if description:
+            record['description'] = self.get_description(i)
+        return record
+
+    def _get_range(self, since=None, until=None):
+        start = 0
+        end = len(self)
+        if since:
+            since = utils.to_datetime(utils.to_date(since))
+            start = bisect.bisect_left(self.since, to_seconds(since))
+        if until:
+            until = utils.to_datetime(utils.to_date(until))
+            until += datetime.timedelta(days=1)
+            end = bisect.bisect_left(self.since, to_seconds(until))
+        return start, end
+
+    def _scan(self, query, reverse=False, description=True):
+        start, end = self._get_range(query.since, query.until)
+        positions = range(start, end)
+        if reverse:
+            positions = reversed(positions)
+        description = description or 'description' in query.where.keys()
+        match = query.match
+        for i in positions:
+            record = self.get_record(i, description=description)
+            if match(record):
+                yield record
+
+    def find(self, limit=None, offset=0, reverse=False, fields=None,
+             **criteria):
+        query = make_query(**criteria)
+        need_description = fields is None or 'description' in fields
+        records = self._scan(query, reverse=reverse,
+                             description=need_description)
+        found = 0
+        for record in records:
+            found += 1
+            if found <= offset:
+                continue
+            if limit is not None and offset + limit < found:
+                return
+            if fields is None:
+                yield models.FactRecord(record)
+            else:
+                yield models.FactProjection((k, record.get(k)) for k in fields)
+
+    def get_latest(self):
+        if not len(self):
+            raise StopIteration
+        return models.FactRecord(self.get_record(len(self) - 1))
+
+    def get_known_activities(self):
+        pairs = set(zip(self.category, self.activity))
+        known = []
+        for category, activity in pairs:
+            if activity == NO_VALUE:
+                continue
+            known.append((
+                self.categories[category] if category != NO_VALUE else '',
+                self.activities[activity]))
+        return [{'activity': a, 'category': c or None}
+                for c, a in sorted(known)]
+
+    def count(self, group_by=None, **criteria):
+        query = make_query(**criteria)
+        records = self._scan(query, description=False)
+        if group_by is None:
+            return sum(1 for x in records)
+        counts = {}
+        for record in records:
+            value = record.get(group_by)
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def total_duration(self, **criteria):
+        query = make_query(**criteria)
+        now = to_seconds(datetime.datetime.now())
+        seconds = 0
+        if not query.where.keys():
+            # plain sum over the columns
+            start, end = self._get_range(query.since, query.until)
+            for i in range(start, end):
+                until = self.until[i]
+                seconds += (now if until == NO_VALUE else until) - self.since[i]
+        else:
+            for record in self._scan(query, description=False):
+                until = record['until'] or datetime.datetime.now()
+                seconds += (until - record['since']).total_seconds()
+        return datetime.timedelta(seconds=seconds)
+
+    def exists(self, **criteria):
+        query = make_query(**criteria)
+        for _ in self._scan(query, description=False):
+            return True
+        return False
+
+    def get_rollups(self, period, since=None, until=None, activity=None,
+                    category=None, tag=None):
+        # every day of the periods in range contributes to the buckets
+        query = make_query(*rollups.get_source_range(period, since, until))
+        store = rollups.RollupStore()
+        store.add(rollups.compute_contributions(
+            self._scan(query, description=False)))
+        filters = {}
+        if activity:
+            filters['activity'] = activity
+        if category:
+            filters['category'] = category
+        match = compile_filters(filters).compile() if filters else None
+        return store.query(period, since=since, until=until, match=match,
+                           tag=tag)
+
+    def to_frame(self, since=None, until=None, **criteria):
+        """
+        Returns a :class:`~timetra.diary.frame.FactFrame`.  Without filters
+        other than dates the columns are sliced directly from the snapshot
+        (with NumPy they share memory, so keep the snapshot open while the
+        frame is in use).
+        """
+        query = make_query(since=since, until=until, **criteria)
+        if query.where.keys():
+            return FactFrame.from_records(self._scan(query, description=False))
+        start, end = self._get_range(query.since, query.until)
+        return FactFrame(self.since[start:end], self.until[start:end],
+                         self.activity[start:end], self.category[start:end],
+                         self.activities, self.categories)
+
+    def _read_only(self, *args, **kwargs):
+        raise StorageError('snapshot is read-only')
+
+    add = update = delete = get = _read_only
+
+
+class _Columns(object):
+    "Columns of a snapshot being built."
+
+    def __init__(self, meta):
+        self.since = array('q')
+        self.until = array('q')
+        self.activity = array('i')
+        self.category = array('i')
+        self.flags = array('b')
+        self.tag_offsets = array('q', [0])
+        self.tag_ids = array('i')
+        self.description_offsets = array('q', [0])
+        self.heap = bytearray()
+        # dictionaries only grow, so ids from the previous build stay valid
+        self.dictionaries = {}
+        for name in ('activities', 'categories', 'tags'):
+            values = list(meta.get(name, []))
+            ids = dict((v, i) for i, v in enumerate(values))
+            self.dictionaries[name] = values, ids
+
+    def encode(self, name, value):
+        if value is None:
+            return NO_VALUE
+        values, ids = self.dictionaries[name]
+        if value not in ids:
+            ids[value] = len(values)
+            values.append(value)
+        return ids[value]
+
+    def append_fact(self, fact):
+        until = fact.get('until')
+        self.since.append(to_seconds(fact['since']))
+        self.until.append(NO_VALUE if until is None else to_seconds(until))
+        self.activity.append(self.encode('activities', fact.get('activity')))
+        self.category.append(self.encode('categories', fact.get('category')))
+
+        flags = 0
+        description = fact.get('description')
+        if description is None:
+            flags |= FLAG_NO_DESCRIPTION
+        else:
+            self.heap.extend(description.encode('utf-8'))
+        self.description_offsets.append(len(self.heap))
+
+        tags = fact['tags'] if 'tags' in fact else None
+        if tags is None:
+            flags |= FLAG_NO_TAGS
+        else:
+            self.tag_ids.extend(self.encode('tags', x) for x in tags)
+        self.tag_offsets.append(len(self.tag_ids))
+        self.flags.append(flags)
+
+    def copy_rows(self, snapshot, start, count):
+        "Copies rows from previous build (ids are compatible)."
+        end = start + count
+        self.since.extend(snapshot.since[start:end])
+        self.until.extend(snapshot.until[start:end])
+        self.activity.extend(snapshot.activity[start:end])
+        self.category.extend(snapshot.category[start:end])
+        self.flags.extend(snapshot.flags[start:end])
+
+        tag_start = snapshot.tag_offsets[start]
+        tag_base = len(self.tag_ids) - tag_start
+        self.tag_ids.extend(snapshot.tag_ids[tag_start:snapshot.tag_offsets[end]])
+        self.tag_offsets.extend(x + tag_base
+                                for x in snapshot.tag_offsets[start + 1:end + 1])
+
+        heap_start = snapshot.description_offsets[start]
+        heap_base = len(self.heap) - heap_start
+        self.heap.extend(snapshot._heap[heap_start:snapshot.description_offsets[end]])
+        self.description_offsets.extend(
+            x + heap_base for x in snapshot.description_offsets[start + 1:end + 1])
+
+    def write(self, f, days):
+        meta = {
+            'activities': self.dictionaries['activities'][0],
+            'categories': self.dictionaries['categories'][0],
+            'tags': self.dictionaries['tags'][0],
+            'days': days,
+        }
+        meta = json.dumps(meta).encode('utf-8')
+        f.write(HEADER.pack(MAGIC, len(self.since), len(self.tag_ids),
+                            len(self.heap), len(meta)))
+        sections = [self.since, self.until, self.activity, self.category,
+                    self.flags, self.tag_offsets, self.tag_ids,
+                    self.description_offsets, self.heap, meta]
+        for section in sections:
+            data = section.tobytes() if isinstance(section, array) else section
+            f.write(data)
+            f.write(b'\0' * _padding(len(data)))
+
+
+def update_snapshot(backend, path):
+    """
+    Builds or refreshes the snapshot of given
+    :class:`~timetra.diary.storage.YamlBackend` at given path.  Day files not
+    modified since the previous build are copied from the old snapshot
+    without parsing.  The file is replaced atomically, so processes still
+    reading the old snapshot are not affected.
+
+    Returns a `(copied, parsed)` tuple with the numbers of day files.
+    """
+    old = Snapshot(path) if os.path.exists(path) else None
+    try:
+        columns = _Columns({
+            'activities': old.activities,
+            'categories': old.categories,
+            'tags': old.tags,
+        } if old else {})
+        old_days = old.days if old else {}
+        days = {}
+        copied = parsed = 0
+        for day_path in backend._collect_day_paths():
+            key = os.path.relpath(day_path, backend.data_dir)
+            mtime = os.stat(day_path).st_mtime
+            first_row = len(columns.since)
+            known = old_days.get(key)
+            if known and known[0] == mtime:
+                columns.copy_rows(old, known[1], known[2])
+                copied += 1
+            else:
+                # hand-edited day files may be out of order
+                facts = sorted(backend.get_cached_day_file(day_path),
+                               key=lambda x: x.seconds('since'))
+                for fact in facts:
+                    columns.append_fact(fact)
+                parsed += 1
+            if (0 < first_row < len(columns.since) and
+                    columns.since[first_row] < columns.since[first_row - 1]):
+                raise StorageError(
+                    '{0}: facts of previous days start later, cannot build '
+                    'the snapshot'.format(day_path))
+            days[key] = [mtime, first_row, len(columns.since) - first_row]
+
+        if old and not parsed and sorted(days) == sorted(old_days):
+            return copied, parsed
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            columns.write(f, days)
+    finally:
+        if old:
+            old.close()
+    os.replace(tmp_path, path)
+    return copied, parsed
@@ -0,0 +1,489 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+SQLite Backend
+==============
+
+An alternative to :class:`~timetra.diary.storage.YamlBackend` for large
+histories.  The database runs in WAL mode, so any number of readers can
+work alongside a writer.
+
+Dates and times are stored as integer microseconds since 1970-01-01 (naive,
+same as in the YAML files), which keeps range, time-of-day, weekday and
+duration filters in plain integer arithmetic.
+
+Use :func:`import_yaml` and :func:`export_yaml` to convert between the YAML
+tree and the database.  The conversion is lossless: the database remembers
+the day file and position of each imported fact, so exporting an imported
+tree produces identical day files.
+"""
+import datetime
+import itertools
+import json
+import os
+import sqlite3
+import threading
+
+from . import models, rollups, utils
+from .query import (Term, And, Or, Not, StartTime, Weekday, Duration,
+                    Everything, make_query)
+from .storage import FactNotFound
+from .validation import validate_fact
+
+
+__all__ = ['SqliteBackend', 'import_yaml', 'export_yaml']
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECONDS_PER_MINUTE = 60 * 10 ** 6
+MICROSECONDS_PER_DAY = 24 * 60 * MICROSECONDS_PER_MINUTE
+EPOCH_WEEKDAY = EPOCH.weekday()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS facts (
+    id INTEGER PRIMARY KEY,
+    since INTEGER NOT NULL,
+    until INTEGER,
+    activity TEXT,
+    category TEXT,
+    description TEXT,
+    tags TEXT,
+    hamster_fact_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS fact_tags (
+    fact_id INTEGER NOT NULL REFERENCES facts(id) ON DELETE CASCADE,
+    tag TEXT
+);
+CREATE INDEX IF NOT EXISTS facts_since ON facts (since);
+CREATE INDEX IF NOT EXISTS facts_until ON facts (until);
+CREATE INDEX IF NOT EXISTS facts_activity ON facts (activity, category);
+CREATE INDEX IF NOT EXISTS fact_tags_tag ON fact_tags (tag);
+CREATE INDEX IF NOT EXISTS fact_tags_fact ON fact_tags (fact_id);
+'''
+
+COLUMNS = ('since', 'until', 'activity', 'category', 'description', 'tags',
+           'hamster_fact_id')
+
+# where imported facts were found in the YAML tree (see `export_yaml`):
+# the day file relative to the data directory and the position in it
+SOURCE_COLUMNS = (('day_file', 'TEXT'), ('position', 'INTEGER'))
+
+# columns that can be matched by `Term` nodes as text
+TEXT_COLUMNS = ('activity', 'category', 'description')
+
+
+def delta_to_microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def to_microseconds(date_time):
+    return delta_to_microseconds(date_time - EPOCH)
+
+
+def from_microseconds(value):
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+
+def _contains(haystack, needle):
+    # Python's `str.lower()` is used instead of SQL `lower()` which only
+    # supports ASCII
+    return needle in str(haystack or '').lower()
+
+
+def fact_to_row(fact):
+    "Returns a tuple of :data:`COLUMNS` values for given fact."
+    tags = fact['tags'] if 'tags' in fact else None
+    return (
+        to_microseconds(fact['since']),
+        to_microseconds(fact['until']) if fact.get('until') else None,
+        fact.get('activity'),
+        fact['category'] if 'category' in fact else None,
+        fact.get('description'),
+        None if tags is None else json.dumps(tags),
+        fact.get('hamster_fact_id'),
+    )
+
+
+def row_to_dict(row):
+    """
+    Returns a dictionary for given row of :data:`COLUMNS` values.  Optional
+    keys that were absent in the original fact are omitted.
+    """
+    since, until, activity, category, description, tags, hamster_id = row
+    data = {
+        'activity': activity,
+        'since': from_microseconds(since),
+        'until': None if until is None else from_microseconds(until),
+        'description': description,
+    }
+    if category is not None:
+        data['category'] = category
+    if tags is not None:
+        data['tags'] = json.loads(tags)
+    if hamster_id is not None:
+        data['hamster_fact_id'] = hamster_id
+    return data
+
+
+def compile_sql(node, params, now):
+    """
+    Returns an SQL expression equivalent to given predicate tree; parameters
+    are appended to the `params` list.
+    """
+    if isinstance(node, Everything):
+        return '1'
+    if isinstance(node, Term):
+        if node.key == 'tags':
+            expression = ('EXISTS (SELECT 1 FROM fact_tags t WHERE t.fact_id '
+                          '= facts.id AND timetra_contains(t.tag, ?))')
+        elif node.key in TEXT_COLUMNS:
+            expression = 'timetra_contains({0}, ?)'.format(node.key)
+        elif node.key == 'hamster_fact_id':
+            expression = 'timetra_contains(CAST(hamster_fact_id AS TEXT), ?)'
+        else:
+            # unknown fields are never set
+            return '0'
+        params.append(node.needle)
+        return expression
+    if isinstance(node, And):
+        return '({0})'.format(' AND '.join(
+            compile_sql(x, params, now) for x in node.children))
+    if isinstance(node, Or):
+        return '({0})'.format(' OR '.join(
+            compile_sql(x, params, now) for x in node.children))
+    if isinstance(node, Not):
+        return 'NOT {0}'.format(compile_sql(node.child, params, now))
+    if isinstance(node, StartTime):
+        minute = '((since % {0}) / {1})'.format(MICROSECONDS_PER_DAY,
+                                                MICROSECONDS_PER_MINUTE)
+        params.extend([node.low, node.high])
+        if node.high < node.low:
+            return '({0} >= ? OR {0} < ?)'.format(minute)
+        return '({0} >= ? AND {0} < ?)'.format(minute)
+    if isinstance(node, Weekday):
+        days = sorted(node.days)
+        params.extend(days)
+        return '(((since / {0}) + {1}) % 7 IN ({2}))'.format(
+            MICROSECONDS_PER_DAY, EPOCH_WEEKDAY, ', '.join('?' for x in days))
+    if isinstance(node, Duration):
+        duration = '(coalesce(until, ?) - since)'
+        clauses = []
+        if node.min_duration is not None:
+            params.extend([now, delta_to_microseconds(node.min_duration)])
+            clauses.append('{0} >= ?'.format(duration))
+        if node.max_duration is not None:
+            params.extend([now, delta_to_microseconds(node.max_duration)])
+            clauses.append('{0} <= ?'.format(duration))
+        return '({0})'.format(' AND '.join(clauses) or '1')
+    raise TypeError('cannot translate {0!r} to SQL'.format(node))
+
+
+class SqliteBackend:
+    """
+    Provides low-level access to the facts database stored in SQLite.
+
+    Each thread gets its own connection (SQLite connections cannot be shared
+    between threads), so the backend can be used from thread pools, e.g. by
+    :class:`~timetra.diary.aio.AsyncStorage`; in WAL mode their reads do not
+    block each other.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self.db.executescript(SCHEMA)
+        known = [x[1] for x in self.db.execute('PRAGMA table_info(facts)')]
+        for name, column_type in SOURCE_COLUMNS:
+            if name not in known:
+                self.db.execute('ALTER TABLE facts ADD COLUMN {0} {1}'.format(
+                    name, column_type))
+
+    @property
+    def db(self):
+        "The connection of the current thread."
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute('PRAGMA foreign_keys=ON')
+        db.create_function('timetra_contains', 2, _contains)
+        with self._lock:
+            self._connections.append(db)
+        return db
+
+    def close(self):
+        "Closes the connections of all threads."
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            db.close()
+        self._local = threading.local()
+
+    def _make_where(self, query):
+        params = []
+        clauses = []
+        if query.since:
+            since = utils.to_datetime(utils.to_date(query.since))
+            clauses.append('since >= ?')
+            params.append(to_microseconds(since))
+        if query.until:
+            until = utils.to_datetime(utils.to_date(query.until))
+            clauses.append('since < ?')
+            params.append(to_microseconds(until + datetime.timedelta(days=1)))
+        now = to_microseconds(datetime.datetime.now())
+        clauses.append(compile_sql(query.where, params, now))
+        return ' AND '.join(clauses), params
+
+    def _select(self, query, columns, reverse=False, limit=None, offset=0):
+        where, params = self._make_where(query)
+        order = 'DESC' if reverse else 'ASC'
+        sql = ('SELECT {0} FROM facts WHERE {1} '
+               'ORDER BY since {2}, id {2}'.format(', '.join(columns), where,
+                                                  order))
+        if limit is not None or offset:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([-1 if limit is None else limit, offset])
+        return self.db.execute(sql, params)
+
+    def _insert(self, items):
+        """
+        Inserts facts from given `(fact, source)` pairs, where `source` is
+        the `(day_file, position)` of a fact read from a YAML tree (see
+        :data:`SOURCE_COLUMNS`) or `None`.
+        """
+        columns = COLUMNS + tuple(x for x, _ in SOURCE_COLUMNS)
+        sql = 'INSERT INTO facts ({0}) VALUES ({1})'.format(
+            ', '.join(columns), ', '.join('?' for x in columns))
+        for fact, source in items:
+            cursor = self.db.execute(
+                sql, fact_to_row(fact) + tuple(source or (None, None)))
+            fact_id = cursor.lastrowid
+            self.db.executemany(
+                'INSERT INTO fact_tags (fact_id, tag) VALUES (?, ?)',
+                [(fact_id, tag) for tag in fact.get('tags') or []])
+            yield fact_id
+
+    def add(self, fact):
+        # same as in YamlBackend
+        validate_fact(fact)
+        with self.db:
+            fact_id, = self._insert([(fact, None)])
+        return '{0}#{1}'.format(self.path, fact_id)
+
+    def bulk_add(self, facts):
+        """
+        Adds given facts in a single transaction.  The facts are expected to
+        be already validated.
+        """
+        self._bulk_insert((x, None) for x in facts)
+
+    def _bulk_insert(self, items):
+        with self.db:
+            for _ in self._insert(items):
+                pass
+
+    def get(self, date_time):
+        row = self.db.execute(
+            'SELECT {0} FROM facts WHERE since = ? ORDER BY id LIMIT 1'
+            .format(', '.join(COLUMNS)),
+            (to_microseconds(date_time),)).fetchone()
+        if row is None:
+            raise FactNotFound(date_time)
+        return models.FactRecord(row_to_dict(row))
+
+    def delete(self, since, activity):
+        with self.db:
+            self._delete(since, activity)
+
+    def _delete(self, since, activity):
+        row = self.db.execute(
+            'SELECT id FROM facts WHERE since = ? AND activity = ? '
+            'ORDER BY id LIMIT 1',
+            (to_microseconds(since), activity)).fetchone()
+        if row is None:
+            raise FactNotFound('{} {}'.format(since, activity))
+        self.db.execute('DELETE FROM facts WHERE id = ?', row)
+
+    def update(self, old_fact, kwargs):
+        # make sure it exists
+        existing_fact = self.get(old_fact['since'])
+        assert existing_fact['activity'] == old_fact['activity']
+
+        new_fact = models.Fact(old_fact, **kwargs)
+        new_fact.validate()
+
+        # unlike YamlBackend, both steps are done in a single transaction
+        with self.db:
+            self._delete(old_fact['since'], old_fact['activity'])
+            for _ in self._insert([(new_fact, None)]):
+                pass
+
+    def get_latest(self):
+        row = self.db.execute(
+            'SELECT {0} FROM facts ORDER BY since DESC, id DESC LIMIT 1'
+            .format(', '.join(COLUMNS))).fetchone()
+        if row is None:
+            raise StopIteration
+        return models.FactRecord(row_to_dict(row))
+
+    def get_known_activities(self):
+        rows = self.db.execute(
+            'SELECT DISTINCT category, activity FROM facts '
+            'ORDER BY category, activity')
+        return [{'activity': a, 'category': c} for c, a in rows]
+
+    def find(self, limit=None, offset=0, reverse=False, fields=None,
+             **criteria):
+        query = make_query(**criteria)
+        cursor = self._select(query, COLUMNS, reverse=reverse, limit=limit,
+                              offset=offset)
+        for row in cursor:
+            data = row_to_dict(row)
+            if fields is None:
+                yield models.FactRecord(data)
+            else:
+                yield models.FactProjection((k, data.get(k)) for k in fields)
+
+    def explain(self, **criteria):
+        query = make_query(**criteria)
+        where, params = self._make_where(query)
+        rows = self.db.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM facts WHERE {0} '
+            'ORDER BY since, id'.format(where), params)
+        lines = ['predicate: {0!r}'.format(query.where)]
+        lines.extend(row[-1] for row in rows)
+        return '\n'.join(lines)
+
+    def count(self, group_by=None, **criteria):
+        query = make_query(**criteria)
+        where, params = self._make_where(query)
+        if group_by is None:
+            sql = 'SELECT count(*) FROM facts WHERE {0}'.format(where)
+            return self.db.execute(sql, params).fetchone()[0]
+        if group_by not in COLUMNS or group_by == 'tags':
+            raise ValueError('cannot group by {0}'.format(group_by))
+        sql = ('SELECT {0}, count(*) FROM facts WHERE {1} GROUP BY {0}'
+               .format(group_by, where))
+        return dict(self.db.execute(sql, params))
+
+    def total_duration(self, **criteria):
+        query = make_query(**criteria)
+        where, params = self._make_where(query)
+        sql = ('SELECT coalesce(sum(coalesce(until, ?) - since), 0) '
+               'FROM facts WHERE {0}'.format(where))
+        now = to_microseconds(datetime.datetime.now())
+        microseconds = self.db.execute(sql, [now] + params).fetchone()[0]
+        return datetime.timedelta(microseconds=microseconds)
+
+    def exists(self, **criteria):
+        query = make_query(**criteria)
+        return self._select(query, ['id'], limit=1).fetchone() is not None
+
+    def get_rollups(self, period, since=None, until=None, activity=None,
+                    category=None, tag=None):
+        # every day of the periods in range contributes to the buckets
+        day_since, day_until = rollups.get_source_range(period, since, until)
+        facts = self.find(since=day_since, until=day_until)
+        store = rollups.RollupStore()
+        store.add(rollups.compute_contributions(facts))
+        filters = {}
+        if activity:
+            filters['activity'] = activity
+        if category:
+            filters['category'] = category
+        match = make_query(**filters).match if filters else None
+        return store.query(period, since=since, until=until, match=match,
+                           tag=tag)
+
+
+def import_yaml(yaml_backend, sqlite_backend):
+    """
+    Copies all facts from given :class:`~timetra.diary.storage.YamlBackend`
+    to given :class:`SqliteBackend`, remembering the day file and position
+    of each fact.  Returns the number of facts.
+    """
+    count = [0]
+
+    def _facts():
+        for day_path in yaml_backend._collect_day_paths():
+            day_file = os.path.relpath(day_path, yaml_backend.data_dir)
+            day_facts = yaml_backend.get_cached_day_file(day_path)
+            for position, fact in enumerate(day_facts):
+                count[0] += 1
+                yield fact, (day_file, position)
+
+    sqlite_backend._bulk_insert(_facts())
+    return count[0]
+
+
+def _insert_by_time(day_facts, fact):
+    # same place as in `YamlBackend.add()`
+    for i, other in enumerate(day_facts):
+        if fact['since'] < other['since']:
+            day_facts.insert(i, fact)
+            return
+    day_facts.append(fact)
+
+
+def export_yaml(sqlite_backend, yaml_backend):
+    """
+    Writes all facts from given :class:`SqliteBackend` to the day files of
+    given :class:`~timetra.diary.storage.YamlBackend`, replacing the files
+    that have facts in the database.  Returns the number of facts.
+
+    Imported facts are written to the files they were read from, in the same
+    order, so an imported tree is reproduced exactly (including unsorted day
+    files and facts filed under another day).  Facts added or updated in the
+    database go to the file of the day they start on, after the facts which
+    start earlier or at the same time.
+    """
+    select = 'SELECT {0} FROM facts WHERE {{0}} ORDER BY {{1}}'.format(
+        ', '.join(COLUMNS + ('day_file',)))
+    db = sqlite_backend.db
+
+    # facts which were not imported are usually few
+    added = {}
+    for row in db.execute(select.format('day_file IS NULL', 'since, id')):
+        fact = models.Fact(row_to_dict(row[:-1]))
+        path = yaml_backend.get_file_path_for_day(fact['since'])
+        added.setdefault(path, []).append(fact)
+
+    count = 0
+    rows = db.execute(select.format('day_file IS NOT NULL',
+                                    'day_file, position, id'))
+    for day_file, day_rows in itertools.groupby(rows, lambda x: x[-1]):
+        path = os.path.join(yaml_backend.data_dir, day_file)
+        day_facts = [models.Fact(row_to_dict(x[:-1])) for x in day_rows]
+        for fact in added.pop(path, ()):
+            _insert_by_time(day_facts, fact)
+        yaml_backend._dump_to_file(path, day_facts)
+        count += len(day_facts)
+    for path, day_facts in sorted(added.items()):
+        yaml_backend._dump_to_file(path, day_facts)
+        count += len(day_facts)
+    return count
@@ -24,14 +24,22 @@ Storage
 """
 from collections import OrderedDict
 import datetime
+import functools
+import itertools
 import os
 #from warnings import warn
 
-import monk
 import yaml
 
 
-from . import caching, models
+from . import caching, changes, indexing, models, rollups
+from .parallel import SPLIT_MODES, parallel_scan, split_day_paths
+from .prefetch import prefetch
+from .emitter import emit_facts
+from .loader import DayFileLoader, EpochDayFileLoader
+from .frame import FactFrame
+from .query import Query, Plan, Everything, compile_filters, make_query
+from .validation import validate_fact
 
 
 __all__ = ['Storage']
@@ -121,32 +129,110 @@ def _prepare_fact_for_yaml(fact_dict):
     return fact_od
 
 
-class YamlBackend:
-    "Provides low-level access to the facts database"
+ACCESS_PATH_SCAN = 'date-range scan'
+INDEX_ACCESS_PATHS = {
+    'activity': 'activity index',
+    'tags': 'tag index',
+    'weekday': 'weekday index',
+    'minute': 'time-of-day index',
+    'duration': 'duration index',
+}
 
-    def __init__(self, data_dir, cache_dir=None):
-        self.data_dir = data_dir
-        self.cache = caching.Cache(cache_dir)
 
-    def get_cached_day_file(self, path):
-        return self.cache.get_cached_yaml_file(path, model=models.Fact)
+def _slice(facts, start, stop):
+    """
+    Same as `itertools.islice()` but closing `facts` (and thus stopping the
+    read-ahead) when closed.
+    """
+    try:
+        yield from itertools.islice(facts, start, stop)
+    finally:
+        facts.close()
 
-    def _is_fact_matching(self, fact, filters):
-        if not filters:
-            return True
-        for key, pattern in filters.items():
-            pattern = pattern.lower()
 
-            # support multiple values per key
-            value = fact.get(key)
-            if isinstance(value, list):
-                values = value
-            else:
-                values = [value]
+class YamlBackend:
+    """
+    Provides low-level access to the facts database.
+
+    :param parallel:
+        if true, scans which have to load day files of more than one year
+        (or month, see `split_by`) are run in a process pool (see
+        :mod:`timetra.diary.parallel`), unless they are limited.
+    :param workers:
+        number of worker processes (defaults to the number of CPUs).
+    :param split_by:
+        "year" or "month"; how day files are distributed among workers.
+    :param prefetch:
+        number of day files to load ahead in a background thread during
+        serial scans (see :mod:`timetra.diary.prefetch`); `0` disables
+        read-ahead.
+    :param trusted:
+        if `True`, facts that were read from a day file and not modified
+        are not validated again when the file is rewritten on `add()` or
+        `delete()`; only the new facts are.  Use it if the day files are
+        only edited through the API.
+    :param epoch_timestamps:
+        if `True`, whole-second timestamps are kept in memory (and in the
+        cache) as integer seconds and only turned into `datetime` objects
+        when accessed; reports built from
+        :class:`~timetra.diary.frame.FactFrame` never need them.
+    :param watch:
+        if `True`, the data directory is watched for changes (see
+        :meth:`watch`); meant for long-running processes.
+    """
 
-            if not any(pattern in str(v or '').lower() for v in values):
-                return False
-        return True
+    def __init__(self, data_dir, cache_dir=None, parallel=False,
+                 workers=None, split_by='year', prefetch=0, trusted=False,
+                 epoch_timestamps=False, watch=False):
+        if split_by not in SPLIT_MODES:
+            raise ValueError('unknown split mode "{0}"'.format(split_by))
+        self.data_dir = data_dir
+        loader = EpochDayFileLoader if epoch_timestamps else DayFileLoader
+        self.cache = caching.Cache(cache_dir, loader=loader)
+        self.index = indexing.FactIndex(self.cache, models.FactRecord)
+        self.parallel = parallel
+        self.workers = workers
+        self.split_by = split_by
+        self.prefetch = prefetch
+        self.trusted = trusted
+        self.watcher = None
+        if watch:
+            self.watch()
+
+    def watch(self):
+        """
+        Starts watching the data directory (see
+        :mod:`timetra.diary.watching`).  With `inotify` the cache trusts its
+        entries until their files are reported as changed, so lookups do not
+        stat day files.  Changes are reported shortly after they happen; call
+        :meth:`sync` before a read to see all of them.  Returns the watcher.
+        """
+        if self.watcher is None:
+            from . import watching
+            self.watcher = watching.make_watcher(self.data_dir,
+                                                 self.cache.mark_dirty)
+            self.watcher.start()
+            self.cache.watched = self.watcher.instant
+        return self.watcher
+
+    def sync(self):
+        """
+        Makes the cache aware of all changes made to day files so far (see
+        :meth:`watch`).  Returns `True` if any were found.
+        """
+        if self.watcher is None:
+            return False
+        return self.watcher.sync()
+
+    def unwatch(self):
+        if self.watcher is not None:
+            self.cache.watched = False
+            self.cache.mark_dirty()
+            self.watcher.stop()
+            self.watcher = None
+
+    def get_cached_day_file(self, path):
+        return self.cache.get_cached_yaml_file(path, model=models.FactRecord)
 
     def _collect_day_paths(self, since=None, until=None):
 
@@ -194,19 +280,168 @@ class YamlBackend:
 
                     yield os.path.join(month_path, day_file)
 
+    def get_day_file_mtimes(self, since=None, until=None):
+        "Returns `{path: mtime}` for day files in given date range."
+        mtimes = {}
+        for path in self._collect_day_paths(since, until):
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except FileNotFoundError:
+                # removed meanwhile
+                pass
+        return mtimes
+
+    def plan(self, query):
+        """
+        Returns a :class:`~timetra.diary.query.Plan` for given query.  The
+        cheapest access path is chosen among the date-range scan and the
+        indexes applicable to the query's predicate.
+        """
+        day_paths = list(self._collect_day_paths(since=query.since,
+                                                 until=query.until))
+        best_path, best_day_paths = ACCESS_PATH_SCAN, day_paths
+        estimates = {ACCESS_PATH_SCAN: len(day_paths)}
+
+        fields = self._get_index_fields(query)
+        if fields:
+            self.index.refresh(day_paths)
+        for field in fields:
+            candidates = query.where.candidate_paths(field, self.index)
+            if candidates is None:
+                continue
+            access_path = INDEX_ACCESS_PATHS[field]
+            narrowed = [x for x in day_paths if x in candidates]
+            estimates[access_path] = len(narrowed)
+            if len(narrowed) < len(best_day_paths):
+                best_path, best_day_paths = access_path, narrowed
+
+        return Plan(query, best_path, best_day_paths, estimates)
+
+    def _get_index_fields(self, query):
+        index_keys = query.where.index_keys()
+        return [x for x in self.index.FIELDS + self.index.SORTED_FIELDS
+                if x in index_keys]
+
+    def _narrow(self, query, day_paths, fields):
+        """
+        Yields the day paths which may contain facts matching given query.
+        Unlike :meth:`plan`, the index is refreshed one file at a time in
+        scan order, so a scan stopped early does not touch the rest of the
+        range.
+        """
+        for day_path in day_paths:
+            self.index.refresh([day_path])
+            if self.index.may_contain(query.where, day_path, fields):
+                yield day_path
+
+    def _iter_day_paths(self, query, reverse=False):
+        day_paths = list(self._collect_day_paths(since=query.since,
+                                                 until=query.until))
+        if reverse:
+            day_paths = reversed(day_paths)
+        fields = self._get_index_fields(query)
+        if fields:
+            return self._narrow(query, day_paths, fields)
+        return day_paths
+
+    def execute(self, query, hint_reverse=False, fields=None,
+                hint_limit=None):
+        """
+        Returns a generator that yields facts matching given query.  If
+        `fields` is given, :class:`~timetra.diary.models.FactProjection`
+        objects with only these fields are yielded instead of facts.
+
+        If `hint_limit` is given (the caller takes at most this many facts),
+        the scan is serial, so that it stops early.
+        """
+        day_paths = self._iter_day_paths(query, hint_reverse)
+        if fields is None:
+            return self._scan_facts(query, day_paths, hint_reverse,
+                                    hint_limit)
+        return self._scan_projections(query, day_paths, hint_reverse, fields,
+                                      hint_limit)
+
+    def _scan_facts(self, query, day_paths, reverse, limit=None):
+        # parallel scans read the whole range
+        if self.parallel and limit is None:
+            day_paths = list(day_paths)
+            if len(split_day_paths(day_paths, self.split_by)) > 1:
+                return parallel_scan(query, day_paths, reverse,
+                                     workers=self.workers,
+                                     split_by=self.split_by,
+                                     loader=self.cache.loader,
+                                     cache=self.cache)
+        return self._scan_facts_serial(query, day_paths, reverse)
+
+    def _scan_facts_serial(self, query, day_paths, reverse):
+        match = query.match
+        if self.prefetch:
+            loaded = prefetch(self.get_cached_day_file, day_paths,
+                              self.prefetch)
+        else:
+            loaded = (self.get_cached_day_file(x) for x in day_paths)
+        try:
+            for day_facts in loaded:
+                if reverse:
+                    day_facts = reversed(day_facts)
+                for fact in day_facts:
+                    if match(fact):
+                        yield fact
+        finally:
+            # stops the read-ahead thread if the caller is done early
+            loaded.close()
+
+    def _scan_projections(self, query, day_paths, reverse, fields,
+                          limit=None):
+        eager = [x for x in fields if x in indexing.ROW_FIELDS]
+        lazy = [x for x in fields if x not in indexing.ROW_FIELDS]
+
+        if not query.where.keys() <= set(indexing.ROW_FIELDS):
+            # the predicate needs fields which are not in the index
+            for fact in self._scan_facts(query, day_paths, reverse, limit):
+                yield models.FactProjection((k, fact.get(k)) for k in fields)
+            return
+
+        for day_path, pos, record in self._scan_index(query, day_paths,
+                                                      reverse):
+            loader = functools.partial(self._load_fact, day_path, pos)
+            yield models.FactProjection(((k, record[k]) for k in eager),
+                                        lazy=lazy, loader=loader)
+
+    def _scan_index(self, query, day_paths, reverse):
+        """
+        Yields `(day_path, position, record)` for index records matching
+        given query.  The query must only refer to indexed fields.
+        """
+        match = query.match
+        for day_path in day_paths:
+            self.index.refresh([day_path])
+            records = self.index.get(day_path).records()
+            positions = range(len(records))
+            if reverse:
+                positions = reversed(positions)
+            for pos in positions:
+                if match(records[pos]):
+                    yield day_path, pos, records[pos]
+
+    def _scan_records(self, query, limit=None):
+        """
+        Yields dictionaries with (at least) the indexed fields of facts
+        matching given query.  Day files are only loaded if the predicate
+        refers to fields which are not indexed.
+        """
+        day_paths = self._iter_day_paths(query)
+        if not query.where.keys() <= set(indexing.ROW_FIELDS):
+            return self._scan_facts(query, day_paths, False, limit)
+        return (x[2] for x in self._scan_index(query, day_paths, False))
+
+    def _load_fact(self, day_path, pos):
+        return self.get_cached_day_file(day_path)[pos]
+
     def collect_facts(self, since=None, until=None, filters=None,
                       hint_reverse=False):
-        day_paths = self._collect_day_paths(since=since, until=until)
-        if hint_reverse:
-            # optimization hint
-            day_paths = reversed(list(day_paths))
-        for day_path in day_paths:
-            day_facts = self.get_cached_day_file(day_path)
-            if hint_reverse:
-                day_facts = reversed(day_facts)
-            for fact in day_facts:
-                if self._is_fact_matching(fact, filters):
-                    yield fact
+        query = Query(since=since, until=until, filters=filters)
+        return self.execute(query, hint_reverse=hint_reverse)
 
     def get_file_path_for_day(self, date):
         return os.path.join(
@@ -219,36 +454,44 @@ class YamlBackend:
     def _load_from_file(self, file_path):
         if os.path.exists(file_path):
             with open(file_path) as f:
-                return yaml.load(f)
+                return yaml.load(f, Loader=DayFileLoader)
         return []
 
-    def _dump_to_file(self, file_path, facts, create=False):
+    def _dump_to_file(self, file_path, facts, create=False, loaded=()):
         if not os.path.exists(file_path):
             # make sure the year and month dirs are created
             month_dir = os.path.dirname(file_path)
             if not os.path.exists(month_dir):
                 os.makedirs(month_dir)
 
-        fact_ods = []
+        # facts loaded from the file are known to be valid in trusted mode
+        skipped = set(map(id, loaded)) if self.trusted else set()
         for fact in facts:
-            # insert defaults
-            monk.merge_defaults(models.Fact.structure, fact)
+            if id(fact) not in skipped:
+                # validate structure and types
+                validate_fact(fact)
 
-            # validate structure and types
-            monk.validate(models.Fact.structure, fact)
-
-            # ensure field order and stuff
-            fact_od = _prepare_fact_for_yaml(fact)
-
-            fact_ods.append(fact_od)
+        # the specialized emitter produces the same output as `yaml.dump`
+        # much faster but does not support unusual values
+        text = emit_facts(facts)
 
         with open(file_path, 'w') as f:
-            yaml.dump(fact_ods, f, allow_unicode=True, default_flow_style=False)
+            if text is not None:
+                f.write(text)
+            else:
+                # ensure field order and stuff
+                fact_ods = [_prepare_fact_for_yaml(x) for x in facts]
+                yaml.dump(fact_ods, f, allow_unicode=True,
+                          default_flow_style=False)
+
+        # the watcher may report the change after it is read
+        self.cache.mark_dirty(file_path)
 
     def add(self, fact):
         # we expect the `fact` dictionary to be already validated
         file_path = self.get_file_path_for_day(fact['since'])
-        facts = list(self._load_from_file(file_path) or [])
+        loaded = self._load_from_file(file_path) or []
+        facts = list(loaded)
 
         for i, other in enumerate(facts):
             if fact['since'] < other['since']:
@@ -257,7 +500,8 @@ class YamlBackend:
         else:
             facts.append(fact)
 
-        self._dump_to_file(file_path, facts, create=True)
+        self._dump_to_file(file_path, facts, create=True, loaded=loaded)
+        self.index.refresh([file_path])
 
         return file_path
 
@@ -281,7 +525,8 @@ class YamlBackend:
         else:
             raise FactNotFound('{} {}'.format(since, activity))
 
-        self._dump_to_file(file_path, facts, create=False)
+        self._dump_to_file(file_path, facts, create=False, loaded=facts)
+        self.index.refresh([file_path])
 
     def update(self, old_fact, kwargs):
         # make sure it exists
@@ -306,17 +551,96 @@ class YamlBackend:
         self.add(new_fact)
 
     def get_latest(self):
-        return self.collect_facts(hint_reverse=True).__next__()
+        return self.execute(Query(), hint_reverse=True,
+                            hint_limit=1).__next__()
+
+    def _make_query(self, **criteria):
+        return make_query(**criteria)
 
-    def find(self, since=None, until=None, activity=None, description=None, tag=None):
+    def find(self, limit=None, offset=0, reverse=False, fields=None,
+             **criteria):
+        """
+        Returns a generator that yields matching facts in chronological order
+        (or newest first if `reverse` is true).  Day files are read lazily, so
+        with `limit` the scan stops as soon as enough facts are collected.
+
+        If `fields` is given, lightweight records with only these fields are
+        yielded.  They are served from the index when possible; other fields
+        (e.g. `description`) are loaded on first access.
+        """
+        query = self._make_query(**criteria)
+        stop = None if limit is None else offset + limit
+        facts = self.execute(query, hint_reverse=reverse, fields=fields,
+                             hint_limit=stop)
+        if limit is None and not offset:
+            return facts
+        return _slice(facts, offset, stop)
+
+    def explain(self, **criteria):
+        return self.plan(self._make_query(**criteria)).explain()
+
+    def _iter_day_totals(self, query):
+        for day_path in self.plan(query).day_paths:
+            self.index.refresh([day_path])
+            yield self.index.get(day_path)
+
+    def count(self, group_by=None, **criteria):
+        query = self._make_query(**criteria)
+        unfiltered = isinstance(query.where, Everything)
+
+        if group_by is None:
+            if unfiltered:
+                return sum(x.count for x in self._iter_day_totals(query))
+            return sum(1 for x in self._scan_records(query))
+
+        counts = {}
+        if unfiltered and group_by == 'activity':
+            for day_index in self._iter_day_totals(query):
+                for activity, (cnt, _) in day_index.totals.items():
+                    counts[activity] = counts.get(activity, 0) + cnt
+                for activity, _ in day_index.unfinished:
+                    counts[activity] = counts.get(activity, 0) + 1
+            return counts
+        for record in self._scan_records(query):
+            value = record.get(group_by)
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def total_duration(self, **criteria):
+        query = self._make_query(**criteria)
+        now = datetime.datetime.now()
+        seconds = 0
+        if isinstance(query.where, Everything):
+            for day_index in self._iter_day_totals(query):
+                seconds += sum(x[1] for x in day_index.totals.values())
+                seconds += sum((now - since).total_seconds()
+                               for _, since in day_index.unfinished)
+        else:
+            for record in self._scan_records(query):
+                until = record.get('until') or now
+                seconds += (until - record['since']).total_seconds()
+        return datetime.timedelta(seconds=seconds)
+
+    def exists(self, **criteria):
+        query = self._make_query(**criteria)
+        for _ in self._scan_records(query, limit=1):
+            return True
+        return False
+
+    def get_rollups(self, period, since=None, until=None, activity=None,
+                    category=None, tag=None):
+        # every day of the periods in range contributes to the buckets
+        self.index.refresh(self._collect_day_paths(
+            *rollups.get_source_range(period, since, until)))
         filters = {}
         if activity:
             filters['activity'] = activity
-        if description:
-            filters['description'] = description
-        if tag:
-            filters['tags'] = tag
-        return self.collect_facts(since=since, until=until, filters=filters)
+        if category:
+            filters['category'] = category
+        match = compile_filters(filters).compile() if filters else None
+        with self.index.lock:
+            return self.index.rollups.query(period, since=since, until=until,
+                                            match=match, tag=tag)
 
 
 class Storage:
@@ -324,6 +648,51 @@ class Storage:
 
     def __init__(self, backend):
         self.backend = backend
+        # see `timetra.diary.changes`
+        self.changes = changes.ChangeFeed()
+        # `{day_path: mtime}` as of the last `check_for_changes()`
+        self._mtimes = None
+
+    def subscribe(self, callback):
+        """
+        Calls `callback(change)` with a :class:`~timetra.diary.changes.Change`
+        for each change made through this object or detected by
+        :meth:`check_for_changes`.  Returns a function that cancels the
+        subscription.
+        """
+        return self.changes.subscribe(callback)
+
+    def check_for_changes(self):
+        """
+        Detects day files modified, created or removed by other means than
+        this object (e.g. in a text editor) since the previous call, and
+        publishes a ``modify`` change for each of them.  The first call only
+        remembers the current state.  Returns the list of published changes.
+
+        Only backends with a `get_day_file_mtimes()` method support this.
+        """
+        get_mtimes = getattr(self.backend, 'get_day_file_mtimes', None)
+        if get_mtimes is None:
+            return []
+        mtimes = get_mtimes()
+        previous, self._mtimes = self._mtimes, mtimes
+        if previous is None:
+            return []
+        paths = sorted(set(mtimes) | set(previous))
+        return [self.changes.publish(changes.MODIFY, path=x) for x in paths
+                if mtimes.get(x) != previous.get(x)]
+
+    def _publish(self, kind, fact, previous=None, path=None):
+        dates = [x.date() for x in (fact['since'],
+                                    previous and previous['since']) if x]
+        if path is None and hasattr(self.backend, 'get_file_path_for_day'):
+            path = self.backend.get_file_path_for_day(dates[0])
+        if self._mtimes is not None:
+            # own writes are not external changes
+            for date in dates:
+                self._mtimes.update(self.backend.get_day_file_mtimes(
+                    since=date, until=date))
+        self.changes.publish(kind, fact=fact, previous=previous, path=path)
 
     def get(self, date_time):
         return self.backend.get(date_time)
@@ -332,9 +701,90 @@ class Storage:
         return self.backend.get_latest()
 
     def find(self, since=None, until=None, activity=None, description=None,
-             tag=None):
+             tag=None, limit=None, offset=0, reverse=False, fields=None,
+             **criteria):
+        """
+        Returns a generator that yields facts matching given criteria.  Facts
+        are read-only :class:`~timetra.diary.models.FactRecord` objects; use
+        their `to_fact()` method to get an editable copy.
+
+        :param starts_after:
+            `datetime.time`; only facts started at this time or later.
+        :param starts_before:
+            `datetime.time`; only facts started before this time.  If earlier
+            than `starts_after`, the window wraps around midnight.
+        :param weekdays: a list of weekdays (0 is Monday, 6 is Sunday)
+        :param min_duration: `datetime.timedelta`
+        :param max_duration: `datetime.timedelta`
+        :param limit: maximum number of facts to yield
+        :param offset: number of matching facts to skip
+        :param reverse: yield newest facts first
+        :param fields:
+            a list of field names; if given, lightweight records with only
+            these fields are yielded instead of complete facts.
+        """
         return self.backend.find(since=since, until=until, activity=activity,
-                                 description=description, tag=tag)
+                                 description=description, tag=tag,
+                                 limit=limit, offset=offset, reverse=reverse,
+                                 fields=fields, **criteria)
+
+    def explain(self, **criteria):
+        """
+        Returns a human-readable description of how `find()` with given
+        criteria would be executed by the backend.
+        """
+        return self.backend.explain(**criteria)
+
+    def count(self, group_by=None, **criteria):
+        """
+        Returns the number of facts matching given criteria (same as in
+        `find()`).  If `group_by` is a field name, returns a dictionary with
+        field values as keys and numbers of facts as values.
+        """
+        return self.backend.count(group_by=group_by, **criteria)
+
+    def total_duration(self, **criteria):
+        """
+        Returns the total duration (`datetime.timedelta`) of facts matching
+        given criteria (same as in `find()`).  Unfinished facts are counted
+        up to current time.
+        """
+        return self.backend.total_duration(**criteria)
+
+    def exists(self, **criteria):
+        """
+        Returns `True` if at least one fact matches given criteria (same as
+        in `find()`).
+        """
+        return self.backend.exists(**criteria)
+
+    def get_rollups(self, period, since=None, until=None, activity=None,
+                    category=None, tag=None):
+        """
+        Returns a list of :class:`~timetra.diary.rollups.Rollup` objects
+        (total duration and number of finished facts) for each period between
+        `since` and `until`.
+
+        :param period: one of "hour", "day", "week" and "month".
+        :param activity: activity pattern (same syntax as in `find()`).
+        :param category: category pattern (same syntax as in `find()`).
+        :param tag: exact tag name; if omitted, facts are not filtered by tags.
+        """
+        return self.backend.get_rollups(period, since=since, until=until,
+                                        activity=activity, category=category,
+                                        tag=tag)
+
+    def to_frame(self, since=None, until=None, **criteria):
+        """
+        Returns a :class:`~timetra.diary.frame.FactFrame` with the facts
+        matching given criteria (same as in `find()`).  Unfinished facts are
+        treated as lasting until now.
+        """
+        if hasattr(self.backend, 'to_frame'):
+            return self.backend.to_frame(since=since, until=until, **criteria)
+        records = self.find(since=since, until=until,
+                            fields=FactFrame.FIELDS, **criteria)
+        return FactFrame.from_records(records)
 
     def find_overlapping_facts(self, since, until, days_before=1):
         """
@@ -387,12 +837,17 @@ class Storage:
         #    # TODO: check overlap
         #    raise FactsInConflict('another fact starts with this date and time')
         #self.backend[fact.since] = fact
-        return self.backend.add(fact)
+        result = self.backend.add(fact)
+        self._publish(changes.ADD, fact)
+        return result
 
     def update(self, fact, values):
         assert fact
         assert values
-        return self.backend.update(fact, values)
+        result = self.backend.update(fact, values)
+        self._publish(changes.UPDATE, models.Fact(fact, **values),
+                      previous=fact)
+        return result
 
     def delete(self, spec):
         assert spec.since, spec.activity
@@ -400,6 +855,7 @@ class Storage:
         assert fact
         assert fact.activity == spec.activity
         self.backend.delete(since=fact.since, activity=fact.activity)
+        self._publish(changes.DELETE, fact)
 
     def resolve_activity(self, mask):
         """Given a mask, finds the (single) matching activity and returns its full
@@ -409,7 +865,7 @@ class Storage:
         :return: {'category': CATEGORY, 'activity': ACTIVITY}
         """
         seen = {}
-        for fact in self.find():
+        for fact in self.find(fields=('activity', 'category')):
             pair = fact.activity, fact.category
             seen[pair] = seen.get(pair, 0) + 1
 
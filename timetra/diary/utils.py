@@ -170,6 +170,26 @@ def parse_delta(string):
     return timedelta(hours=hours, minutes=minutes)
 
 
+WEEKDAY_NAMES = ('mo', 'tu', 'we', 'th', 'fr', 'sa', 'su')
+
+
+def parse_weekdays(string):
+    """ Returns a list of weekday numbers (0 is Monday) for given
+    comma-separated list of two-letter names::
+
+        >>> parse_weekdays('sa,su')
+        [5, 6]
+
+    """
+    days = []
+    for name in string.split(','):
+        name = name.strip().lower()[:2]
+        if name not in WEEKDAY_NAMES:
+            raise ValueError('unknown weekday "{0}"'.format(name))
+        days.append(WEEKDAY_NAMES.index(name))
+    return days
+
+
 def extract_date_time_bounds(spec):
     spec = spec.strip()
     rx_time = r'[0-9]{0,2}:?[0-9]{1,2}'
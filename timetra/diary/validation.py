@@ -0,0 +1,174 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Validation
+==========
+
+Compiles a `monk` dictionary schema into a plain Python function that only
+answers "valid or not".  Valid documents (the common case) are checked
+without walking the validator tree; for invalid ones `monk.validate` is
+called to raise the usual error with the usual message.
+
+Validators the compiler does not know are called as is, so the result is
+always the same as with `monk.validate`.
+"""
+import monk
+from monk.validators import (Any, DictOf, Equals, Exists, IsA, ListOfAll,
+                             MISSING, ValidationError)
+
+from . import models
+
+
+__all__ = ['CompiledValidator', 'validate_fact']
+
+
+class _Compiler(object):
+
+    def __init__(self):
+        self.namespace = {'MISSING': MISSING}
+
+    def _bind(self, value):
+        name = '_c{0}'.format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def _fallback(self, validator, var):
+        name = self._bind(validator)
+        return '_passes({0}, {1})'.format(name, var)
+
+    def expression(self, validator, var, depth=0):
+        """
+        Returns a Python expression which is true if the value of variable
+        `var` passes given validator.
+        """
+        negated = getattr(validator, 'negated', False)
+        kind = type(validator)
+        if kind is Exists:
+            return '{0} {1} MISSING'.format(var, 'is' if negated else 'is not')
+        if negated:
+            return self._fallback(validator, var)
+        if kind is IsA:
+            return 'isinstance({0}, {1})'.format(
+                var, self._bind(validator.expected_type))
+        if kind is Equals:
+            if validator._expected_value is None:
+                return '{0} is None'.format(var)
+            return 'not ({0} != {1})'.format(
+                self._bind(validator._expected_value), var)
+        if kind is Any:
+            return '({0})'.format(' or '.join(
+                self.expression(x, var, depth) for x in validator._specs))
+        if kind is ListOfAll:
+            nested = validator._nested_validator
+            item = '_item{0}'.format(depth)
+            check = ('isinstance({var}, list) and '
+                     'all({expr} for {item} in {var})').format(
+                         var=var, item=item,
+                         expr=self.expression(nested, item, depth + 1))
+            if not _passes(nested, MISSING):
+                # an empty list lacks items
+                check = '{0} and {1}'.format(var, check)
+            return '({0})'.format(check)
+        return self._fallback(validator, var)
+
+    def function(self, validator):
+        "Returns the source of `check(value)` for a `DictOf` validator."
+        lines = ['def check(value):',
+                 '    if not isinstance(value, dict):',
+                 '        return False',
+                 '    matched = 0']
+        for key_validator, value_validator in validator._pairs:
+            key, required = _get_key(key_validator)
+            key = self._bind(key)
+            condition = self.expression(value_validator, 'item')
+            if required:
+                lines.append('    if {0} not in value:'.format(key))
+                lines.append('        return False')
+                indent = '    '
+            else:
+                lines.append('    if {0} in value:'.format(key))
+                indent = '        '
+            lines.extend([
+                indent + 'item = value[{0}]'.format(key),
+                indent + 'if not {0}:'.format(condition),
+                indent + '    return False',
+                indent + 'matched += 1',
+            ])
+        # unknown keys are not allowed
+        lines.append('    return matched == len(value)')
+        return '\n'.join(lines)
+
+
+def _passes(validator, value):
+    try:
+        validator(value)
+    except (ValidationError, TypeError):
+        return False
+    return True
+
+
+def _get_key(key_validator):
+    """
+    Returns `(key, required)` for a key validator: `Equals(key)` or
+    `Equals(key) | ~Exists()`.
+    """
+    if type(key_validator) is Equals and not key_validator.negated:
+        return key_validator._expected_value, True
+    if type(key_validator) is Any and not key_validator.negated:
+        specs = key_validator._specs
+        if (len(specs) == 2 and type(specs[0]) is Equals
+                and not specs[0].negated and type(specs[1]) is Exists
+                and specs[1].negated):
+            return specs[0]._expected_value, False
+    raise NotImplementedError('cannot compile key {0!r}'.format(key_validator))
+
+
+def compile_schema(schema):
+    """
+    Returns a function that takes a value and returns `True` if it is valid
+    according to given dictionary schema.
+    """
+    validator = monk.translate(schema)
+    if type(validator) is not DictOf:
+        raise NotImplementedError('only dictionary schemata are supported')
+    compiler = _Compiler()
+    source = compiler.function(validator)
+    namespace = dict(compiler.namespace, _passes=_passes)
+    exec(compile(source, '<validator>', 'exec'), namespace)
+    return namespace['check']
+
+
+class CompiledValidator(object):
+    """
+    A drop-in replacement for `monk.validate(schema, value)`.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.check = compile_schema(schema)
+
+    def __call__(self, value):
+        if not self.check(value):
+            # let monk find the problem and describe it
+            monk.validate(self.schema, value)
+
+
+validate_fact = CompiledValidator(models.fact_schema)
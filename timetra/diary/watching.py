@@ -0,0 +1,303 @@
+# coding: utf-8
+#
+#    Timetra is a time tracking application and library.
+#    Copyright © 2010-2014  Andrey Mikhaylenko
+#
+#    This file is part of Timetra.
+#
+#    Timetra is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Timetra is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with Timetra.  If not, see <http://gnu.org/licenses/>.
+#
+"""
+Watching
+========
+
+Watches the data directory (the year/month tree of day files) and calls
+`callback(path)` for each changed, created or removed file.  `path` is
+`None` if the watcher lost track of changes (all files must be considered
+changed).
+
+:class:`InotifyWatcher` uses Linux `inotify` through `ctypes`.  Its thread
+reports changes shortly after they happen; `sync()` reports the pending ones
+at once, so a reader which calls it first sees every change made before.
+:class:`PollingWatcher` is the fallback for other systems: it compares
+modification times every few seconds.
+
+Usage::
+
+    watcher = make_watcher(data_dir, cache.mark_dirty)
+    watcher.start()
+    ...
+    watcher.sync()      # before answering a read
+    ...
+    watcher.stop()
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+
+
+__all__ = ['InotifyWatcher', 'PollingWatcher', 'make_watcher']
+
+
+log = logging.getLogger(__name__)
+
+
+POLL_INTERVAL = 0.1
+""" How often (in seconds) the inotify thread checks whether it was stopped.
+"""
+
+# see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct('=iIII')
+
+
+def _load_libc():
+    name = ctypes.util.find_library('c')
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    return libc
+
+
+_libc = _load_libc()
+
+
+class InotifyWatcher(object):
+    """
+    Reports changes shortly after they happen (the callback is called from a
+    background thread), or at once on `sync()`.
+    """
+    # changes made before `sync()` are reported by the time it returns
+    instant = True
+
+    def __init__(self, root, callback):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.root = root
+        self.callback = callback
+        self._fd = None
+        # `{watch descriptor: directory path}`
+        self._dirs = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        # events are handled either by the thread or by `sync()`
+        self._lock = threading.Lock()
+
+    def start(self):
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._fd = fd
+        self._watch_tree(self.root)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _watch_tree(self, top, report=False):
+        """
+        Watches given directory and its subdirectories.  Files found in
+        them are reported if `report` is true (the directory is new).
+        """
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(top), WATCH_MASK)
+        if wd < 0:
+            log.warning('cannot watch %s: %s', top,
+                        os.strerror(ctypes.get_errno()))
+            return
+        self._dirs[wd] = top
+        # listed after the watch is added: entries created meanwhile are
+        # either listed or reported by inotify (or both)
+        try:
+            entries = list(os.scandir(top))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                self._watch_tree(entry.path, report)
+            elif report:
+                self.callback(entry.path)
+
+    def sync(self):
+        """
+        Reports pending changes in the calling thread.  The kernel queues an
+        event as soon as a file is changed, so when this returns, all changes
+        made before the call have been reported.  Returns `True` if there
+        were any.
+        """
+        with self._lock:
+            if self._fd is None:
+                return False
+            return self._read_events()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            ready, _, _ = select.select([self._fd], [], [], POLL_INTERVAL)
+            if ready:
+                with self._lock:
+                    self._read_events()
+
+    def _read_events(self):
+        "Handles all queued events; returns `True` if there were any."
+        found = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return found
+            found = True
+            try:
+                self._handle(data)
+            except Exception:
+                log.exception('failed to handle inotify events')
+                self.callback(None)
+
+    def _handle(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.callback(None)
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            dir_path = self._dirs.get(wd)
+            if dir_path is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # a whole year or month is gone
+                self.callback(None)
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path, report=True)
+                elif mask & IN_MOVED_FROM:
+                    self.callback(None)
+                continue
+            self.callback(path)
+
+
+class PollingWatcher(object):
+    """
+    Compares modification times of all files every `interval` seconds.
+    Changes may be reported with a delay, so caches must not rely on it.
+    """
+    instant = False
+    INTERVAL = 2
+
+    def __init__(self, root, callback, interval=INTERVAL):
+        self.root = root
+        self.callback = callback
+        self.interval = interval
+        self._mtimes = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._mtimes = self._scan()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sync(self):
+        """
+        Does nothing: changes are only found by `check()`, and caches do not
+        rely on them anyway.
+        """
+        return False
+
+    def _scan(self):
+        mtimes = {}
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                try:
+                    mtimes[path] = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    pass
+        return mtimes
+
+    def check(self):
+        "Compares the files with the previous check and reports changes."
+        mtimes = self._scan()
+        previous, self._mtimes = self._mtimes, mtimes
+        for path in sorted(set(mtimes) | set(previous)):
+            if mtimes.get(path) != previous.get(path):
+                self.callback(path)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                log.exception('failed to check %s', self.root)
+
+
+def make_watcher(root, callback):
+    """
+    Returns an :class:`InotifyWatcher` if `inotify` is available, otherwise
+    a :class:`PollingWatcher`.  The watcher must be started.
+    """
+    if _libc is not None:
+        return InotifyWatcher(root, callback)
+    return PollingWatcher(root, callback)